@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+
+
+"""Off-line benchmarks for the controllers.
+
+They run the controllers against the lightweight sardana and PyTango
+stand-ins in benchmarks/stubs, see benchmarks.standins; the PyTango one
+is backed by the simulated devices of benchmarks.faketango.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+
+"""Wheel travel of dose series planned by macros/dose_series.py.
+
+For random ladders of --points transmissions at random energies, compares
+the wheel travel of moving through the closest achievable values in the
+given order with the travel of the planned series, and reports the time
+planning takes.
+
+Usage:
+    python -m benchmarks.bench_doseplan --points 8 --series 50
+    python -m benchmarks.bench_doseplan --points 20 --tolerance 0.05
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import argparse
+import random
+import sys
+from timeit import default_timer
+
+from benchmarks import standins
+
+standins.install()
+
+from ctrl.pseudomotor.TransmissionController import bcu_index
+from macros.dose_series import plan
+
+
+def ladder(points):
+    """A dose series: log spaced transmissions [%] between 0.1 and 100, shuffled."""
+    top = random.uniform(1, 2)
+    values = [10 ** (top - 3 * i / float(max(points - 1, 1))) for i in range(points)]
+    random.shuffle(values)
+    return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, default=8)
+    parser.add_argument('--series', type=int, default=50)
+    parser.add_argument('--tolerance', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    random.seed(args.seed)
+
+    given_total = planned_total = seconds = 0.0
+    worst = 0.0
+    for _ in range(args.series):
+        values, angles = bcu_index.spectrum(round(random.uniform(6, 20), 3))
+        transmissions = ladder(args.points)
+        start = [0.0, 0.0, 0.0]
+        given = plan(transmissions, values, angles, start, 0.0, keep_order=True)[1]
+        t0 = default_timer()
+        planned = plan(transmissions, values, angles, start, args.tolerance)[1]
+        elapsed = default_timer() - t0
+        given_total += given
+        planned_total += planned
+        seconds += elapsed
+        worst = max(worst, elapsed)
+    print('%d series of %d points, tolerance %g' % (args.series, args.points, args.tolerance))
+    print('wheel travel [deg]  given order %10.0f  planned %10.0f  (%.0f%% less)'
+          % (given_total, planned_total, 100 * (1 - planned_total / given_total)))
+    print('planning [ms]       mean %.2f  worst %.2f' % (seconds / args.series * 1e3, worst * 1e3))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+
+"""Throughput and latency of the motor controllers on simulated devices.
+
+Runs IVUGapAttrMotorController, PI625 and ProxyMotorController unmodified
+against benchmarks.faketango with the given network conditions and
+reports, per controller:
+    - StateOne/ReadOne latency (p50/p99) and calls per second
+    - the time of a full move cycle: StartOne, then StateOne polled until
+      the axis is On again
+and, for a PI625 with --bulk-axes axes, one ReadOne/StartOne per axis
+against a single bulk SendToCtrl command (ctrl.bulk).
+
+Usage:
+    python -m benchmarks.bench_motorctrl --latency 2 --jitter 0.5
+    python -m benchmarks.bench_motorctrl --failure-rate 0.01 --calls 2000
+    python -m benchmarks.bench_motorctrl --bulk-axes 48
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import argparse
+import json
+import logging
+import sys
+from timeit import default_timer
+
+from benchmarks import standins
+
+standins.install()
+
+from sardana import State
+
+from benchmarks import faketango
+
+IVU_GAP = 'r3-311l/id/idivu-01_gap/Gap'
+PIEZO = 'b311a-o/opt/piezo-01'
+MOTOR = 'b311a-o/opt/mir-01-y'
+
+
+def setup_controllers(move_time):
+    """Simulated devices and one single-axis controller of each kind."""
+    load = standins.load_controller
+    faketango.add_attribute(IVU_GAP, 6.0, move_time=move_time)
+    faketango.add_piezo(PIEZO + '/Position', PIEZO + '/on_target', 20.0, move_time)
+    faketango.add_motor(MOTOR, 10.0, speed=2.0 / move_time if move_time else None)
+
+    ivu = load('motor.IVUGapAttrMotorCtrl', 'IVUGapAttrMotorController')
+    ivu.AddDevice(1)
+    ivu.SetAxisExtraPar(1, 'TangoAttribute', IVU_GAP)
+
+    piezo = load('motor.pie625', 'PI625')
+    piezo.AddDevice(1)
+    piezo.SetAxisExtraPar(1, 'TangoAttribute', PIEZO + '/Position')
+    piezo.SetAxisExtraPar(1, 'TangoOnTarget', PIEZO + '/on_target')
+
+    proxy = load('motor.ProxyMotorController', 'ProxyMotorController',
+                 {'MotorName': MOTOR, 'InterlockDevice': ''})
+    proxy.AddDevice(1)
+    # (controller, a target inside its limits, another one)
+    return [(ivu, 7.0, 6.0), (piezo, 25.0, 20.0), (proxy, 12.0, 10.0)]
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def time_calls(func, calls):
+    latencies = []
+    errors = 0
+    start = default_timer()
+    for _ in range(calls):
+        t0 = default_timer()
+        try:
+            func(1)
+        except Exception:
+            errors += 1
+        latencies.append(default_timer() - t0)
+    elapsed = default_timer() - start
+    latencies.sort()
+    return {
+        'p50_ms': _percentile(latencies, 0.50) * 1e3,
+        'p99_ms': _percentile(latencies, 0.99) * 1e3,
+        'calls_per_s': calls / elapsed,
+        'errors': errors,
+    }
+
+
+def time_move(ctrl, target, timeout=60.0):
+    start = default_timer()
+    ctrl.StartOne(1, target)
+    polls = 0
+    while default_timer() - start < timeout:
+        polls += 1
+        # ProxyMotorController passes the Tango DevState through; an
+        # injected failure reads as Alarm and does not end the move
+        if ctrl.StateOne(1)[0] in (State.On, faketango.DevState.ON):
+            break
+    return default_timer() - start, polls
+
+
+def setup_bulk(n_axes, move_time):
+    """A PI625 with n_axes simulated piezo axes."""
+    piezo = standins.load_controller('motor.pie625', 'PI625')
+    for axis in range(1, n_axes + 1):
+        device = '%s-%02d' % (PIEZO, axis)
+        faketango.add_piezo(device + '/Position', device + '/on_target', 20.0, move_time)
+        piezo.AddDevice(axis)
+        piezo.SetAxisExtraPar(axis, 'TangoAttribute', device + '/Position')
+        piezo.SetAxisExtraPar(axis, 'TangoOnTarget', device + '/on_target')
+    return piezo
+
+
+def time_bulk(piezo, n_axes, target):
+    """[(operation, seconds with calls per axis, seconds with bulk commands)]
+
+    A move is timed until every axis is on target again.
+    """
+    axes = range(1, n_axes + 1)
+    start = default_timer()
+    for axis in axes:
+        piezo.ReadOne(axis)
+        piezo.StateOne(axis)
+    per_axis_read = default_timer() - start
+    start = default_timer()
+    json.loads(piezo.SendToCtrl(json.dumps({'cmd': 'read'})))
+    bulk_read = default_timer() - start
+
+    start = default_timer()
+    for axis in axes:
+        piezo.StartOne(axis, target)
+    while any(piezo.StateOne(axis)[0] != State.On for axis in axes):
+        pass
+    per_axis_move = default_timer() - start
+    start = default_timer()
+    json.loads(piezo.SendToCtrl(json.dumps(
+        {'cmd': 'move', 'positions': dict((str(axis), target + 1) for axis in axes)})))
+    read = json.dumps({'cmd': 'read'})
+    while not all(result['on_target'] for result in
+                  json.loads(piezo.SendToCtrl(read))['results'].values()):
+        pass
+    bulk_move = default_timer() - start
+    return [('read', per_axis_read, bulk_read), ('move', per_axis_move, bulk_move)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=1.0, help='per call [ms]')
+    parser.add_argument('--jitter', type=float, default=0.0, help='standard deviation [ms]')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--move-time', type=float, default=0.2, help='simulated move [s]')
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--bulk-axes', type=int, default=24, help='PI625 axes, 0 skips')
+    args = parser.parse_args(argv)
+    # injected failures make the controllers log errors on every call
+    logging.basicConfig(level=logging.CRITICAL)
+
+    faketango.reset()
+    controllers = setup_controllers(args.move_time)
+    bulk = setup_bulk(args.bulk_axes, args.move_time) if args.bulk_axes else None
+    faketango.configure(latency=args.latency / 1e3, jitter=args.jitter / 1e3,
+                        failure_rate=args.failure_rate)
+
+    print('%-28s %-8s %9s %9s %9s %7s' % ('controller', 'method', 'p50 ms', 'p99 ms',
+                                          'calls/s', 'errors'))
+    for ctrl, target, back in controllers:
+        name = type(ctrl).__name__
+        for method in ('StateOne', 'ReadOne'):
+            result = time_calls(getattr(ctrl, method), args.calls)
+            print('%-28s %-8s %9.3f %9.3f %9.1f %7d' % (
+                name, method, result['p50_ms'], result['p99_ms'],
+                result['calls_per_s'], result['errors']))
+        for position in (target, back):
+            elapsed, polls = time_move(ctrl, position)
+            print('%-28s %-8s %9.3f s  (%d state polls)' % (name, 'move', elapsed, polls))
+    if bulk is not None:
+        print('\nPI625, %d axes %20s %12s' % (args.bulk_axes, 'per axis [s]', 'bulk [s]'))
+        for operation, per_axis, in_bulk in time_bulk(bulk, args.bulk_axes, 25.0):
+            print('%-28s %-8s %9.3f %12.3f' % ('', operation, per_axis, in_bulk))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+
+"""End-to-end move time of realistic scan sequences on simulated motors.
+
+The pseudo motor chains of the beamline run on SimMotorController axes
+with realistic kinematics, through the Pool-free harness:
+
+    energy   BeamlineEnergy -> Energy (mono_bragg, mono_x2per)
+                            -> IVUEnergy (ivu_gap)
+                            -> MirrorStripChooser (hfm_y, vfm_x1, vfm_x2,
+                                                   piezo_hfm, piezo_vfm)
+    detector DetectorTableVertical (tab2_z, tab2_y1, tab2_y2)
+    table    AlignmentTableVertical (tab1_y1, tab1_y2)
+
+Every scenario reports the simulated time it took, the StartOne calls the
+Pool issued and the motions the motors actually made, so changes to
+deadbands, point ordering or the strip selection can be compared before
+they go to the beamline.
+
+Usage:
+    python -m benchmarks.bench_movetime
+    python -m benchmarks.bench_movetime --deadband 0.001 --time-scale 50
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import argparse
+import logging
+import sys
+from timeit import default_timer
+
+from benchmarks import standins
+
+standins.install()
+
+from benchmarks import faketango
+from benchmarks.poolfree import Pool, ivu_table
+
+# name: (velocity, acceleration time, backlash, settle time)
+AXES = [
+    ('mono_bragg', (0.5, 0.25, 0.01, 0.5)),
+    ('mono_x2per', (0.5, 0.25, 0.0, 0.2)),
+    ('ivu_gap', (0.2, 0.4, 0.0, 1.0)),
+    ('hfm_y', (0.5, 0.5, 0.0, 0.5)),
+    ('vfm_x1', (0.5, 0.5, 0.0, 0.5)),
+    ('vfm_x2', (0.5, 0.5, 0.0, 0.5)),
+    ('piezo_hfm_fpit', (100.0, 0.1, 0.0, 0.05)),
+    ('piezo_vfm_fpit', (100.0, 0.1, 0.0, 0.05)),
+    ('tab2_z', (5.0, 0.5, 0.05, 0.3)),
+    ('tab2_y1', (2.0, 0.4, 0.05, 0.3)),
+    ('tab2_y2', (2.0, 0.4, 0.05, 0.3)),
+    ('tab1_y1', (1.0, 0.2, 0.0, 0.2)),
+    ('tab1_y2', (1.0, 0.2, 0.0, 0.2)),
+]
+
+SCENARIOS = [
+    # Se K edge MAD scan, 2 eV steps
+    ('mad edge scan', 'energy', [12640.0 + 2 * i for i in range(31)]),
+    # multi-wavelength collection crossing the 8 keV strip boundary
+    ('multi-wavelength', 'energy', [7000.0, 12658.0, 9000.0, 13000.0, 7500.0, 12000.0]),
+    # the same energy re-issued, e.g. by a macro at every data set
+    ('re-issued energy', 'energy', [12700.0] * 10),
+    ('detector distance series', 'distance', [150.0 + 50 * i for i in range(10)]),
+    ('table height steps', 'pos_y', [0.1 * i for i in range(20)]),
+]
+
+
+def build(time_scale, poll_period, deadband):
+    load = standins.load_controller
+    sim = load('motor.SimMotorController', 'SimMotorController', {'TimeScale': time_scale})
+    pool = Pool(poll_period, sim.now, time_scale)
+    physicals = {}
+    for axis, (name, (velocity, acceleration, backlash, settle)) in enumerate(AXES, 1):
+        sim.AddDevice(axis)
+        sim.SetPar(axis, 'velocity', velocity)
+        sim.SetPar(axis, 'acceleration', acceleration)
+        sim.SetPar(axis, 'deceleration', acceleration)
+        sim.SetPar(axis, 'backlash', backlash)
+        sim.SetAxisExtraPar(axis, 'SettleTime', settle)
+        sim.SetAxisExtraPar(axis, 'Deadband', deadband)
+        physicals[name] = pool.physical(name, sim, axis)
+        faketango.set_value(name + '/PowerOn', True)
+
+    energy_ctrl = load('pseudomotor.EnergyController', 'Energy',
+                       {'bragg_deadband': deadband, 'x2per_deadband': deadband})
+    energies, gaps = ivu_table()
+    ivu_ctrl = load('pseudomotor.IVUEnergyController', 'IVUEnergy',
+                    {'energy_array': energies, 'position_array': gaps,
+                     'gap_deadband': deadband})
+    strip_ctrl = load('pseudomotor.BeamlineEnergy', 'MirrorStripChooser')
+    mono, = pool.pseudo(energy_ctrl, [physicals['mono_bragg'], physicals['mono_x2per']])
+    ivu, = pool.pseudo(ivu_ctrl, [physicals['ivu_gap']])
+    strip, = pool.pseudo(strip_ctrl, [physicals[name] for name in (
+        'hfm_y', 'vfm_x1', 'vfm_x2', 'piezo_hfm_fpit', 'piezo_vfm_fpit')])
+    energy, = pool.pseudo(load('pseudomotor.BeamlineEnergy', 'BeamlineEnergy'),
+                          [mono, ivu, strip])
+    distance, angle = pool.pseudo(load('pseudomotor.DetectorTableVertical', 'DetectorTableVertical'),
+                                  [physicals[name] for name in ('tab2_z', 'tab2_y1', 'tab2_y2')])
+    pos_y, pitch = pool.pseudo(load('pseudomotor.AlignmentTableController', 'AlignmentTableVertical'),
+                               [physicals['tab1_y1'], physicals['tab1_y2']])
+
+    # DetectorTableVertical cannot invert a table at z = 0
+    sim.axes[physicals['tab2_z'].axis].position = 223.0
+    pool.teleport([(energy, 12700.0), (distance, 150.0), (pos_y, 0.0)])
+    return sim, pool, {'energy': energy, 'distance': distance, 'pos_y': pos_y}
+
+
+def run_scenario(sim, pool, element, points):
+    moves_before = sum(axis.moves for axis in sim.axes.values())
+    starts_before = pool.start_calls
+    wall = default_timer()
+    simulated = 0.0
+    for point in points:
+        simulated += pool.move([(element, point)])
+    return {
+        'points': len(points),
+        'simulated_s': simulated,
+        'per_point_s': simulated / len(points),
+        'start_calls': pool.start_calls - starts_before,
+        'motions': sum(axis.moves for axis in sim.axes.values()) - moves_before,
+        'wall_s': default_timer() - wall,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--time-scale', type=float, default=20.0,
+                        help='simulated seconds per wall clock second')
+    parser.add_argument('--poll', type=float, default=0.05,
+                        help='Pool state poll period [simulated s]')
+    parser.add_argument('--deadband', type=float, default=0.0,
+                        help='deadband of every axis and energy pseudo motor')
+    parser.add_argument('--scenario', help='only run scenarios containing this')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    faketango.reset()
+    sim, pool, elements = build(args.time_scale, args.poll, args.deadband)
+    print('%-26s %6s %11s %11s %7s %8s' % ('scenario', 'points', 'total s', 'per point s',
+                                           'starts', 'motions'))
+    for name, element, points in SCENARIOS:
+        if args.scenario and args.scenario not in name:
+            continue
+        result = run_scenario(sim, pool, elements[element], points)
+        print('%-26s %6d %11.2f %11.2f %7d %8d' % (
+            name, result['points'], result['simulated_s'], result['per_point_s'],
+            result['start_calls'], result['motions']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+
+
+"""Micro-benchmarks of CalcAllPhysical/CalcAllPseudo of every pseudo motor
+controller in ctrl/pseudomotor, run against the sardana/PyTango stand-ins.
+
+Each case is timed in two modes:
+    scalar - every call timed on its own: p50/p99/mean latency per call
+    batch  - the whole sample set timed as one block: mean cost per call
+             without the timer overhead, best of the repeats
+
+The inputs are drawn (with a fixed seed) from the ranges the beamline
+actually uses, e.g. 5.5-19.5 keV, transmissions log-uniform in 0.01-100 %.
+
+Usage:
+    python -m benchmarks.bench_pseudomotor --save baseline.json
+    python -m benchmarks.bench_pseudomotor --compare baseline.json
+    python -m benchmarks.bench_pseudomotor --filter Transmission
+
+With --compare, every case whose batch time per call got slower than the
+baseline by more than --threshold (default 20 %) and by at least
+--min-diff microseconds (default 0.5) is reported and the exit status is
+1. The scalar times are shown but not compared: a single call is close
+to the resolution of the Python 2 timers, and their noise alone would
+flag regressions.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from timeit import default_timer
+
+from benchmarks import standins
+
+standins.install()
+
+import PyTango
+
+from benchmarks.poolfree import ivu_table
+
+MONO_ENERGY = 'b311a-o/opt/mono-ener/Position'
+
+STRIP_POSITIONS = {
+    'Si': (-1.5, 2.95, 3.05, 21.05, 19.2),
+    'Rh': (10.5, -5.05, -4.95, 16.85, 29.2),
+}
+
+
+class Case(object):
+    """One controller method and the argument tuples to call it with."""
+
+    def __init__(self, name, func, argsets, before=None):
+        self.name = name
+        self.func = func
+        self.argsets = argsets
+        # called with the sample index before each call, e.g. to change
+        # the mono energy the stand-in returns
+        self.before = before
+
+
+def _pairs(ctrl, pseudos, physicals):
+    """The two cases of a controller from matching pseudo/physical samples."""
+    name = type(ctrl).__name__
+    return [
+        Case(name + '.CalcAllPhysical', ctrl.CalcAllPhysical, list(zip(pseudos, physicals))),
+        Case(name + '.CalcAllPseudo', ctrl.CalcAllPseudo, list(zip(physicals, pseudos))),
+    ]
+
+
+def _uniform(rng, n, *ranges):
+    return [tuple(rng.uniform(low, high) for low, high in ranges) for _ in range(n)]
+
+
+def _forward(ctrl, pseudos):
+    return [tuple(ctrl.CalcAllPhysical(p, (0.0,) * len(ctrl.motor_roles))) for p in pseudos]
+
+
+def build_cases(n, seed=0):
+    load = standins.load_controller
+    rng = random.Random(seed)
+    cases = []
+
+    for name in ('AlignmentTableVertical', 'AlignmentTableHorizontal'):
+        ctrl = load('pseudomotor.AlignmentTableController', name)
+        pseudos = _uniform(rng, n, (-3, 3), (-0.2, 0.2))
+        cases += _pairs(ctrl, pseudos, _forward(ctrl, pseudos))
+
+    ctrl = load('pseudomotor.DetectorTableVertical', 'DetectorTableVertical')
+    pseudos = _uniform(rng, n, (120, 900), (0.5, 25))
+    cases += _pairs(ctrl, pseudos, _forward(ctrl, pseudos))
+
+    ctrl = load('pseudomotor.HFMController', 'HFMPosition')
+    pseudos = _uniform(rng, n, (-1, 1), (-1, 1))
+    cases += _pairs(ctrl, pseudos, _forward(ctrl, pseudos))
+
+    ctrl = load('pseudomotor.SlitController', 'SlitController')
+    pseudos = _uniform(rng, n, (-1, 1), (0.01, 2))
+    cases += _pairs(ctrl, pseudos, _forward(ctrl, pseudos))
+
+    ctrl = load('pseudomotor.VFMController', 'VFMXYaw')
+    pseudos = _uniform(rng, n, (-5, 5), (-0.01, 0.01))
+    cases += _pairs(ctrl, pseudos, _forward(ctrl, pseudos))
+
+    ctrl = load('pseudomotor.VFMController', 'VFMYPitchRoll')
+    pseudos = _uniform(rng, n, (-2, 2), (-0.005, 0.005), (-0.005, 0.005))
+    cases += _pairs(ctrl, pseudos, _forward(ctrl, pseudos))
+
+    ctrl = load('pseudomotor.EnergyController', 'Energy')
+    pseudos = _uniform(rng, n, (5500, 19500))
+    cases += _pairs(ctrl, pseudos, _forward(ctrl, pseudos))
+
+    ctrl = load('pseudomotor.EnergyController', 'Wavelength')
+    pseudos = _uniform(rng, n, (0.64, 2.25))
+    cases += _pairs(ctrl, pseudos, _forward(ctrl, pseudos))
+
+    energies, gaps = ivu_table()
+    ctrl = load('pseudomotor.IVUEnergyController', 'IVUEnergy',
+                {'energy_array': energies, 'position_array': gaps})
+    pseudos = _uniform(rng, n, (5400, 19550))
+    cases += _pairs(ctrl, pseudos, _forward(ctrl, pseudos))
+
+    ctrl = load('pseudomotor.BeamlineEnergy', 'BeamlineEnergy')
+    pseudos = _uniform(rng, n, (5500, 19500))
+    cases += _pairs(ctrl, pseudos, [(e, e, e) for e, in pseudos])
+
+    for role in ('hfm_y', 'vfm_x1', 'vfm_x2'):
+        PyTango.set_value(role + '/PowerOn', True)
+    # Transmission reports for the mono energy
+    PyTango.set_value(MONO_ENERGY, 12700.0)
+    ctrl = load('pseudomotor.BeamlineEnergy', 'MirrorStripChooser')
+    pseudos = _uniform(rng, n, (5500, 19500))
+    physicals = [STRIP_POSITIONS[rng.choice(('Si', 'Rh'))] for _ in range(n)]
+    cases += _pairs(ctrl, pseudos, physicals)
+
+    ctrl = load('pseudomotor.TransmissionController', 'Transmission')
+    pseudos = [(10 ** rng.uniform(-2, 2),) for _ in range(n)]
+    physicals = [tuple(36.0 * rng.randint(0, 9) for _ in range(3)) for _ in range(n)]
+    ctrl.CalcAllPseudo(physicals[0], pseudos[0])  # connects the energy proxy
+    cases += _pairs(ctrl, pseudos, physicals)
+    energies = [round(rng.uniform(5500, 19500), 0) for _ in range(n)]
+
+    def change_energy(i):
+        PyTango.set_value(MONO_ENERGY, energies[i])
+    for case in _pairs(ctrl, pseudos, physicals):
+        case.name += '[energy change]'
+        case.before = change_energy
+        cases.append(case)
+    return cases
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def run_case(case, repeat):
+    func, argsets, before = case.func, case.argsets, case.before
+    # warm up: first-call initialization is not what we are measuring
+    for i, args in enumerate(argsets):
+        if before is not None:
+            before(i)
+        func(*args)
+
+    latencies = []
+    for _ in range(repeat):
+        for i, args in enumerate(argsets):
+            if before is not None:
+                before(i)
+            start = default_timer()
+            func(*args)
+            latencies.append(default_timer() - start)
+    latencies.sort()
+
+    best = None
+    for _ in range(repeat):
+        start = default_timer()
+        for i, args in enumerate(argsets):
+            if before is not None:
+                before(i)
+            func(*args)
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return {
+        'scalar': {
+            'p50_us': _percentile(latencies, 0.50) * 1e6,
+            'p99_us': _percentile(latencies, 0.99) * 1e6,
+            'mean_us': sum(latencies) / len(latencies) * 1e6,
+        },
+        'batch': {
+            'per_call_us': best / len(argsets) * 1e6,
+        },
+    }
+
+
+def run(n, repeat, pattern=None, seed=0):
+    results = {}
+    # some controllers print from their hot path; keep it off the terminal
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        for case in build_cases(n, seed):
+            if pattern and pattern not in case.name:
+                continue
+            results[case.name] = run_case(case, repeat)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'samples': n,
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold, min_diff=0.5):
+    """Return the (case, metric, baseline, current) that regressed: slower
+    per batch call by more than threshold and min_diff [us]."""
+    regressions = []
+    for name, result in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        old, new = base['batch']['per_call_us'], result['batch']['per_call_us']
+        if new > old * (1 + threshold) and new - old >= min_diff:
+            regressions.append((name, 'batch.per_call_us', old, new))
+    return regressions
+
+
+def print_results(data, baseline=None):
+    print('%-50s %10s %10s %10s %10s' % ('case', 'p50 us', 'p99 us', 'batch us', 'vs base'))
+    for name, result in sorted(data['results'].items()):
+        scalar, batch = result['scalar'], result['batch']
+        ratio = ''
+        if baseline is not None and name in baseline['results']:
+            ratio = '%.2fx' % (batch['per_call_us'] /
+                               baseline['results'][name]['batch']['per_call_us'])
+        print('%-50s %10.2f %10.2f %10.2f %10s' % (
+            name, scalar['p50_us'], scalar['p99_us'], batch['per_call_us'], ratio))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=500, help='inputs per case')
+    parser.add_argument('--repeat', type=int, default=5, help='timing rounds per mode')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--filter', help='only run cases whose name contains this')
+    parser.add_argument('--save', help='write the results to this JSON baseline')
+    parser.add_argument('--compare', help='compare against this JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown reported as a regression')
+    parser.add_argument('--min-diff', type=float, default=0.5,
+                        help='smallest slowdown per call reported as a regression [us]')
+    args = parser.parse_args(argv)
+
+    data = run(args.samples, args.repeat, args.filter, args.seed)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(data, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+    if baseline is not None:
+        regressions = compare(data, baseline, args.threshold, args.min_diff)
+        for name, metric, old, new in regressions:
+            print('REGRESSION %s %s: %.2f us -> %.2f us' % (name, metric, old, new))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
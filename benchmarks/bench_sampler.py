@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+
+"""Sampling rate and statistics of TangoAttrSamplerController acquisitions.
+
+Runs the controller unmodified against benchmarks.faketango: --attributes
+noisy attributes (gaussian, std --noise) sampled at --rate during
+acquisitions of --time seconds, with the given latency per Tango read.
+Reports, per acquisition, the samples per attribute against the
+configured rate and the mean/std the channels returned.
+
+Usage:
+    python -m benchmarks.bench_sampler --rate 100 --time 1 --latency 1
+    python -m benchmarks.bench_sampler --attributes 8 --rate 500
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import argparse
+import logging
+import random
+import sys
+import time
+from timeit import default_timer
+
+from benchmarks import standins
+
+standins.install()
+
+from sardana import State
+
+from benchmarks import faketango
+
+
+def setup(n_attributes, rate, noise):
+    """A sampler with a mean and a std channel per simulated attribute."""
+    ctrl = standins.load_controller('countertimer.TangoAttrSamplerCtrl',
+                                    'TangoAttrSamplerController',
+                                    {'SampleRate': rate, 'BufferSize': 100000})
+    for i in range(n_attributes):
+        name = 'b311a/sim/sensor-%02d/Value' % i
+        faketango.add_attribute(name, 0.0, getter=lambda i=i: random.gauss(i, noise))
+        for axis, statistic in ((2 * i + 1, 'mean'), (2 * i + 2, 'std')):
+            ctrl.AddDevice(axis)
+            ctrl.SetAxisExtraPar(axis, 'TangoAttribute', name)
+            ctrl.SetAxisExtraPar(axis, 'Statistic', statistic)
+    return ctrl
+
+
+def acquire(ctrl, integration_time):
+    axes = sorted(ctrl.axes)
+    ctrl.LoadOne(1, integration_time)
+    ctrl.PreStartAll()
+    for axis in axes:
+        ctrl.PreStartOne(axis, integration_time)
+        ctrl.StartOne(axis, integration_time)
+    start = default_timer()
+    ctrl.StartAll()
+    while ctrl.StateOne(1)[0] == State.Moving:
+        time.sleep(0.001)
+    elapsed = default_timer() - start
+    return elapsed, dict((axis, ctrl.ReadOne(axis)) for axis in axes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--attributes', type=int, default=3)
+    parser.add_argument('--rate', type=float, default=100.0, help='samples/s')
+    parser.add_argument('--time', type=float, default=1.0, help='integration time [s]')
+    parser.add_argument('--latency', type=float, default=0.5, help='per read [ms]')
+    parser.add_argument('--noise', type=float, default=0.01, help='std of the values')
+    parser.add_argument('--points', type=int, default=3)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.CRITICAL)
+
+    faketango.reset()
+    ctrl = setup(args.attributes, args.rate, args.noise)
+    faketango.configure(latency=args.latency / 1e3)
+
+    expected = args.rate * args.time
+    print('%-6s %10s %10s %10s %12s' % ('point', 'time s', 'samples', 'expected',
+                                        'mean std'))
+    for point in range(args.points):
+        elapsed, values = acquire(ctrl, args.time)
+        count = ctrl.sampler.statistic(ctrl.axes[1].pars['TangoAttribute'], 'count')
+        print('%-6d %10.3f %10d %10d %12.4f' % (point, elapsed, count, expected, values[2]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+
+"""Snapshot cost and consistency of ctrl.sharedstate across processes.
+
+A child process publishes all the fields at once, as fast as it can or
+--rate times per second, every publish with the same value in every
+field. The parent takes --snapshots snapshots meanwhile, and reports the
+time per snapshot and how many were torn (fields from different
+publishes), which the seqlock should make zero.
+
+Usage:
+    python -m benchmarks.bench_sharedstate --snapshots 200000
+    python -m benchmarks.bench_sharedstate --rate 1000
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import argparse
+import os
+import signal
+import sys
+import tempfile
+import time
+from timeit import default_timer
+
+from ctrl.sharedstate import FIELDS, SharedState
+
+NUMERIC = [name for name in FIELDS if name != 'strip']
+
+
+def write(filename, rate):
+    """Publish forever from a child process; returns its pid."""
+    pid = os.fork()
+    if pid:
+        return pid
+    try:
+        state = SharedState(filename, writer=True)
+        period = 1.0 / rate if rate else 0.0
+        count = 0
+        while True:
+            count += 1
+            values = dict((name, float(count)) for name in NUMERIC)
+            state.publish(strip=('Si', 'Rh')[count % 2], **values)
+            if period:
+                time.sleep(period)
+    finally:
+        os._exit(0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--snapshots', type=int, default=100000)
+    parser.add_argument('--rate', type=float, default=0, help='publishes/s, 0 for no pause')
+    args = parser.parse_args(argv)
+
+    filename = os.path.join(tempfile.mkdtemp(), 'state')
+    SharedState(filename, writer=True)
+    pid = write(filename, args.rate)
+    try:
+        time.sleep(0.2)
+        state = SharedState(filename)
+        torn = 0
+        first = state.snapshot()['seq']
+        start = default_timer()
+        for _ in range(args.snapshots):
+            snapshot = state.snapshot()
+            values = set(snapshot[name][0] for name in NUMERIC)
+            strip = ('Si', 'Rh')[int(snapshot[NUMERIC[0]][0]) % 2]
+            if len(values) != 1 or snapshot['strip'][0] != strip:
+                torn += 1
+        elapsed = default_timer() - start
+        publishes = (state.snapshot()['seq'] - first) // 2
+    finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    print('%d snapshots, %.2f us each, %d torn, %d publishes meanwhile'
+          % (args.snapshots, elapsed / args.snapshots * 1e6, torn, publishes))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+
+"""Check that the lookahead of a pipelined scan leaves the beamline alone.
+
+pipelined_ascan (macros/pipelined_scan.py) asks a pseudo motor for the
+physical positions of point i+1 while point i is acquiring. The pseudo
+positions recorded for point i must not change because of it, and the
+calculation must not write to the hardware.
+
+The energy chain of benchmarks.bench_movetime (BeamlineEnergy over
+Energy, IVUEnergy and MirrorStripChooser, on simulated motors) is moved
+to every point of an energy scan. Between the points the physical
+positions of the next ones are calculated, down the chain, as the
+CalcAllPhysical command does; the reported positions of every pseudo
+motor are read before and after, and the mirror motors are left powered
+off. As in pipelined_ascan, the points on the other mirror strip are not
+calculated ahead (the strip chooser powers the mirrors on for a strip
+change). Exits with 1 if a reported position changed or a motor was
+powered on by the lookahead.
+
+Usage:
+    python -m benchmarks.check_lookahead
+    python -m benchmarks.check_lookahead --start 7000 --final 9000 --points 11
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import argparse
+import logging
+import sys
+
+from benchmarks import standins
+
+standins.install()
+
+from benchmarks import faketango
+from ctrl import energyhint
+from ctrl.workers import Task
+from benchmarks.bench_movetime import build
+from benchmarks.poolfree import Pseudo
+from ctrl.pseudomotor.BeamlineEnergy import strip_for_energy
+
+MIRRORS = ('hfm_y', 'vfm_x1', 'vfm_x2')
+
+
+def systems(system):
+    """system and every PseudoSystem below it."""
+    result = [system]
+    for child in system.children:
+        if isinstance(child, Pseudo):
+            result += systems(child.system)
+    return result
+
+
+def reported(chain):
+    """{controller: pseudo positions} as the Pool reads them."""
+    return dict((system.name, tuple(system.positions())) for system in chain)
+
+
+def calculate(system, index, target):
+    """The physical positions of target, down the chain, moving nothing."""
+    pseudos = list(system.pseudos)
+    pseudos[index] = target
+    targets = system.ctrl.CalcAllPhysical(tuple(pseudos), system.physicals())
+    for child, child_target in zip(system.children, targets):
+        if isinstance(child, Pseudo):
+            calculate(child.system, child.index, child_target)
+
+
+def settle():
+    """Wait for the energy hints of the calculations to be handled."""
+    energyhint.POOL.submit(Task('settle', lambda: None)).get(5.0)
+
+
+def powered():
+    return [name for name in MIRRORS if faketango.get_value(name + '/PowerOn')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--start', type=float, default=12600.0)
+    parser.add_argument('--final', type=float, default=12800.0)
+    parser.add_argument('--points', type=int, default=11)
+    parser.add_argument('--lookahead', type=int, default=2, help='points calculated ahead')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    faketango.reset()
+    sim, pool, elements = build(time_scale=1000.0, poll_period=0.05, deadband=0.0)
+    energy = elements['energy']
+    chain = systems(energy.system)
+    step = (args.final - args.start) / max(args.points - 1, 1)
+    points = [args.start + i * step for i in range(args.points)]
+
+    changed = 0
+    powered_on = 0
+    for i, point in enumerate(points):
+        pool.move([(energy, point)])
+        for name in MIRRORS:
+            faketango.set_value(name + '/PowerOn', False)
+        before = reported(chain)
+        ahead = [target for target in points[i + 1:i + 1 + args.lookahead]
+                 if strip_for_energy(target) == strip_for_energy(point)]
+        for target in ahead:
+            calculate(energy.system, energy.index, target)
+        settle()
+        after = reported(chain)
+        for name in sorted(before):
+            if before[name] != after[name]:
+                changed += 1
+                print('point %d: %s reported %s, %s after the lookahead'
+                      % (i, name, before[name], after[name]))
+        if powered():
+            print('point %d: %s powered on by the lookahead' % (i, ', '.join(powered())))
+            powered_on += 1
+    print('%d points, %d reported positions changed, %d power-ons by the lookahead'
+          % (len(points), changed, powered_on))
+    return 1 if changed or powered_on else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,482 @@
+#!/usr/bin/env python
+
+
+"""In-process simulated Tango devices behind the PyTango stand-in.
+
+The AttributeProxy and DeviceProxy of benchmarks/stubs/PyTango talk to the
+devices registered here instead of a Tango database, so the controllers
+run unmodified on any Linux box:
+
+    from benchmarks import standins
+    standins.install()
+    from benchmarks import faketango
+
+    faketango.configure(latency=0.002, jitter=0.0005)
+    faketango.add_motor('b311a-o/opt/mono-mot', position=10.0, speed=1.0)
+    faketango.add_attribute('r3-311l/id/idivu-01_gap/Gap', 5.0, move_time=2.0)
+    faketango.fail('r3-311l/id/idivu-01_gap/Gap', count=3)
+
+Simulated behaviour:
+    - a written attribute ramps linearly to its target in move_time seconds
+      (or at speed units/s), reading ATTR_CHANGING meanwhile and
+      ATTR_VALID afterwards; the device State is MOVING while any of its
+      attributes moves
+    - every proxy call sleeps latency +- jitter, connecting sleeps
+      connect_time; calls to unreachable devices fail after connect_timeout
+    - change events fire on writes, on the end of a ramp and on set()
+    - failures are injected per name (fail()) or randomly (failure_rate)
+
+calls counts the proxy operations per device for throughput measurements.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import itertools
+import random
+import threading
+import time
+from collections import defaultdict
+
+
+class AttrQuality(object):
+    ATTR_VALID = 'ATTR_VALID'
+    ATTR_INVALID = 'ATTR_INVALID'
+    ATTR_ALARM = 'ATTR_ALARM'
+    ATTR_CHANGING = 'ATTR_CHANGING'
+    ATTR_WARNING = 'ATTR_WARNING'
+
+
+class DevState(object):
+    ON = 'ON'
+    OFF = 'OFF'
+    CLOSE = 'CLOSE'
+    OPEN = 'OPEN'
+    INSERT = 'INSERT'
+    EXTRACT = 'EXTRACT'
+    MOVING = 'MOVING'
+    STANDBY = 'STANDBY'
+    FAULT = 'FAULT'
+    INIT = 'INIT'
+    RUNNING = 'RUNNING'
+    ALARM = 'ALARM'
+    DISABLE = 'DISABLE'
+    UNKNOWN = 'UNKNOWN'
+
+
+class EventType(object):
+    CHANGE_EVENT = 'change'
+    PERIODIC_EVENT = 'periodic'
+
+
+class DevError(object):
+
+    def __init__(self, reason, desc, origin=''):
+        self.reason = reason
+        self.desc = desc
+        self.origin = origin
+        self.severity = 'ERR'
+
+
+class DevFailed(Exception):
+
+    def __init__(self, *errors):
+        errors = tuple(e if isinstance(e, DevError) else DevError('API_Error', str(e))
+                       for e in errors)
+        Exception.__init__(self, *errors)
+        self.errors = errors
+
+    def __getitem__(self, index):
+        return self.errors[index]
+
+    def __str__(self):
+        return '; '.join('%s: %s' % (e.reason, e.desc) for e in self.errors)
+
+
+class DeviceAttribute(object):
+
+    def __init__(self, name, value, quality=AttrQuality.ATTR_VALID, w_value=None):
+        self.name = name
+        self.value = value
+        self.w_value = value if w_value is None else w_value
+        self.quality = quality
+        self.time = time.time()
+
+
+class EventData(object):
+
+    def __init__(self, attr_name, attr_value, err=False, errors=()):
+        self.attr_name = attr_name
+        self.attr_value = attr_value
+        self.err = err
+        self.errors = errors
+        self.event = EventType.CHANGE_EVENT
+
+
+class FakeAttribute(object):
+    """A simulated attribute; numeric writes ramp to the target."""
+
+    def __init__(self, device, name, value, quality=AttrQuality.ATTR_VALID,
+                 writable=True, move_time=0.0, speed=None, getter=None):
+        self.device = device
+        self.name = name
+        self.writable = writable
+        self.move_time = move_time
+        self.speed = speed
+        self.getter = getter
+        self.quality = quality
+        self._lock = threading.Lock()
+        self._start = self._target = value
+        self._t0 = self._t1 = 0.0
+        self._callbacks = {}
+
+    def moving(self, now=None):
+        return (now or time.time()) < self._t1
+
+    def read(self):
+        if self.getter is not None:
+            return DeviceAttribute(self.name, self.getter(), self.quality)
+        with self._lock:
+            now = time.time()
+            if now < self._t1:
+                fraction = (now - self._t0) / (self._t1 - self._t0)
+                value = self._start + (self._target - self._start) * fraction
+                return DeviceAttribute(self.name, value, AttrQuality.ATTR_CHANGING, self._target)
+            return DeviceAttribute(self.name, self._target, self.quality)
+
+    def write(self, value):
+        if not self.writable:
+            raise DevFailed(DevError('API_AttrNotWritable', '%s is read only' % self.name))
+        with self._lock:
+            current = self.read_unlocked()
+            duration = self.move_time
+            if self.speed:
+                duration = abs(value - current) / float(self.speed)
+            now = time.time()
+            self._start, self._target = current, value
+            self._t0, self._t1 = now, now + duration
+        self._fire()
+        if duration > 0:
+            timer = threading.Timer(duration, self._fire)
+            timer.daemon = True
+            timer.start()
+
+    def read_unlocked(self):
+        now = time.time()
+        if now < self._t1:
+            fraction = (now - self._t0) / (self._t1 - self._t0)
+            return self._start + (self._target - self._start) * fraction
+        return self._target
+
+    def stop(self):
+        """Stop a ramp where it is."""
+        with self._lock:
+            self._start = self._target = self.read_unlocked()
+            self._t1 = 0.0
+        self._fire()
+
+    def set(self, value, quality=None):
+        """Server side update, e.g. a value changed by someone else."""
+        with self._lock:
+            self._start = self._target = value
+            self._t1 = 0.0
+            if quality is not None:
+                self.quality = quality
+        self._fire()
+
+    def subscribe(self, callback):
+        event_id = next(_event_ids)
+        self._callbacks[event_id] = callback
+        callback(EventData(self.full_name(), self.read()))
+        return event_id
+
+    def unsubscribe(self, event_id):
+        return self._callbacks.pop(event_id, None) is not None
+
+    def full_name(self):
+        return '%s/%s' % (self.device.name, self.name)
+
+    def _fire(self):
+        if not self._callbacks:
+            return
+        event = EventData(self.full_name(), self.read())
+        for callback in list(self._callbacks.values()):
+            callback(event)
+
+
+class FakeDevice(object):
+    """A simulated device: attributes, commands and a State."""
+
+    def __init__(self, name, state=DevState.ON, status=None):
+        self.name = name
+        self.state = state
+        self.status = status
+        self.attributes = {}
+        self.commands = {}
+        self.reachable = True
+
+    def add_attribute(self, name, value, **kwargs):
+        attribute = FakeAttribute(self, name, value, **kwargs)
+        self.attributes[name.lower()] = attribute
+        return attribute
+
+    def add_command(self, name, func):
+        self.commands[name.lower()] = func
+
+    def attribute(self, name):
+        try:
+            return self.attributes[name.lower()]
+        except KeyError:
+            raise DevFailed(DevError('API_AttrNotFound',
+                                     '%s/%s not found' % (self.name, name)))
+
+    def get_state(self):
+        if self.state == DevState.ON:
+            now = time.time()
+            for attribute in self.attributes.values():
+                if attribute.getter is None and attribute.moving(now):
+                    return DevState.MOVING
+        return self.state
+
+    def get_status(self):
+        if self.status is not None:
+            return self.status
+        return 'The device is in %s state.' % self.get_state()
+
+
+class FakeTango(object):
+    """The registry of simulated devices and the network conditions."""
+
+    def __init__(self):
+        self.devices = {}
+        self.latency = 0.0
+        self.jitter = 0.0
+        self.connect_time = 0.0
+        self.connect_timeout = 3.0
+        self.failure_rate = 0.0
+        self.failures = {}
+        self.calls = defaultdict(int)
+        self.random = random.Random(0)
+        self._lock = threading.Lock()
+
+    def device(self, name, create=False):
+        key = name.lower()
+        device = self.devices.get(key)
+        if device is None:
+            if not create:
+                raise DevFailed(DevError('DB_DeviceNotDefined',
+                                         'device %s not defined in the database' % name))
+            device = self.devices[key] = FakeDevice(name)
+        return device
+
+    def connect(self, name):
+        device = self.device(name)
+        if not device.reachable:
+            time.sleep(self.connect_timeout)
+            raise DevFailed(DevError('API_CantConnectToDevice', 'cannot connect to %s' % name))
+        if self.connect_time:
+            time.sleep(self.connect_time)
+        return device
+
+    def call(self, device, name):
+        """Account for one network round-trip to device for operation name."""
+        with self._lock:
+            self.calls[device.name] += 1
+            pending = self.failures.get(name.lower())
+            if pending:
+                self.failures[name.lower()] = pending - 1
+                failed = True
+            else:
+                failed = self.failure_rate and self.random.random() < self.failure_rate
+            delay = self.latency
+            if self.jitter:
+                delay = max(0.0, self.random.gauss(self.latency, self.jitter))
+        if not device.reachable:
+            time.sleep(self.connect_timeout)
+            failed = True
+        elif delay:
+            time.sleep(delay)
+        if failed:
+            raise DevFailed(DevError('API_CommunicationFailed', 'injected failure on %s' % name))
+
+
+TANGO = FakeTango()
+_event_ids = itertools.count(1)
+
+
+def _split(name):
+    device, _, attribute = name.rpartition('/')
+    return device, attribute
+
+
+def configure(**kwargs):
+    """Set latency, jitter, connect_time, connect_timeout or failure_rate."""
+    for key, value in kwargs.items():
+        if not hasattr(TANGO, key):
+            raise AttributeError(key)
+        setattr(TANGO, key, value)
+
+
+def reset():
+    """Forget all devices, failures and counters, back to an ideal network."""
+    TANGO.__init__()
+
+
+def add_device(name, state=DevState.ON, status=None):
+    device = TANGO.device(name, create=True)
+    device.state = state
+    device.status = status
+    return device
+
+
+def add_attribute(name, value, **kwargs):
+    """Add attribute 'dev/fam/member/attr' (creating the device if needed)."""
+    device, attribute = _split(name)
+    return TANGO.device(device, create=True).add_attribute(attribute, value, **kwargs)
+
+
+def add_motor(name, position=0.0, speed=1.0):
+    """A device with a ramping Position and Abort/Stop commands."""
+    device = add_device(name)
+    position = device.add_attribute('Position', position, speed=speed)
+    device.add_command('Abort', lambda: position.stop())
+    device.add_command('Stop', lambda: position.stop())
+    return device
+
+
+def add_piezo(position_name, on_target_name, position=0.0, move_time=0.01):
+    """A piezo axis: its on_target attribute is False while Position ramps."""
+    position = add_attribute(position_name, position, move_time=move_time)
+    add_attribute(on_target_name, True, writable=False,
+                  getter=lambda: not position.moving())
+    return position
+
+
+def set_value(name, value, quality=None):
+    """Set (creating it if needed) the value an attribute reads back."""
+    device, attribute = _split(name)
+    device = TANGO.device(device, create=True)
+    if attribute.lower() in device.attributes:
+        device.attribute(attribute).set(value, quality)
+    else:
+        device.add_attribute(attribute, value, quality=quality or AttrQuality.ATTR_VALID)
+
+
+def get_value(name):
+    device, attribute = _split(name)
+    return TANGO.device(device).attribute(attribute).read().value
+
+
+def fail(name, count=1):
+    """Make the next count operations on attribute or command name fail."""
+    with TANGO._lock:
+        TANGO.failures[name.lower()] = TANGO.failures.get(name.lower(), 0) + count
+
+
+def set_reachable(device_name, reachable):
+    TANGO.device(device_name).reachable = reachable
+
+
+class AttributeProxy(object):
+
+    def __init__(self, name):
+        device_name, self._attr_name = _split(name)
+        self._full_name = name
+        self._device = TANGO.connect(device_name)
+
+    def name(self):
+        return self._attr_name
+
+    def get_device_proxy(self):
+        return DeviceProxy(self._device.name)
+
+    def read(self):
+        TANGO.call(self._device, self._full_name)
+        return self._device.attribute(self._attr_name).read()
+
+    def write(self, value):
+        TANGO.call(self._device, self._full_name)
+        self._device.attribute(self._attr_name).write(value)
+
+    def subscribe_event(self, event_type, callback, *args, **kwargs):
+        TANGO.call(self._device, self._full_name)
+        return self._device.attribute(self._attr_name).subscribe(callback)
+
+    def unsubscribe_event(self, event_id):
+        self._device.attribute(self._attr_name).unsubscribe(event_id)
+
+
+class DeviceProxy(object):
+
+    def __init__(self, name):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_device', TANGO.connect(name))
+
+    def dev_name(self):
+        return self._name
+
+    def State(self):
+        TANGO.call(self._device, self._name + '/State')
+        return self._device.get_state()
+
+    def Status(self):
+        TANGO.call(self._device, self._name + '/Status')
+        return self._device.get_status()
+
+    def ping(self):
+        start = time.time()
+        TANGO.call(self._device, self._name + '/ping')
+        return int((time.time() - start) * 1e6)
+
+    def read_attribute(self, name):
+        TANGO.call(self._device, '%s/%s' % (self._name, name))
+        return self._device.attribute(name).read()
+
+    def _read(self, name):
+        if name.lower() == 'state':
+            return DeviceAttribute('State', self._device.get_state())
+        if name.lower() == 'status':
+            return DeviceAttribute('Status', self._device.get_status())
+        return self._device.attribute(name).read()
+
+    def read_attributes(self, names):
+        TANGO.call(self._device, self._name + '/read_attributes')
+        return [self._read(name) for name in names]
+
+    def get_attribute_list(self):
+        TANGO.call(self._device, self._name + '/get_attribute_list')
+        return [attribute.name for attribute in self._device.attributes.values()] + \
+            ['State', 'Status']
+
+    def write_attribute(self, name, value):
+        TANGO.call(self._device, '%s/%s' % (self._name, name))
+        self._device.attribute(name).write(value)
+
+    def command_inout(self, name, *args):
+        TANGO.call(self._device, '%s/%s' % (self._name, name))
+        try:
+            command = self._device.commands[name.lower()]
+        except KeyError:
+            raise DevFailed(DevError('API_CommandNotFound', '%s not found' % name))
+        return command(*args)
+
+    def subscribe_event(self, attr_name, event_type, callback, *args, **kwargs):
+        TANGO.call(self._device, '%s/%s' % (self._name, attr_name))
+        return self._device.attribute(attr_name).subscribe(callback)
+
+    def unsubscribe_event(self, event_id):
+        for attribute in self._device.attributes.values():
+            if attribute.unsubscribe(event_id):
+                return
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name.lower() in self._device.attributes:
+            return self.read_attribute(name).value
+        if name.lower() in self._device.commands:
+            return lambda *args: self.command_inout(name, *args)
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self.write_attribute(name, value)
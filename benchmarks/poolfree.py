@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+
+"""A Pool-free harness wiring pseudo motor controllers to motor controllers.
+
+It mimics what the Pool does for a move: the pseudo positions are turned
+into physical targets through every CalcAllPhysical down the chain, all
+physical motors are started together (PreStartAll/PreStartOne/StartOne/
+StartAll per controller) and their StateOne is polled until none moves.
+
+    sim = load_controller('motor.SimMotorController', 'SimMotorController',
+                          {'TimeScale': 10})
+    pool = Pool(poll_period=0.05, clock=sim.now, time_scale=10)
+    bragg = pool.physical('mono_bragg', sim, 1)
+    x2per = pool.physical('mono_x2per', sim, 2)
+    energy, = pool.pseudo(load_controller('pseudomotor.EnergyController',
+                                          'Energy'), [bragg, x2per])
+    pool.move([(energy, 12700.0)])
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import json
+import time
+
+from sardana import State
+from sardana.pool.poolmotor import PoolMotor
+
+
+def ivu_table(points=64):
+    """A smooth energy [eV] vs IVU gap [mm] table, as JSON property strings."""
+    energies = [5400 + (19550 - 5400) * i / float(points - 1) for i in range(points)]
+    gaps = [4.9976 + 1.981 * ((e - 5400) / 14150.0) ** 0.8 for e in energies]
+    return json.dumps(energies), json.dumps(gaps)
+
+
+class Physical(object):
+    """An axis of a motor controller."""
+
+    def __init__(self, name, ctrl, axis):
+        self.name = name
+        self.ctrl = ctrl
+        self.axis = axis
+
+    def position(self):
+        return self.ctrl.ReadOne(self.axis)
+
+    def plan(self, target, targets):
+        targets.append((self, target))
+
+
+class PseudoSystem(object):
+    """A pseudo motor controller with the elements behind its motor roles."""
+
+    def __init__(self, name, ctrl, children):
+        self.name = name
+        self.ctrl = ctrl
+        self.children = children
+        self.pseudos = [0.0] * len(ctrl.pseudo_motor_roles)
+        # GetMotor() of the sardana stand-in returns these
+        self.motors = []
+        motors = getattr(ctrl, '_motors', None)
+        if motors is not None:
+            for role, child in zip(ctrl.motor_roles, children):
+                motors[role] = PoolMotor(child.name)
+                self.motors.append(motors[role])
+
+    def physicals(self):
+        positions = tuple(child.position() for child in self.children)
+        # the positions the Pool caches, as the controllers see them
+        for motor, position in zip(self.motors, positions):
+            motor.get_position().value = position
+        return positions
+
+    def positions(self):
+        self.pseudos = list(self.ctrl.CalcAllPseudo(self.physicals(), tuple(self.pseudos)))
+        return self.pseudos
+
+    def plan(self, index, target, targets):
+        pseudos = list(self.positions())
+        pseudos[index] = target
+        physical_targets = self.ctrl.CalcAllPhysical(tuple(pseudos), self.physicals())
+        self.pseudos = pseudos
+        for child, child_target in zip(self.children, physical_targets):
+            child.plan(child_target, targets)
+
+
+class Pseudo(object):
+    """One pseudo motor of a PseudoSystem."""
+
+    def __init__(self, name, system, index):
+        self.name = name
+        self.system = system
+        self.index = index
+
+    def position(self):
+        return self.system.positions()[self.index]
+
+    def plan(self, target, targets):
+        self.system.plan(self.index, target, targets)
+
+
+class Pool(object):
+    """Moves elements like the Pool, keeping count of what it did.
+
+    clock is the time base reported in the statistics (e.g. the simulated
+    time of SimMotorController.now); time_scale converts the poll period
+    into wall clock seconds to sleep.
+    """
+
+    def __init__(self, poll_period=0.05, clock=time.time, time_scale=1.0):
+        self.poll_period = poll_period
+        self.clock = clock
+        self.time_scale = time_scale
+        self.start_calls = 0
+        self.state_calls = 0
+
+    def physical(self, name, ctrl, axis):
+        return Physical(name, ctrl, axis)
+
+    def pseudo(self, ctrl, children, name=None):
+        """The Pseudo elements of a pseudo controller, one per pseudo role."""
+        system = PseudoSystem(name or type(ctrl).__name__, ctrl, children)
+        return [Pseudo(role, system, index)
+                for index, role in enumerate(ctrl.pseudo_motor_roles)]
+
+    def plan(self, moves):
+        targets = []
+        for element, target in moves:
+            element.plan(target, targets)
+        return targets
+
+    def teleport(self, moves):
+        """Put the simulated motors straight at the positions of moves."""
+        for physical, target in self.plan(moves):
+            physical.ctrl.axes[physical.axis].position = target
+
+    def start(self, targets):
+        by_ctrl = {}
+        for physical, target in targets:
+            by_ctrl.setdefault(physical.ctrl, []).append((physical.axis, target))
+        for ctrl, axes in by_ctrl.items():
+            ctrl.PreStartAll()
+            for axis, target in axes:
+                if not ctrl.PreStartOne(axis, target):
+                    raise Exception("PreStartOne refused axis %d" % axis)
+            for axis, target in axes:
+                ctrl.StartOne(axis, target)
+                self.start_calls += 1
+            ctrl.StartAll()
+
+    def wait(self, physicals):
+        while True:
+            moving = False
+            for physical in physicals:
+                self.state_calls += 1
+                if physical.ctrl.StateOne(physical.axis)[0] == State.Moving:
+                    moving = True
+            if not moving:
+                return
+            time.sleep(self.poll_period / self.time_scale)
+
+    def move(self, moves):
+        """Move [(element, target), ...] together; return the elapsed time."""
+        start = self.clock()
+        targets = self.plan(moves)
+        self.start(targets)
+        self.wait([physical for physical, _ in targets])
+        return self.clock() - start
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+
+
+"""Replays a recorded beamline session against the current controllers.
+
+A recording made with BIOMAX_CTRL_RECORD (see ctrl.tangorecord) holds the
+construction of every controller, the Pool calls they served and the
+Tango round-trips they made. This rebuilds the controllers from the
+current tree and calls them in the recorded order, answering their Tango
+calls with the recorded values, qualities, errors and latencies, then
+reports per controller method:
+    - calls, recorded and replayed mean time
+    - results differing from the recorded ones
+and the Tango operations that were not in the recording or were made
+with different arguments (e.g. another gap written for the same energy).
+
+Tango responses are served per proxy and operation in the recorded order.
+A proxy created under a name absent from the recording (e.g. the PowerOn
+attribute of a Pool motor whose name the stand-in does not know) is bound
+to the next unused recorded proxy with the same attribute name.
+Controllers whose state does not come from Tango (SimMotorController
+runs on the wall clock) do not replay exactly.
+
+Usage:
+    python -m benchmarks.replay session.rec
+    python -m benchmarks.replay session.rec --latency-scale 0 --strict
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import argparse
+import logging
+import os
+import sys
+import time
+from collections import defaultdict, deque
+from timeit import default_timer
+
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+from benchmarks import standins
+
+standins.install()
+
+import PyTango
+
+from ctrl.tangorecord import CALL, CTRL, DROPPED, TANGO, iter_records, outcome, error_outcome
+
+TOLERANCE = 1e-9
+
+
+class ReplayAttribute(object):
+    """The DeviceAttribute returned by a replayed read()."""
+
+    def __init__(self, value, quality, w_value):
+        self.value = value
+        self.quality = getattr(PyTango.AttrQuality, quality, quality)
+        self.w_value = w_value
+        self.time = time.time()
+
+
+class Session(object):
+    """The contents of a recording, grouped for replaying."""
+
+    def __init__(self, filename):
+        self.controllers = []
+        self.calls = []
+        self.tango = defaultdict(deque)
+        self.labels = []
+        self.dropped = 0
+        for kind, owner, name, start, seconds, payload in iter_records(filename):
+            if kind == CTRL:
+                self.controllers.append((owner, name) + tuple(payload))
+            elif kind == CALL:
+                self.calls.append((start, owner, name, seconds) + tuple(payload))
+            elif kind == TANGO:
+                if owner not in self.labels:
+                    self.labels.append(owner)
+                self.tango[owner, name].append((seconds,) + tuple(payload))
+            elif kind == DROPPED:
+                self.dropped += owner
+        self.calls.sort(key=lambda call: call[0])
+
+
+class Replayer(object):
+    """Serves the recorded Tango responses to the replaying proxies."""
+
+    def __init__(self, session, latency_scale=1.0):
+        self.session = session
+        self.latency_scale = latency_scale
+        self.bound = {}
+        self.missing = defaultdict(int)
+        self.diverged = defaultdict(int)
+
+    def resolve(self, name):
+        """The recorded label a proxy created under name replays."""
+        label = self.bound.get(name)
+        if label is not None:
+            return label
+        label = name
+        if name not in self.session.labels:
+            attr = name.rsplit('/', 1)[-1].lower()
+            for candidate in self.session.labels:
+                if (candidate.rsplit('/', 1)[-1].lower() == attr
+                        and candidate not in self.bound.values()):
+                    label = candidate
+                    break
+        self.bound[name] = label
+        return label
+
+    def has(self, label, op):
+        return bool(self.session.tango.get((label, op)))
+
+    def respond(self, label, op, args):
+        queue = self.session.tango.get((label, op))
+        if not queue:
+            self.missing[label, op] += 1
+            raise PyTango.DevFailed(PyTango.DevError(
+                'Replay_NotRecorded', '%s %s is not in the recording' % (label, op)))
+        seconds, recorded_args, done = queue.popleft()
+        if not same(tuple(args), tuple(recorded_args)):
+            self.diverged[label, op] += 1
+        if self.latency_scale > 0:
+            time.sleep(seconds * self.latency_scale)
+        return respond(done)
+
+
+def respond(done):
+    """Return (or raise) what a recorded outcome describes."""
+    kind = done[0]
+    if kind == 'A':
+        return ReplayAttribute(*done[1:])
+    if kind == 'S':
+        return getattr(PyTango.DevState, done[1], done[1])
+    if kind == 'E':
+        raise PyTango.DevFailed(*[PyTango.DevError(reason, desc, origin)
+                                  for reason, desc, origin in done[1]])
+    if kind == 'X':
+        exc_type = getattr(builtins, done[1], None)
+        if not (isinstance(exc_type, type) and issubclass(exc_type, Exception)):
+            exc_type = Exception
+        raise exc_type(done[2])
+    return done[1]
+
+
+def same(a, b):
+    """Equal, numbers within TOLERANCE (relative) of each other."""
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a == b
+    try:
+        a_num, b_num = float(a), float(b)
+    except (TypeError, ValueError):
+        return a == b
+    if a_num == b_num:
+        return True
+    return abs(a_num - b_num) <= TOLERANCE * max(abs(a_num), abs(b_num))
+
+
+class ReplayProxy(object):
+    """AttributeProxy and DeviceProxy stand-in serving the recording.
+
+    An attribute with recorded reads is served as a value, any other name
+    as a method replaying name().
+    """
+
+    replayer = None
+
+    def __init__(self, name):
+        object.__setattr__(self, '_label', self.replayer.resolve(name))
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        replayer, label = self.replayer, self._label
+        if replayer.has(label, name):
+            return replayer.respond(label, name, ())
+        return lambda *args, **kwargs: replayer.respond(label, name + '()', args)
+
+    def __setattr__(self, name, value):
+        self.replayer.respond(self._label, name + '=', (value,))
+
+
+def _controller_module(module, basename):
+    """The ctrl subpackage module of a recorded controller module/file."""
+    module = os.path.splitext(basename)[0] if basename else module.rsplit('.', 1)[-1]
+    for package in ('motor', 'pseudomotor', 'countertimer'):
+        if os.path.exists(os.path.join(standins.REPO, 'ctrl', package, module + '.py')):
+            return '%s.%s' % (package, module)
+    raise ImportError("no controller module %s in ctrl/" % module)
+
+
+def build(session):
+    """{controller number: controller} rebuilt from the current tree."""
+    controllers = {}
+    for ctrl_id, cls_name, module, basename, inst, props in session.controllers:
+        mod = __import__('ctrl.' + _controller_module(module, basename), fromlist=[cls_name])
+        controllers[ctrl_id] = getattr(mod, cls_name)(inst, props)
+    return controllers
+
+
+def replay(session, controllers):
+    """Call the controllers as recorded; return the per method statistics."""
+    stats = defaultdict(lambda: {'calls': 0, 'recorded_s': 0.0, 'replayed_s': 0.0,
+                                 'mismatches': 0, 'examples': []})
+    for start, ctrl_id, method, seconds, args, done in session.calls:
+        ctrl = controllers.get(ctrl_id)
+        if ctrl is None:
+            continue
+        entry = stats['%s.%s' % (type(ctrl).__name__, method)]
+        t0 = default_timer()
+        try:
+            result = outcome(getattr(ctrl, method)(*args))
+        except Exception as e:
+            result = error_outcome(e)
+        entry['replayed_s'] += default_timer() - t0
+        entry['recorded_s'] += seconds
+        entry['calls'] += 1
+        if not same_outcome(result, done):
+            entry['mismatches'] += 1
+            if len(entry['examples']) < 3:
+                entry['examples'].append((args, done, result))
+    return stats
+
+
+def same_outcome(a, b):
+    if a[0] != b[0]:
+        return False
+    if a[0] == 'E':
+        return [error[0] for error in a[1]] == [error[0] for error in b[1]]
+    if a[0] == 'X':
+        return a[1] == b[1]
+    return same(a[1:], b[1:])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('recording')
+    parser.add_argument('--latency-scale', type=float, default=1.0,
+                        help='multiplies the recorded Tango latencies (0: none)')
+    parser.add_argument('--strict', action='store_true',
+                        help='exit 1 on any mismatch, divergence or missing response')
+    parser.add_argument('--examples', action='store_true', help='show mismatching calls')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.CRITICAL)
+
+    session = Session(args.recording)
+    replayer = Replayer(session, args.latency_scale)
+    ReplayProxy.replayer = replayer
+    # the controller modules import the proxies from PyTango when loaded
+    PyTango.AttributeProxy = PyTango.DeviceProxy = ReplayProxy
+    controllers = build(session)
+    stats = replay(session, controllers)
+
+    print('%-44s %7s %12s %12s %10s' % ('method', 'calls', 'recorded ms', 'replayed ms',
+                                        'mismatches'))
+    for name in sorted(stats):
+        entry = stats[name]
+        calls = entry['calls'] or 1
+        print('%-44s %7d %12.3f %12.3f %10d' % (
+            name, entry['calls'], entry['recorded_s'] * 1e3 / calls,
+            entry['replayed_s'] * 1e3 / calls, entry['mismatches']))
+        if args.examples:
+            for call_args, recorded, result in entry['examples']:
+                print('    %r: recorded %r, replayed %r' % (call_args, recorded, result))
+    for (label, op), count in sorted(replayer.diverged.items()):
+        print('diverged     %s %s: %d calls with other arguments' % (label, op, count))
+    for (label, op), count in sorted(replayer.missing.items()):
+        print('not recorded %s %s: %d calls' % (label, op, count))
+    for name, label in sorted(replayer.bound.items()):
+        if name != label:
+            print('bound        %s to recorded %s' % (name, label))
+    if session.dropped:
+        print('dropped      %d records while recording' % session.dropped)
+    failed = (any(entry['mismatches'] for entry in stats.values())
+              or replayer.diverged or replayer.missing or session.dropped)
+    return 1 if args.strict and failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
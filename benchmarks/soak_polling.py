@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+
+"""Soak/load test of the motor controllers under the Pool polling loop.
+
+Builds hundreds of PI625 axes plus several ProxyMotorController and
+IVUGapAttrMotorController instances on simulated devices
+(benchmarks.faketango) and polls them like the Pool does: for every
+controller PreStateAll, PreStateOne/StateAll/StateOne per axis, then
+PreReadAll, PreReadOne/ReadAll/ReadOne per axis, at the requested rate.
+
+Before polling it reports how long the controllers took to connect to
+their --connect-time devices (they connect in the background and report
+Init until then).
+
+Every --report seconds, and at the end, it prints the achieved poll rate,
+the p50/p99/max cycle latency, the CPU time used and the resident memory
+growth since the start, so poll-loop saturation with many piezo axes can
+be reproduced off-line.
+
+Usage:
+    python -m benchmarks.soak_polling --piezo-axes 300 --rate 5 --latency 0.5
+    python -m benchmarks.soak_polling --duration 3600 --report 60 --json soak.json
+    python -m benchmarks.soak_polling --connect-time 500 --duration 10
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from timeit import default_timer
+
+from benchmarks import standins
+
+standins.install()
+
+from sardana import State
+
+from benchmarks import faketango
+
+
+def rss_kb():
+    """Resident memory of this process in kB (Linux)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def cpu_s():
+    times = os.times()
+    return times[0] + times[1]
+
+
+def build(piezo_axes, piezos_per_ctrl, proxy_ctrls, ivu_ctrls):
+    """[(controller, [axes])] for the requested mix, on simulated devices."""
+    load = standins.load_controller
+    controllers = []
+    for first in range(0, piezo_axes, piezos_per_ctrl):
+        ctrl = load('motor.pie625', 'PI625')
+        axes = list(range(1, min(piezos_per_ctrl, piezo_axes - first) + 1))
+        for axis in axes:
+            device = 'b311a/piezo/%04d' % (first + axis)
+            faketango.add_piezo(device + '/Position', device + '/on_target', 20.0)
+            ctrl.AddDevice(axis)
+            ctrl.SetAxisExtraPar(axis, 'TangoAttribute', device + '/Position')
+            ctrl.SetAxisExtraPar(axis, 'TangoOnTarget', device + '/on_target')
+        controllers.append((ctrl, axes))
+    for n in range(proxy_ctrls):
+        device = 'b311a/mot/proxy-%02d' % n
+        faketango.add_motor(device, 10.0)
+        ctrl = load('motor.ProxyMotorController', 'ProxyMotorController',
+                    {'MotorName': device, 'InterlockDevice': ''})
+        ctrl.AddDevice(1)
+        controllers.append((ctrl, [1]))
+    for n in range(ivu_ctrls):
+        attribute = 'r3/id/ivu-%02d/Gap' % n
+        faketango.add_attribute(attribute, 6.0, move_time=1.0)
+        ctrl = load('motor.IVUGapAttrMotorCtrl', 'IVUGapAttrMotorController')
+        ctrl.AddDevice(1)
+        ctrl.SetAxisExtraPar(1, 'TangoAttribute', attribute)
+        controllers.append((ctrl, [1]))
+    return controllers
+
+
+def poll_cycle(controllers):
+    """One Pool state and position poll of every axis; returns the errors."""
+    errors = 0
+    for ctrl, axes in controllers:
+        ctrl.PreStateAll()
+        for axis in axes:
+            ctrl.PreStateOne(axis)
+        ctrl.StateAll()
+        for axis in axes:
+            ctrl.StateOne(axis)
+        ctrl.PreReadAll()
+        for axis in axes:
+            ctrl.PreReadOne(axis)
+        ctrl.ReadAll()
+        for axis in axes:
+            try:
+                ctrl.ReadOne(axis)
+            except Exception:
+                errors += 1
+    return errors
+
+
+def wait_connected(controllers, timeout=600.0):
+    """Seconds until no axis reports Init any more."""
+    start = default_timer()
+    while default_timer() - start < timeout:
+        if all(ctrl.StateOne(axis)[0] != State.Init
+               for ctrl, axes in controllers for axis in axes):
+            break
+        time.sleep(0.01)
+    return default_timer() - start
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+class Window(object):
+    """Statistics of the cycles since the last report."""
+
+    def __init__(self, now, cpu, rss):
+        self.start, self.cpu, self.rss = now, cpu, rss
+        self.cycles = []
+        self.errors = 0
+        self.overruns = 0
+
+    def summary(self, now, rss_start):
+        cycles = sorted(self.cycles)
+        elapsed = now - self.start
+        return {
+            'elapsed_s': elapsed,
+            'cycles': len(cycles),
+            'rate_hz': len(cycles) / elapsed if elapsed else 0.0,
+            'p50_ms': _percentile(cycles, 0.50) * 1e3,
+            'p99_ms': _percentile(cycles, 0.99) * 1e3,
+            'max_ms': (cycles[-1] if cycles else 0.0) * 1e3,
+            'overruns': self.overruns,
+            'read_errors': self.errors,
+            'cpu_s': cpu_s() - self.cpu,
+            'rss_kb': rss_kb(),
+            'rss_growth_kb': rss_kb() - rss_start,
+        }
+
+
+def _print(label, summary):
+    print('%-8s %7.1f Hz  p50 %8.2f ms  p99 %8.2f ms  max %8.2f ms  overruns %5d  '
+          'cpu %6.2f s  rss %8d kB (%+d)' % (
+              label, summary['rate_hz'], summary['p50_ms'], summary['p99_ms'],
+              summary['max_ms'], summary['overruns'], summary['cpu_s'],
+              summary['rss_kb'], summary['rss_growth_kb']))
+    sys.stdout.flush()
+
+
+def soak(controllers, rate, duration, report):
+    period = 1.0 / rate
+    start = default_timer()
+    rss_start = rss_kb()
+    total = Window(start, cpu_s(), rss_start)
+    window = Window(start, cpu_s(), rss_start)
+    reports = []
+    deadline = start
+    while default_timer() - start < duration:
+        t0 = default_timer()
+        errors = poll_cycle(controllers)
+        elapsed = default_timer() - t0
+        for stats in (total, window):
+            stats.cycles.append(elapsed)
+            stats.errors += errors
+        deadline += period
+        now = default_timer()
+        if now < deadline:
+            time.sleep(deadline - now)
+        else:
+            # like the Pool, do not try to catch up on missed cycles
+            for stats in (total, window):
+                stats.overruns += 1
+            deadline = now
+        now = default_timer()
+        if now - window.start >= report:
+            summary = window.summary(now, rss_start)
+            reports.append(summary)
+            _print('%6.0fs' % (now - start), summary)
+            window = Window(now, cpu_s(), rss_kb())
+    summary = total.summary(default_timer(), rss_start)
+    _print('total', summary)
+    return summary, reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--piezo-axes', type=int, default=200)
+    parser.add_argument('--piezos-per-ctrl', type=int, default=100)
+    parser.add_argument('--proxy-ctrls', type=int, default=4)
+    parser.add_argument('--ivu-ctrls', type=int, default=2)
+    parser.add_argument('--rate', type=float, default=5.0, help='target polls per second')
+    parser.add_argument('--duration', type=float, default=60.0, help='[s]')
+    parser.add_argument('--report', type=float, default=10.0, help='report period [s]')
+    parser.add_argument('--latency', type=float, default=0.2, help='per Tango call [ms]')
+    parser.add_argument('--jitter', type=float, default=0.05, help='[ms]')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--connect-time', type=float, default=0.0,
+                        help='to create each proxy [ms]')
+    parser.add_argument('--json', help='write the summary and reports here')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.CRITICAL)
+
+    faketango.reset()
+    faketango.configure(connect_time=args.connect_time / 1e3)
+    start = default_timer()
+    controllers = build(args.piezo_axes, args.piezos_per_ctrl, args.proxy_ctrls, args.ivu_ctrls)
+    built = default_timer() - start
+    print('controllers built in %.2f s, connected after %.2f s' % (
+        built, built + wait_connected(controllers)))
+    faketango.configure(latency=args.latency / 1e3, jitter=args.jitter / 1e3,
+                        failure_rate=args.failure_rate)
+    axes = sum(len(axes) for _, axes in controllers)
+    print('polling %d axes on %d controllers at %.1f Hz for %.0f s' % (
+        axes, len(controllers), args.rate, args.duration))
+    summary, reports = soak(controllers, args.rate, args.duration, args.report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'summary': summary, 'reports': reports},
+                      f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
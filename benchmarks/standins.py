@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+
+
+"""Makes the sardana/PyTango stand-ins importable in place of the real ones.
+
+Call install() before importing any controller module.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import os
+import sys
+
+STUBS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stubs')
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def install():
+    """Put the stand-ins first on sys.path and the repo root after them."""
+    if STUBS in sys.path:
+        return
+    for name in list(sys.modules):
+        if name == 'PyTango' or name == 'sardana' or name.startswith('sardana.'):
+            raise RuntimeError("%s already imported, install() the stand-ins first" % name)
+    sys.path.insert(0, STUBS)
+    if REPO not in sys.path:
+        sys.path.insert(1, REPO)
+
+
+def load_controller(module, name, props=None):
+    """Import ctrl.<module> and instantiate its controller class name."""
+    install()
+    mod = __import__('ctrl.' + module, fromlist=[name])
+    return getattr(mod, name)(name.lower(), props or {})
@@ -0,0 +1,18 @@
+"""Stand-in for the parts of PyTango used by the controllers.
+
+The proxies talk to the simulated devices of benchmarks.faketango; set
+them up there (or with set_value() for plain attributes) before running
+a controller.
+"""
+
+from benchmarks.faketango import (AttrQuality, DevState, EventType, DevError,
+                                  DevFailed, DeviceAttribute, EventData,
+                                  AttributeProxy, DeviceProxy, set_value,
+                                  get_value)
+
+DevBoolean = 'DevBoolean'
+DevLong = 'DevLong'
+DevDouble = 'DevDouble'
+DevString = 'DevString'
+READ = 'READ'
+READ_WRITE = 'READ_WRITE'
@@ -0,0 +1,19 @@
+"""Stand-in for the parts of sardana used by the controllers."""
+
+
+class State(object):
+    On = 'ON'
+    Off = 'OFF'
+    Moving = 'MOVING'
+    Standby = 'STANDBY'
+    Fault = 'FAULT'
+    Init = 'INIT'
+    Running = 'RUNNING'
+    Alarm = 'ALARM'
+    Disable = 'DISABLE'
+    Unknown = 'UNKNOWN'
+
+
+class DataAccess(object):
+    ReadOnly = 'ReadOnly'
+    ReadWrite = 'ReadWrite'
@@ -0,0 +1,44 @@
+"""Stand-in for sardana.macroserver.macro.
+
+Macros get their output in self.lines; getEnv()/setEnv() use self.env.
+"""
+
+
+class Type(object):
+    Float = 'Float'
+    Integer = 'Integer'
+    String = 'String'
+    Boolean = 'Boolean'
+    Motor = 'Motor'
+    Moveable = 'Moveable'
+    MeasurementGroup = 'MeasurementGroup'
+    Controller = 'Controller'
+
+
+class UnknownEnv(Exception):
+    pass
+
+
+class Macro(object):
+
+    param_def = []
+
+    def __init__(self, env=None):
+        self.env = dict(env or {})
+        self.lines = []
+
+    def getEnv(self, name):
+        if name not in self.env:
+            raise UnknownEnv(name)
+        return self.env[name]
+
+    def setEnv(self, name, value):
+        self.env[name] = value
+
+    def output(self, msg, *args):
+        self.lines.append(msg % args if args else msg)
+
+    info = debug = warning = error = output
+
+    def checkPoint(self):
+        pass
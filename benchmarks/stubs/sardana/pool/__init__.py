@@ -0,0 +1 @@
+"""Stand-in for sardana.pool."""
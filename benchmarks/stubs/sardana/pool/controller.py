@@ -0,0 +1,112 @@
+"""Stand-in for sardana.pool.controller.
+
+Controllers get their properties as attributes, from the props passed to
+the constructor or from the DefaultValue of ctrl_properties/class_prop,
+like they do in the Pool.
+"""
+
+import logging
+
+from sardana import DataAccess
+from sardana.pool.poolmotor import PoolMotor
+
+Type = 'type'
+Description = 'description'
+DefaultValue = 'defaultvalue'
+Access = 'r/w type'
+FGet = 'fget'
+FSet = 'fset'
+Memorize = 'memorize'
+MaxDimSize = 'maxdimsize'
+
+
+def _default(info):
+    for key in (DefaultValue, 'DefaultValue'):
+        if key in info:
+            return info[key]
+    return None
+
+
+class Controller(object):
+
+    ctrl_properties = {}
+    class_prop = {}
+    axis_attributes = {}
+    ctrl_attributes = {}
+
+    def __init__(self, inst, props, *args, **kwargs):
+        self.inst_name = inst
+        self._log = logging.getLogger(inst)
+        properties = dict(self.class_prop)
+        properties.update(self.ctrl_properties)
+        for name, info in properties.items():
+            setattr(self, name, props.get(name, _default(info)))
+
+    def SendToCtrl(self, stream):
+        raise NotImplementedError("SendToCtrl not implemented")
+
+
+class MotorController(Controller):
+
+    def PreStateAll(self):
+        pass
+
+    def PreStateOne(self, axis):
+        pass
+
+    def StateAll(self):
+        pass
+
+    def PreReadAll(self):
+        pass
+
+    def PreReadOne(self, axis):
+        pass
+
+    def ReadAll(self):
+        pass
+
+
+class PseudoMotorController(Controller):
+
+    pseudo_motor_roles = ()
+    motor_roles = ()
+
+    def __init__(self, inst, props, *args, **kwargs):
+        Controller.__init__(self, inst, props, *args, **kwargs)
+        self._motors = {}
+
+    def GetMotor(self, index_or_role):
+        if not isinstance(index_or_role, str):
+            index_or_role = self.motor_roles[index_or_role - 1]
+        motor = self._motors.get(index_or_role)
+        if motor is None:
+            motor = self._motors[index_or_role] = PoolMotor(index_or_role)
+        return motor
+
+
+class CounterTimerController(Controller):
+
+    def PreStateAll(self):
+        pass
+
+    def PreStateOne(self, axis):
+        pass
+
+    def StateAll(self):
+        pass
+
+    def PreReadAll(self):
+        pass
+
+    def PreReadOne(self, axis):
+        pass
+
+    def ReadAll(self):
+        pass
+
+    def PreLoadAll(self):
+        pass
+
+    def LoadAll(self):
+        pass
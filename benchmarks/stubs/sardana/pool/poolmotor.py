@@ -0,0 +1,18 @@
+"""Stand-in for sardana.pool.poolmotor."""
+
+
+class Position(object):
+    """The cached position (a SardanaAttribute in sardana)."""
+
+    def __init__(self, value=None):
+        self.value = value
+
+
+class PoolMotor(object):
+
+    def __init__(self, name):
+        self.name = name
+        self._position = Position()
+
+    def get_position(self, cache=True, propagate=1):
+        return self._position
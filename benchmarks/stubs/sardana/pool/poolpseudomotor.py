@@ -0,0 +1,17 @@
+"""Stand-in for sardana.pool.poolpseudomotor."""
+
+from sardana.pool.poolmotor import Position
+
+
+class PoolPseudoMotor(object):
+
+    def __init__(self, name, user_elements=()):
+        self.name = name
+        self._user_elements = list(user_elements)
+        self._position = Position()
+
+    def get_position(self, cache=True, propagate=1):
+        return self._position
+
+    def get_user_elements(self):
+        return self._user_elements
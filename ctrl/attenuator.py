@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+
+"""Pure calculations of the BCU attenuator wheels.
+
+The transmission of a wheel combination is
+exp(-(L_Al / att_Al(E) + L_Ti / att_Ti(E))): it only depends on the total
+thickness of each material, which does not depend on the energy. A
+ThicknessIndex holds, once for all energies, the distinct (total
+thickness per material) rows over all wheel combinations; at a new energy
+the transmission of every candidate is one dot product of its row with
+the attenuation coefficients -1/att(E) of the materials, and the search
+is one argmin over the candidates.
+
+The index and its per-energy transmissions are read-only and cached, so
+any number of threads can share them without locking.
+
+    # wheels: ((lengths, model coefficients), ...) for the 3 wheels, as tuples
+    index = thickness_index(wheels)
+    positions, actual = index.best_positions(5.0, 12.7)
+    index.transmission(positions, 12.7)  # == actual
+    angles = positions_to_angles(positions)
+    transmissions, angles = index.spectrum(12.7)  # all the achievable ones
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import math
+
+import numpy as np
+
+N_POSITIONS = 10
+ANGLES = tuple(float(a) for a in range(0, 360, 36))
+# [keV], the range of the attenuation length models
+ENERGY_RANGE = (5.0, 30.0)
+
+# energies [keV] with cached transmissions, per index; cleared when full
+CACHE_SIZE = 64
+_indexes = {}
+
+
+class ThicknessIndex(object):
+    """The distinct material thicknesses of all the wheel combinations.
+
+    models are the distinct attenuation length models (materials),
+    thickness[i] the total thickness of each of them for candidate i and
+    positions[i] the first wheel combination, in (p1, p2, p3) order,
+    giving it, as a tuple, and angles[i] its wheel angles.
+    combination[p1, p2, p3] is the candidate of a combination.
+    """
+
+    __slots__ = ('models', 'thickness', 'positions', 'angles', 'combination', '_cache',
+                 '_spectra')
+
+    def __init__(self, wheels):
+        models = []
+        for lengths, model in wheels:
+            if model not in models:
+                models.append(model)
+        shape = tuple(len(lengths) for lengths, model in wheels)
+        positions = np.indices(shape).reshape(len(shape), -1).T
+        thickness = np.zeros((len(positions), len(models)))
+        for wheel, (lengths, model) in enumerate(wheels):
+            thickness[:, models.index(model)] += np.asarray(lengths, dtype=float)[positions[:, wheel]]
+        rows, first, inverse = np.unique(thickness, axis=0, return_index=True,
+                                         return_inverse=True)
+        # candidates in the order of their first combination, for the ties
+        order = np.argsort(first, kind='mergesort')
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        self.models = tuple(models)
+        self.thickness = rows[order]
+        self.positions = tuple(tuple(int(p) for p in row) for row in positions[first[order]])
+        self.angles = np.asarray(ANGLES)[positions[first[order]]]
+        self.combination = rank[inverse.ravel()].reshape(shape)
+        for array in (self.thickness, self.angles, self.combination):
+            array.flags.writeable = False
+        self._cache = {}
+        self._spectra = {}
+
+    def transmissions(self, energy):
+        """Read-only transmission [%] of every candidate at energy [keV]."""
+        result = self._cache.get(energy)
+        if result is None:
+            if not ENERGY_RANGE[0] <= energy <= ENERGY_RANGE[1]:
+                raise ValueError("energy value %s keV out of range" % energy)
+            coefficients = np.array([-1.0 / np.polyval(model, energy) for model in self.models])
+            result = np.exp(self.thickness.dot(coefficients)) * 100.0
+            result.flags.writeable = False
+            if len(self._cache) >= CACHE_SIZE:
+                self._cache.clear()
+            self._cache[energy] = result
+        return result
+
+    def spectrum(self, energy):
+        """The achievable transmissions [%] at energy [keV], sorted and
+        distinct, and the wheel angles [deg] giving them, one row each.
+
+        Both arrays are read-only and shared; equal transmissions keep the
+        angles of the first combination, as best_positions() does.
+        """
+        result = self._spectra.get(energy)
+        if result is None:
+            values, first = np.unique(self.transmissions(energy), return_index=True)
+            angles = self.angles[first]
+            values.flags.writeable = False
+            angles.flags.writeable = False
+            result = (values, angles)
+            if len(self._spectra) >= CACHE_SIZE:
+                self._spectra.clear()
+            self._spectra[energy] = result
+        return result
+
+    def transmission(self, positions, energy):
+        """Total transmission [%] of the wheel positions (a tuple) at energy [keV]."""
+        return float(self.transmissions(energy)[self.combination[positions]])
+
+    def best_positions(self, transmission, energy):
+        """The wheel positions closest to transmission [%] and their actual value.
+
+        Ties go to the first combination in (p1, p2, p3) order, as in the
+        brute force search the controller used to do.
+        """
+        values = self.transmissions(energy)
+        candidate = int(np.argmin(np.abs(transmission - values)))
+        return self.positions[candidate], float(values[candidate])
+
+
+def thickness_index(wheels):
+    """The (cached) ThicknessIndex of wheels, ((lengths, model), ...) tuples."""
+    index = _indexes.get(wheels)
+    if index is None:
+        index = _indexes.setdefault(wheels, ThicknessIndex(wheels))
+    return index
+
+
+def angle_to_position(motor_angle):
+    """The closest wheel position for a motor angle [deg]."""
+    if motor_angle > 342:
+        return 0
+    elif motor_angle % 36 > 18:
+        return int(math.ceil(motor_angle / 36))
+    else:
+        return int(math.floor(motor_angle / 36))
+
+
+def positions_to_angles(positions):
+    return tuple(ANGLES[p] for p in positions)
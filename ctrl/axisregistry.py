@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+
+"""Per-axis state of the motor controllers.
+
+An AxisRegistry gives every axis an AxisRecord with fixed slots for its
+proxies, limits, deadband and the last position read, so StateOne/ReadOne/
+StartOne cost one dict lookup and plain attribute accesses. Proxies
+created in the background by ctrl.connect wait in record.pending until
+connected() installs them, and record.history keeps the recent positions
+and states (ctrl.history).
+
+    axes = AxisRegistry(lower_limit=4, upper_limit=38,
+                        names={'TangoAttribute': 'proxy',
+                               'UpperLimit': 'upper_limit'})
+    record = axes.add(1)
+    record.upper_limit = 30
+    axes.get_par(1, 'UpperLimit')    # 30.0, extra parameters by Pool name
+    axes.set_par(1, 'velocity', 2)   # unknown names go to record.pars
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+from ctrl.connect import collect
+from ctrl.history import SIZE as HISTORY_SIZE, History
+
+NAN = float('nan')
+INF = float('inf')
+
+# the numeric fields, stored as floats
+FIELDS = ('lower_limit', 'upper_limit', 'deadband', 'position')
+
+
+class AxisRecord(object):
+    """One axis: its proxies, its numeric state and its other parameters."""
+
+    __slots__ = ('axis', 'proxy', 'on_target', 'pars', 'pending', 'history',
+                 'lower_limit', 'upper_limit', 'deadband', 'position')
+
+    def __init__(self, axis, history_size, lower_limit=-INF, upper_limit=INF, deadband=0.0):
+        self.axis = axis
+        self.proxy = None
+        self.on_target = None
+        self.pars = {}
+        # {extra parameter name: ctrl.connect.Connection} still connecting
+        self.pending = {}
+        self.history = History(history_size)
+        self.lower_limit = lower_limit
+        self.upper_limit = upper_limit
+        self.deadband = deadband
+        # the last value ReadOne returned, nan before the first one
+        self.position = NAN
+
+    def in_limits(self, pos):
+        return self.lower_limit < pos <= self.upper_limit
+
+
+class AxisRegistry(dict):
+    """The AxisRecords of a controller: {axis number: AxisRecord}.
+
+    A dict, so that self.axes[axis] in StateOne/ReadOne/StartOne is a plain
+    dict lookup. names maps the Pool names of extra parameters to
+    AxisRecord attributes for get_par() and set_par(). Every axis keeps
+    history_size samples of history.
+    """
+
+    def __init__(self, lower_limit=-INF, upper_limit=INF, deadband=0.0, names=None,
+                 history_size=HISTORY_SIZE):
+        dict.__init__(self)
+        self.defaults = (float(lower_limit), float(upper_limit), float(deadband))
+        self.names = dict(names or {})
+        self.history_size = history_size
+
+    def add(self, axis):
+        """Create (or reset) the record of axis with the default values."""
+        record = self[axis] = AxisRecord(axis, self.history_size, *self.defaults)
+        return record
+
+    def remove(self, axis):
+        del self[axis]
+
+    def __iter__(self):
+        return iter(sorted(dict.keys(self)))
+
+    def get_par(self, axis, name):
+        """An extra parameter by its Pool name."""
+        record = self[axis]
+        field = self.names.get(name)
+        if field is None:
+            return record.pars[name]
+        return getattr(record, field)
+
+    def set_par(self, axis, name, value):
+        record = self[axis]
+        field = self.names.get(name)
+        if field is None:
+            record.pars[name] = value
+        elif field in FIELDS:
+            setattr(record, field, float(value))
+        else:
+            setattr(record, field, value)
+
+    def connected(self, record, log, wait=True):
+        """Install the proxies of record that finished connecting; False
+        while some are still connecting (only without wait)."""
+        if not record.pending:
+            return True
+        return collect(record.pending, lambda name, proxy: self.set_par(record.axis, name, proxy),
+                       log, wait)
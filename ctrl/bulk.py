@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+
+"""Bulk commands on many axes of a motor controller through SendToCtrl.
+
+A macro coordinating dozens of axes sends one JSON command instead of one
+Pool call per axis; the per-axis Tango calls run concurrently in a pool of
+BIOMAX_CTRL_BULK_WORKERS threads (default 32) and the reply holds all the
+results:
+
+    ctrl.SendToCtrl('{"cmd": "read", "axes": [1, 2]}')   # "axes" defaults to all
+    ctrl.SendToCtrl('{"cmd": "move", "positions": {"1": 20.0, "2": 21.5}}')
+
+    {"cmd": "move", "results": {"1": true, "2": false},
+     "errors": {}, "seconds": 0.012}
+
+Other keys of the request are passed to the command as keyword arguments
+(e.g. "since" of the history command). A failing axis shows up in
+"errors" ({axis: message}) and does not stop the others. The moves are
+plain writes of the Tango attributes, with the limits and deadband of the
+axis: the Pool learns about them from StateOne only, like for a move made
+from Jive. Input that is not a JSON object with a "cmd" gets the empty
+reply SendToCtrl always gave. An axis still busy after
+BIOMAX_CTRL_BULK_TIMEOUT seconds (default 30) is reported in "errors" as
+timed out.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import json
+import os
+import time
+
+from ctrl.workers import WorkerPool, run_all
+
+# where a command finds its axes in the request: a list of axes, or
+# {axis: value} to pass to the command with each axis; a GROUPED command
+# gets the list of axes at once and returns {axis: result or Exception}
+AXES = 'axes'
+POSITIONS = 'positions'
+GROUPED = 'grouped'
+
+POOL = WorkerPool(int(os.environ.get('BIOMAX_CTRL_BULK_WORKERS', 32)), 'ctrl-bulk')
+
+TIMEOUT = float(os.environ.get('BIOMAX_CTRL_BULK_TIMEOUT', 30))
+
+
+def attr_time(reading):
+    """The timestamp [s since the epoch] of a DeviceAttribute."""
+    stamp = reading.time
+    totime = getattr(stamp, 'totime', None)
+    return totime() if totime is not None else float(stamp)
+
+
+def _default(value):
+    # numpy scalars and arrays, Tango enums
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def reply(data):
+    return json.dumps(data, sort_keys=True, default=_default)
+
+
+def dispatch(in_data, commands, axes, log):
+    """Run a bulk command; commands is {cmd: (AXES, POSITIONS or GROUPED, func)}.
+
+    func(axis, **options) or func(axis, value, **options) does the work
+    for one axis and returns its JSON-able result; a GROUPED func([axes],
+    **options) does it for all the axes, running its own Tango calls.
+    """
+    try:
+        request = json.loads(in_data)
+    except ValueError:
+        return ""
+    if not isinstance(request, dict) or 'cmd' not in request:
+        return ""
+    cmd = request['cmd']
+    if cmd not in commands:
+        return reply({'cmd': cmd, 'error': "unknown command, expected one of %s"
+                      % ", ".join(sorted(commands))})
+    kind, func = commands[cmd]
+    start = time.time()
+    results = {}
+    errors = {}
+    calls = []
+    try:
+        if kind == POSITIONS:
+            items = [(int(axis), float(value))
+                     for axis, value in request[POSITIONS].items()]
+        else:
+            items = [(int(axis), None) for axis in request.get(AXES) or list(axes)]
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        return reply({'cmd': cmd, 'error': "bad request: %s" % str(e)})
+    options = dict((str(key), value) for key, value in request.items()
+                   if key not in ('cmd', AXES, POSITIONS))
+    if kind == GROUPED:
+        try:
+            outcome = func([axis for axis, _ in items if axis in axes], **options)
+        except Exception as e:
+            log.error("error in bulk %s: %s" % (cmd, str(e)))
+            return reply({'cmd': cmd, 'error': str(e)})
+        items = [(axis, None) for axis, _ in items if axis not in axes]
+        for axis, result in outcome.items():
+            if isinstance(result, Exception):
+                log.error("(%d) error in bulk %s: %s" % (axis, cmd, str(result)))
+                errors[axis] = str(result)
+            else:
+                results[axis] = result
+    for axis, value in items:
+        if axis not in axes:
+            errors[axis] = "no axis %d" % axis
+        elif kind == POSITIONS:
+            calls.append((axis, lambda axis=axis, value=value: func(axis, value, **options)))
+        else:
+            calls.append((axis, lambda axis=axis: func(axis, **options)))
+    for task in run_all(POOL, calls, TIMEOUT):
+        if task.error is not None:
+            log.error("(%d) error in bulk %s: %s" % (task.name, cmd, str(task.error)))
+            errors[task.name] = str(task.error)
+        else:
+            results[task.name] = task.result
+    return reply({'cmd': cmd, 'results': results, 'errors': errors,
+                  'seconds': time.time() - start})
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+
+"""Background creation of the Tango proxies of the controllers.
+
+Creating a DeviceProxy/AttributeProxy to an unreachable device blocks for
+the Tango connection timeout. The motor controllers hand the creation to
+connect(), which runs it in a shared pool of daemon threads and returns a
+Connection right away, so the Pool starts in the time of the slowest
+device instead of the sum over all of them. Until collect() has installed
+a proxy the axis reports State.Init ("connecting").
+
+    pending = {'motorProxy': connect('my/tango/dev',
+                                     lambda: DeviceProxy('my/tango/dev'))}
+    ...
+    if not collect(pending, install, self._log, wait=False):
+        return (State.Init, 'Connecting', 0)
+
+The pool has BIOMAX_CTRL_CONNECT_WORKERS threads (default 16), started
+on demand. collect() waits at most BIOMAX_CTRL_CONNECT_TIMEOUT seconds
+(default 10) for all its connections, then raises and leaves the
+unfinished ones pending.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import os
+import threading
+import time
+
+from ctrl.workers import Task, WorkerPool
+
+# a Task whose result is the proxy
+Connection = Task
+
+POOL = WorkerPool(int(os.environ.get('BIOMAX_CTRL_CONNECT_WORKERS', 16)), 'ctrl-connect')
+
+TIMEOUT = float(os.environ.get('BIOMAX_CTRL_CONNECT_TIMEOUT', 10))
+
+# the Pool calls the controllers from several threads at once
+_lock = threading.Lock()
+
+
+def connect(name, factory):
+    """Start creating a proxy with factory() in the background."""
+    return POOL.submit(Connection(name, factory))
+
+
+def collect(pending, install, log, wait=True, timeout=TIMEOUT):
+    """Install the finished connections of pending ({name: Connection}).
+
+    install(name, proxy) gets None for a connection that failed, which is
+    logged. Without wait the ones still connecting are left in pending;
+    with wait, one still connecting timeout [s] after the call (for all
+    of them) raises. Returns True when nothing is pending any more.
+    """
+    deadline = time.time() + timeout
+    for name, connection in list(pending.items()):
+        if not connection.ready():
+            if not wait:
+                continue
+            try:
+                connection.get(max(deadline - time.time(), 0))
+            except Exception:
+                pass
+            if not connection.ready():
+                raise Exception("still connecting to %s after %g s" % (connection.name, timeout))
+        with _lock:
+            # another thread installed it, or a new connection replaced it
+            if pending.get(name) is not connection:
+                continue
+            del pending[name]
+        try:
+            proxy = connection.get()
+        except Exception as e:
+            log.error("error connecting to %s: %s" % (connection.name, str(e)))
+            proxy = None
+        install(name, proxy)
+    return not pending
@@ -0,0 +1,159 @@
+from PyTango import AttributeProxy
+from PyTango import DevFailed
+
+from sardana import State, DataAccess
+from sardana.pool.controller import CounterTimerController
+from sardana.pool.controller import Type, Access, Description, DefaultValue
+
+from ctrl.axisregistry import AxisRegistry
+from ctrl.bulk import AXES, dispatch
+from ctrl.connect import connect
+from ctrl.instrumentation import instrumented, wrap_proxy
+from ctrl.sampler import Sampler, STATISTICS
+
+
+TANGO_ATTR = 'TangoAttribute'
+STATISTIC = 'Statistic'
+
+# based on the IVU gap attribute motor controller, sampling instead of moving
+
+@instrumented
+class TangoAttrSamplerController(CounterTimerController):
+    """This controller offers as many channels as the user wants.
+    During an acquisition every channel samples its Tango attribute in a
+    background thread at SampleRate [Hz] and returns a statistic of the
+    samples of the acquisition, so a scan can record the stability of
+    the gap or a piezo next to its data.
+    Each channel has the extra attributes:
+    +) TangoAttribute - _MUST_HAVE_ Tango attribute to sample
+    +) Statistic - optional, one of mean (default), std, count, min, max
+    Channels with the same TangoAttribute share its samples. As examples
+    you could have:
+    ch1.TangoAttribute = 'r3-311l/id/idivu-01_gap/Gap'
+    ch2.TangoAttribute = 'r3-311l/id/idivu-01_gap/Gap'
+    ch2.Statistic = 'std'
+    """
+
+    gender = "Sampler"
+    model = ""
+    organization = "MaxIV"
+
+    MaxDevice = 64
+
+    ctrl_properties = {'SampleRate':
+                        {Type: float,
+                         Description: 'Samples per second and attribute during an acquisition',
+                         DefaultValue: 100},
+                       'BufferSize':
+                        {Type: int,
+                         Description: 'Samples kept per attribute and acquisition',
+                         DefaultValue: 10000}
+                       }
+
+    axis_attributes ={TANGO_ATTR:
+                        {Type: str
+                         , Description: 'The Tango Attribute to sample (e.g. my/tango/dev/Gap)'
+                         ,Access: DataAccess.ReadWrite},
+                      STATISTIC:
+                        {Type: str
+                         , Description: 'The value of the channel: %s' % ', '.join(STATISTICS)
+                         , DefaultValue: 'mean'
+                         ,Access: DataAccess.ReadWrite},
+                     }
+
+    def __init__(self, inst, props, *args, **kwargs):
+        CounterTimerController.__init__(self, inst, props, *args, **kwargs)
+        self.axes = AxisRegistry(names={'proxy': 'proxy'}, history_size=0)
+        self.sampler = Sampler(float(self.SampleRate), int(self.BufferSize), self._log)
+        self.integration_time = 1.0
+        self.starting = {}
+
+    def AddDevice(self, axis):
+        record = self.axes.add(axis)
+        record.pars[TANGO_ATTR] = ''
+        record.pars[STATISTIC] = 'mean'
+
+    def DeleteDevice(self, axis):
+        self.axes.remove(axis)
+
+    def StateOne(self, axis):
+        try:
+            record = self.axes[axis]
+            if not self.axes.connected(record, self._log, wait=False):
+                return (State.Init, "connecting", 0)
+            if record.proxy is None:
+                return (State.Alarm, "attribute proxy is None", 0)
+            buf = self.sampler.buffers.get(record.pars[TANGO_ATTR])
+            if buf is not None and buf.error is not None:
+                return (State.Alarm, "Exception: %s" % buf.error, 0)
+            if self.sampler.acquiring:
+                return (State.Moving, 'Acquiring', 0)
+            return (State.On, 'On', 0)
+        except Exception, e:
+            self._log.error(" (%d) error getting state: %s" % (axis, str(e)))
+            return (State.Alarm, "Exception: %s" % str(e), 0)
+
+    def LoadOne(self, axis, value, *args):
+        self.integration_time = value
+
+    def PreStartAll(self):
+        self.starting = {}
+
+    def PreStartOne(self, axis, value=None):
+        record = self.axes[axis]
+        self.axes.connected(record, self._log)
+        return not record.proxy is None
+
+    def StartOne(self, axis, value=None):
+        record = self.axes[axis]
+        self.starting[record.pars[TANGO_ATTR]] = record.proxy
+
+    def StartAll(self):
+        self.sampler.start(self.starting, self.integration_time)
+
+    def ReadOne(self, axis):
+        record = self.axes[axis]
+        return self.sampler.statistic(record.pars[TANGO_ATTR], record.pars[STATISTIC])
+
+    def AbortOne(self, axis):
+        self.sampler.stop()
+
+    def StopOne(self, axis):
+        self.sampler.stop()
+
+    def GetAxisExtraPar(self, axis, name):
+        return self.axes[axis].pars[name]
+
+    def SetAxisExtraPar(self, axis, name, value):
+        self._log.debug("SetExtraAttributePar [%d] %s = %s" % (axis, name, value))
+        record = self.axes[axis]
+        if name == STATISTIC:
+            if value not in STATISTICS:
+                raise Exception("Statistic must be one of %s" % ", ".join(STATISTICS))
+            record.pars[name] = value
+        elif name == TANGO_ATTR:
+            try:
+                record.pars[name] = value
+                # created in the background, the channel is Init until then
+                record.proxy = None
+                record.pending['proxy'] = connect(
+                    value, lambda: wrap_proxy(AttributeProxy(value), self, value))
+            except DevFailed, df:
+                de = df[0]
+                self._log.error("SetExtraAttribute DevFailed: (%s) %s" % (de.reason, de.desc))
+            except Exception, e:
+                self._log.error("SetExtraAttribute Exception: %s" % str(e))
+
+    def _bulk_samples(self, axis):
+        buf = self.sampler.buffers.get(self.axes[axis].pars[TANGO_ATTR])
+        if buf is None:
+            return {'time': [], 'value': []}
+        times, values = buf.samples()
+        return {'time': times.tolist(), 'value': values.tolist()}
+
+    def SendToCtrl(self, in_data):
+        """Bulk commands, see ctrl.bulk:
+        {"cmd": "samples", "axes": [1]} -> the samples of the last acquisition
+        """
+        return dispatch(in_data, {'samples': (AXES, self._bulk_samples)},
+                        self.axes, self._log)
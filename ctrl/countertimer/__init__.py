@@ -0,0 +1,7 @@
+#!/usr/bin/env python
+
+
+"""Counter/timer controllers package."""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
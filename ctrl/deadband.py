@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+
+
+"""Deadband helpers shared by the motor and pseudo motor controllers.
+
+A deadband of 0 (the default everywhere) disables the check, so the
+controllers behave exactly as before unless it is configured.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+
+def within_deadband(target, current, deadband):
+    """Return True if moving from current to target would be a no-op."""
+    return deadband > 0 and abs(target - current) <= deadband
+
+
+def pass_through(targets, currents, deadbands):
+    """Replace each target by the current position when the change is
+    below its deadband, so the physical motor is not moved at all."""
+    return tuple(current if within_deadband(target, current, deadband) else target
+                 for target, current, deadband in zip(targets, currents, deadbands))
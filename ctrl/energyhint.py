@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+
+"""Target energies of the energy moves, for the controllers depending on it.
+
+The energy pseudo motors announce the energy a move goes to as soon as
+they calculate its physical positions, and the controllers that need the
+energy afterwards (the attenuator, the IVU) prepare for it in the
+background while the mono is still moving:
+
+    # in the controller depending on the energy
+    subscribe(self, 'prepare_energy')    # prepare_energy(energy [eV])
+
+    # in the energy pseudo motor
+    announce(mono_energy)                # [eV]
+
+A controller is only referenced weakly, so it is dropped once the Pool
+deletes it. The subscribers run one after the other in a daemon thread,
+for the last energy announced only: announcing many energies quickly (a
+scan calculating its points) prepares for the last of them, and the same
+energy twice in a row does nothing.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import threading
+import weakref
+
+from ctrl.workers import Task, WorkerPool
+
+POOL = WorkerPool(1, 'ctrl-energy-hint')
+
+_lock = threading.Lock()
+# [(weak reference to the controller, method name)]
+_subscribers = []
+# [last energy announced, energy to prepare for or None]
+_state = [None, None]
+
+
+def subscribe(owner, method):
+    """Call owner.method(energy) in the background for every new target energy."""
+    with _lock:
+        _subscribers.append((weakref.ref(owner), method))
+
+
+def _prepare():
+    with _lock:
+        energy, _state[1] = _state[1], None
+        owners = []
+        for subscriber in list(_subscribers):
+            owner = subscriber[0]()
+            if owner is None:
+                _subscribers.remove(subscriber)
+            else:
+                owners.append((owner, subscriber[1]))
+    for owner, method in owners:
+        try:
+            getattr(owner, method)(energy)
+        except Exception as e:
+            owner._log.warning("preparing for %s eV failed: %s" % (energy, str(e)))
+
+
+def announce(energy):
+    """A move to energy [eV] is starting."""
+    with _lock:
+        if energy == _state[0]:
+            return
+        queued = _state[1] is not None
+        _state[0] = _state[1] = energy
+    if not queued:
+        POOL.submit(Task('prepare', _prepare))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+
+"""The kinematics of the energy controllers, with their Pool configuration.
+
+The macros planning energy moves (energy_flyscan, energy_scan_order)
+calculate the mono bragg and x2per of Energy and the IVU gap of IVUEnergy
+for many energies at once. They must use the properties the controllers
+run with, not the class defaults: from_pool() reads them from the
+controllers in the Pool, taking the DefaultValue of the controller class
+only for a property the controller does not set either, as the Pool does.
+
+    model = from_pool(lambda name: self.getObj(name, type_class=Type.Controller),
+                      self._env('EnergyController', ENERGY_CTRL),
+                      self._env('IVUEnergyController', IVU_CTRL))
+    bragg, x2per = model.mono(energies)
+    gap = model.gap(energies)
+
+A controller that cannot be read, or a gap table the IVU controller would
+not use, raises.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import json
+
+import numpy as np
+
+from ctrl.pseudomotor.EnergyController import Energy
+from ctrl.pseudomotor.IVUEnergyController import IVUEnergy, check_table
+
+# the default names of the controllers in the Pool
+ENERGY_CTRL = 'energy_ctrl'
+IVU_CTRL = 'ivu_energy_ctrl'
+
+ENERGY_PROPERTIES = ('hc', 'dist', 'off')
+IVU_PROPERTIES = ('energy_array', 'position_array')
+
+
+class EnergyModel(object):
+    """Energy and IVUEnergy calculations for arrays of energies [eV]."""
+
+    def __init__(self, hc, dist, off, table_energies, table_positions):
+        self.hc = float(hc)
+        self.dist = float(dist)
+        self.off = float(off)
+        self.table_energies, self.table_positions = check_table(
+            np.asarray(table_energies, dtype=float), np.asarray(table_positions, dtype=float))
+
+    def mono(self, energies):
+        """(bragg [deg], x2per [mm]) arrays, as Energy.CalcAllPhysical."""
+        bragg = np.degrees(np.arcsin(self.hc / (self.dist * np.asarray(energies, dtype=float))))
+        return bragg, self.off / (2 * np.cos(np.radians(bragg)))
+
+    def energy(self, bragg):
+        """Energies [eV] of bragg angles [deg], as Energy.CalcAllPseudo."""
+        return np.abs(self.hc / (self.dist * np.cos(np.radians(90 - np.asarray(bragg)))))
+
+    def gap(self, energies):
+        """IVU gaps [mm], as IVUEnergy.CalcAllPhysical."""
+        return np.interp(energies, self.table_energies, self.table_positions)
+
+    def covers(self, energies):
+        """Whether the gap table reaches energies; IVUEnergy would move
+        the gap of the closest end of the table for the others."""
+        energies = np.asarray(energies, dtype=float)
+        return bool(((energies >= self.table_energies[0]) &
+                     (energies <= self.table_energies[-1])).all())
+
+
+def _defaults(properties):
+    return dict((name, prop['DefaultValue']) for name, prop in properties.items())
+
+
+def read_properties(controller, names, defaults):
+    """{name: value} of the properties of a controller device, as strings;
+    defaults for the ones it does not set."""
+    found = controller.get_property(list(names))
+    values = {}
+    for name in names:
+        value = found.get(name)
+        # Tango gives the lines of a property, [] when it is not set
+        values[name] = ' '.join(value) if value else defaults[name]
+    return values
+
+
+def from_pool(get_controller, energy_ctrl, ivu_ctrl):
+    """The EnergyModel of the Energy controller energy_ctrl and the
+    IVUEnergy controller ivu_ctrl; get_controller(name) gives the Pool
+    controller (a Tango device) of a name."""
+    try:
+        energy = read_properties(get_controller(energy_ctrl), ENERGY_PROPERTIES,
+                                 _defaults(Energy.class_prop))
+        ivu = read_properties(get_controller(ivu_ctrl), IVU_PROPERTIES,
+                              _defaults(IVUEnergy.ctrl_properties))
+    except Exception as e:
+        raise Exception("cannot read the properties of the energy controllers %s and %s: %s"
+                        % (energy_ctrl, ivu_ctrl, str(e)))
+    return EnergyModel(energy['hc'], energy['dist'], energy['off'],
+                       json.loads(ivu['energy_array']), json.loads(ivu['position_array']))
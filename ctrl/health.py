@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+
+"""Health of the Tango devices behind the controllers, read all at once.
+
+The motor controllers and MirrorStripChooser answer
+
+    ctrl.SendToCtrl('{"cmd": "health"}')
+
+with, per axis, the state, status, position and attribute quality of the
+device behind it, its PowerOn when it has one, and the state of the
+interlock device when there is one:
+
+    {"device": "b311a/mot/m1", "state": "ON", "status": "...",
+     "position": 12.0, "quality": "ATTR_VALID", "power": true,
+     "interlock": null}
+
+read_devices() reads every device with a single read_attributes call,
+and all the devices concurrently in the ctrl.bulk pool, so the time of a
+check is the time of the slowest device. Attributes a device does not
+have are left out (its attribute list is read once), and a device that
+cannot be read, or not within BIOMAX_CTRL_HEALTH_TIMEOUT seconds (default
+10), gives its error instead of the readings.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import os
+import threading
+
+from PyTango import DeviceProxy
+
+from ctrl.bulk import POOL, attr_time
+from ctrl.workers import run_all
+
+# {device name: (DeviceProxy, set of lower-case attribute names)}
+_devices = {}
+_lock = threading.Lock()
+
+TIMEOUT = float(os.environ.get('BIOMAX_CTRL_HEALTH_TIMEOUT', 10))
+
+
+def split(attribute):
+    """('dev/fam/member', 'attr') of 'dev/fam/member/attr'."""
+    device, _, name = attribute.rpartition('/')
+    return device, name
+
+
+def _device(name):
+    with _lock:
+        found = _devices.get(name)
+    if found is None:
+        proxy = DeviceProxy(name)
+        found = (proxy, set(attr.lower() for attr in proxy.get_attribute_list()))
+        with _lock:
+            _devices[name] = found
+    return found
+
+
+def _read(name, attributes):
+    proxy, available = _device(name)
+    present = [attr for attr in attributes if attr.lower() in available]
+    readings = {}
+    for reading in proxy.read_attributes(present):
+        readings[reading.name.lower()] = reading
+    return readings
+
+
+def read_devices(groups, timeout=TIMEOUT):
+    """{device: {lower-case attribute name: DeviceAttribute} or the Exception}
+    for groups ({device: [attribute names]}); the devices not read within
+    timeout [s] get a "timed out" Exception."""
+    calls = [(name, lambda name=name, attributes=attributes: _read(name, attributes))
+             for name, attributes in groups.items()]
+    return dict((task.name, task.error if task.error is not None else task.result)
+                for task in run_all(POOL, calls, timeout))
+
+
+def _value(readings, attribute):
+    reading = readings.get(attribute.lower())
+    if reading is None or getattr(reading, 'has_failed', False):
+        return None
+    return reading.value
+
+
+def axis_health(devices, device, position=None, interlock=None):
+    """The health of an axis from read_devices() results: device has its
+    State/Status/PowerOn, position is the attribute name of the position
+    (on device), interlock another device whose State is checked."""
+    readings = devices[device]
+    if isinstance(readings, Exception):
+        raise readings
+    state = _value(readings, 'State')
+    power = _value(readings, 'PowerOn')
+    result = {'device': device,
+              'state': None if state is None else str(state),
+              'status': _value(readings, 'Status'),
+              'position': None, 'quality': None, 'time': None,
+              'power': None if power is None else bool(power),
+              'interlock': None}
+    reading = readings.get(position.lower()) if position else None
+    if reading is not None:
+        result['position'] = reading.value
+        result['quality'] = str(reading.quality)
+        result['time'] = attr_time(reading)
+    if interlock:
+        ilock = devices[interlock]
+        result['interlock'] = ("Exception: %s" % ilock if isinstance(ilock, Exception)
+                               else str(_value(ilock, 'State')))
+    return result
+
+
+def attribute_axes_health(attributes):
+    """{axis: health or Exception} of axes working on Tango attributes;
+    attributes is {axis: [attribute names]}, the position first, the values
+    of the others are added to the health by attribute name."""
+    groups = {}
+    for names in attributes.values():
+        for name in names:
+            if name:
+                device, attr = split(name)
+                group = groups.setdefault(device, ['State', 'Status', 'PowerOn'])
+                if attr not in group:
+                    group.append(attr)
+    devices = read_devices(groups)
+    result = {}
+    for axis, names in attributes.items():
+        try:
+            if not names or not all(names):
+                raise Exception("Tango attributes not set")
+            device, position = split(names[0])
+            health = axis_health(devices, device, position)
+            for name in names[1:]:
+                device, attr = split(name)
+                readings = devices[device]
+                health[attr] = None if isinstance(readings, Exception) else _value(readings, attr)
+            result[axis] = health
+        except Exception as e:
+            result[axis] = e
+    return result
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+
+"""Recent position and state history of the motor axes.
+
+Every AxisRecord owns a History: fixed-size numpy ring buffers of
+(timestamp, position, state) samples, filled with the values ReadOne and
+StateOne already read, so the history costs no Tango call. ReadOne adds a
+sample with the last known state; StateOne adds one only when the state
+changes, with the last known position, so the start and the end of every
+move are in the buffer even when the Pool is not reading the position.
+
+    history = History(1024)
+    history.add_position(12.5)
+    history.add_state(State.Moving)
+    history.query(since=time.time() - 60)
+    # {'time': [...], 'position': [...], 'state': ['ON', ...], 'summary': {...}}
+
+The motor controllers return it per axis with
+SendToCtrl('{"cmd": "history", "axes": [1], "since": 1500000000.0}').
+BIOMAX_CTRL_HISTORY sets the number of samples per axis (default 256,
+4 KB per axis read, 0 disables the history).
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import os
+import threading
+import time
+
+import numpy
+
+SIZE = int(os.environ.get('BIOMAX_CTRL_HISTORY', 256))
+
+NAN = float('nan')
+
+# state names by code; the codes are assigned as states show up
+_state_names = []
+_state_codes = {}
+_state_lock = threading.Lock()
+
+
+def state_code(state):
+    name = None if state is None else str(state)
+    code = _state_codes.get(name)
+    if code is None:
+        with _state_lock:
+            code = _state_codes.get(name)
+            if code is None:
+                code = _state_codes[name] = len(_state_names)
+                _state_names.append(name)
+    return code
+
+
+class History(object):
+    """The last size (timestamp, position, state) samples of an axis."""
+
+    __slots__ = ('size', 'times', 'positions', 'states', 'count', 'position', 'state', 'lock')
+
+    def __init__(self, size=SIZE):
+        self.size = size
+        # the buffers are allocated with the first sample, the axes never
+        # read cost no memory
+        self.times = self.positions = self.states = None
+        # samples ever added, the next one goes to count % size
+        self.count = 0
+        self.position = NAN
+        self.state = None
+        self.lock = threading.Lock()
+
+    def _add(self, position, state):
+        if not self.size:
+            return
+        with self.lock:
+            if self.times is None:
+                self.times = numpy.zeros(self.size)
+                self.positions = numpy.zeros(self.size)
+                self.states = numpy.zeros(self.size, numpy.uint8)
+            index = self.count % self.size
+            self.times[index] = time.time()
+            self.positions[index] = position
+            self.states[index] = state_code(state)
+            self.count += 1
+
+    def add_position(self, position):
+        self.position = position
+        self._add(position, self.state)
+
+    def add_state(self, state):
+        if state != self.state:
+            self.state = state
+            self._add(self.position, state)
+
+    def samples(self, since=None):
+        """(times, positions, state codes), oldest first, copies."""
+        with self.lock:
+            if self.times is None:
+                return numpy.zeros(0), numpy.zeros(0), numpy.zeros(0, numpy.uint8)
+            count = min(self.count, self.size)
+            order = numpy.arange(self.count - count, self.count) % self.size if count else []
+            times = self.times[order]
+            positions = self.positions[order]
+            states = self.states[order]
+        if since is not None:
+            keep = times >= since
+            times, positions, states = times[keep], positions[keep], states[keep]
+        return times, positions, states
+
+    def query(self, since=None):
+        """The samples as JSON-able lists, with a summary of the positions."""
+        times, positions, states = self.samples(since)
+        summary = {'count': len(times)}
+        valid = positions[~numpy.isnan(positions)]
+        if len(valid):
+            summary.update(mean=float(valid.mean()), std=float(valid.std()),
+                           min=float(valid.min()), max=float(valid.max()))
+        return {'time': times.tolist(), 'position': positions.tolist(),
+                'state': [_state_names[code] for code in states], 'summary': summary}
@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+
+
+"""Optional latency instrumentation for the controllers.
+
+Set BIOMAX_CTRL_STATS=1 in the Pool environment to enable it. Every
+controller decorated with instrumented() then records call counts and a
+log2 latency histogram for its hot methods (see HOT_METHODS), and every
+proxy returned by wrap_proxy() records the time spent in Tango calls, both
+per operation and charged to the controller method that issued it.
+
+The statistics are returned by SendToCtrl('stats') as JSON, cleared by
+SendToCtrl('stats_reset') and written to the controller log every
+BIOMAX_CTRL_STATS_PERIOD seconds (default 300).
+
+The same wrappers feed the event tracer of ctrl.tracing and the Tango
+traffic recorder of ctrl.tangorecord. When none of BIOMAX_CTRL_STATS,
+BIOMAX_CTRL_TRACE and BIOMAX_CTRL_RECORD is set instrumented(), timed()
+and wrap_proxy() return their argument unchanged, so the controllers run
+exactly the code they would without this module.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import json
+import os
+import threading
+import time
+from array import array
+from functools import wraps
+
+from ctrl.tangorecord import RECORDER, RECORDED_METHODS, RecordingProxy
+from ctrl.tracing import TRACER
+
+
+STATS_ENABLED = os.environ.get('BIOMAX_CTRL_STATS', '') not in ('', '0')
+DUMP_PERIOD = float(os.environ.get('BIOMAX_CTRL_STATS_PERIOD', 300))
+TIMING_ENABLED = STATS_ENABLED or TRACER is not None
+ENABLED = TIMING_ENABLED or RECORDER is not None
+
+HOT_METHODS = ('StateOne', 'ReadOne', 'StartOne', 'CalcAllPhysical', 'CalcAllPseudo')
+AXIS_METHODS = ('StateOne', 'ReadOne', 'StartOne')
+
+# bucket i counts the calls that took less than 2**i microseconds (and at
+# least 2**(i-1)), the last one everything above ~36 minutes
+N_BUCKETS = 32
+
+_clock = getattr(time, 'perf_counter', time.time)
+_local = threading.local()
+_create_lock = threading.Lock()
+
+
+class LatencyStats(object):
+    """Call counts, latency histograms and Tango time of one controller.
+
+    Every recorded name owns one slot in the flat arrays below; the
+    histogram array holds N_BUCKETS consecutive counters per slot.
+    """
+
+    __slots__ = ('lock', 'names', 'slots', 'counts', 'total', 'maximum',
+                 'tango_calls', 'tango_total', 'histogram', 'last_dump')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_dump = _clock()
+        self._clear()
+
+    def _clear(self):
+        self.names = []
+        self.slots = {}
+        self.counts = array('L')
+        self.total = array('d')
+        self.maximum = array('d')
+        self.tango_calls = array('L')
+        self.tango_total = array('d')
+        self.histogram = array('L')
+
+    def _slot(self, name):
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = len(self.names)
+            self.names.append(name)
+            self.counts.append(0)
+            self.total.append(0.0)
+            self.maximum.append(0.0)
+            self.tango_calls.append(0)
+            self.tango_total.append(0.0)
+            self.histogram.extend([0] * N_BUCKETS)
+            self.slots[name] = slot
+        return slot
+
+    def record(self, name, seconds, tango_seconds=0.0, tango_calls=0):
+        bucket = min(int(seconds * 1e6).bit_length(), N_BUCKETS - 1)
+        with self.lock:
+            slot = self._slot(name)
+            self.counts[slot] += 1
+            self.total[slot] += seconds
+            if seconds > self.maximum[slot]:
+                self.maximum[slot] = seconds
+            self.tango_calls[slot] += tango_calls
+            self.tango_total[slot] += tango_seconds
+            self.histogram[slot * N_BUCKETS + bucket] += 1
+
+    def reset(self):
+        with self.lock:
+            self._clear()
+
+    def snapshot(self):
+        """Return {name: summary} with all times in milliseconds."""
+        with self.lock:
+            result = {}
+            for slot, name in enumerate(self.names):
+                count = self.counts[slot]
+                buckets = self.histogram[slot * N_BUCKETS:(slot + 1) * N_BUCKETS].tolist()
+                while buckets and not buckets[-1]:
+                    buckets.pop()
+                result[name] = {
+                    'count': count,
+                    'total_ms': self.total[slot] * 1e3,
+                    'mean_ms': self.total[slot] * 1e3 / count if count else 0.0,
+                    'max_ms': self.maximum[slot] * 1e3,
+                    'p50_ms': _percentile(buckets, count, 0.50),
+                    'p99_ms': _percentile(buckets, count, 0.99),
+                    'tango_calls': self.tango_calls[slot],
+                    'tango_ms': self.tango_total[slot] * 1e3,
+                    'histogram_log2_us': buckets,
+                }
+            return result
+
+
+def _percentile(buckets, count, fraction):
+    """Upper bound (in ms) of the histogram bucket holding the percentile."""
+    if not count:
+        return 0.0
+    needed = fraction * count
+    seen = 0
+    for bucket, n in enumerate(buckets):
+        seen += n
+        if seen >= needed:
+            return (1 << bucket) / 1e3
+    return (1 << len(buckets)) / 1e3
+
+
+def get_stats(ctrl):
+    """Return the LatencyStats of a controller, creating it on first use."""
+    stats = ctrl.__dict__.get('_latency_stats')
+    if stats is None:
+        with _create_lock:
+            stats = ctrl.__dict__.get('_latency_stats')
+            if stats is None:
+                stats = ctrl.__dict__['_latency_stats'] = LatencyStats()
+    return stats
+
+
+def _frames():
+    frames = getattr(_local, 'frames', None)
+    if frames is None:
+        frames = _local.frames = []
+    return frames
+
+
+def _call(ctrl, name, func, args, kwargs):
+    """Run func timing it, and the Tango calls it makes, under name."""
+    frames = _frames()
+    frame = [0.0, 0]
+    frames.append(frame)
+    record = RECORDER is not None and name in RECORDED_METHODS and RECORDER.enter(ctrl)
+    result = exc = None
+    start = _clock()
+    try:
+        result = func(ctrl, *args, **kwargs)
+        return result
+    except Exception as e:
+        exc = e
+        raise
+    finally:
+        end = _clock()
+        frames.pop()
+        if frames:
+            frames[-1][0] += frame[0]
+            frames[-1][1] += frame[1]
+        if STATS_ENABLED:
+            stats = get_stats(ctrl)
+            stats.record(name, end - start, frame[0], frame[1])
+            _maybe_dump(ctrl, stats)
+        if TRACER is not None:
+            TRACER.span('%s.%s' % (type(ctrl).__name__, name), 'ctrl', start, end,
+                        _span_args(ctrl, name, args))
+        if record:
+            RECORDER.leave(ctrl)
+            RECORDER.call(ctrl, name, start, end, args, result, exc)
+
+
+def _span_args(ctrl, name, args):
+    span_args = {'ctrl': getattr(ctrl, 'inst_name', type(ctrl).__name__),
+                 'args': tuple(args)}
+    if name in AXIS_METHODS and args:
+        span_args['axis'] = args[0]
+    return span_args
+
+
+def _maybe_dump(ctrl, stats):
+    now = _clock()
+    if now - stats.last_dump < DUMP_PERIOD:
+        return
+    stats.last_dump = now
+    log = getattr(ctrl, '_log', None)
+    if log is not None:
+        log.info("latency stats: %s" % json.dumps(stats.snapshot(), sort_keys=True))
+
+
+def _record_tango(owner, name, start, end, args=()):
+    """Charge a Tango round-trip to its own entry and to the calling method."""
+    seconds = end - start
+    frames = _frames()
+    if frames:
+        frames[-1][0] += seconds
+        frames[-1][1] += 1
+    if STATS_ENABLED:
+        get_stats(owner).record('tango ' + name, seconds, seconds, 1)
+    if TRACER is not None:
+        TRACER.span(name, 'tango', start, end, {'args': tuple(args)})
+
+
+def _timed_method(name, method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return _call(self, name, method, args, kwargs)
+    return wrapper
+
+
+def _recorded_method(name, method):
+    """Record a Pool call that is not timed (e.g. SetAxisExtraPar)."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not RECORDER.enter(self):
+            return method(self, *args, **kwargs)
+        start = _clock()
+        try:
+            result = method(self, *args, **kwargs)
+        except Exception as e:
+            RECORDER.leave(self)
+            RECORDER.call(self, name, start, _clock(), args, exc=e)
+            raise
+        RECORDER.leave(self)
+        RECORDER.call(self, name, start, _clock(), args, result)
+        return result
+    return wrapper
+
+
+def _recorded_init(init):
+    @wraps(init)
+    def __init__(self, inst, props, *args, **kwargs):
+        init(self, inst, props, *args, **kwargs)
+        RECORDER.register(self, inst, props)
+    return __init__
+
+
+def _stats_send_to_ctrl(send):
+    def SendToCtrl(self, in_data):
+        command = in_data.strip()
+        if command == 'stats':
+            return json.dumps(get_stats(self).snapshot(), sort_keys=True)
+        if command == 'stats_reset':
+            get_stats(self).reset()
+            return 'ok'
+        if send is None:
+            return ""
+        return send(self, in_data)
+    return SendToCtrl
+
+
+def instrumented(cls):
+    """Class decorator timing the HOT_METHODS a controller defines."""
+    if not ENABLED:
+        return cls
+    for name in HOT_METHODS:
+        method = cls.__dict__.get(name)
+        if method is not None:
+            setattr(cls, name, _timed_method(name, method))
+    if RECORDER is not None:
+        cls.__init__ = _recorded_init(cls.__init__)
+        for name in RECORDED_METHODS:
+            method = cls.__dict__.get(name)
+            if method is not None and name not in HOT_METHODS:
+                setattr(cls, name, _recorded_method(name, method))
+    if STATS_ENABLED:
+        cls.SendToCtrl = _stats_send_to_ctrl(getattr(cls, 'SendToCtrl', None))
+    return cls
+
+
+def timed(method):
+    """Method decorator timing a slow internal step (e.g. power_on)
+    under its own name, nested in the hot method that calls it."""
+    if not ENABLED:
+        return method
+    return _timed_method(method.__name__, method)
+
+
+class TimedProxy(object):
+    """Wraps a DeviceProxy/AttributeProxy timing every Tango round-trip.
+
+    Reading a non-callable attribute (e.g. motor.Position), setting one and
+    calling any method are timed; looking up a method is not.
+    """
+
+    def __init__(self, proxy, owner, label):
+        object.__setattr__(self, '_proxy', proxy)
+        object.__setattr__(self, '_owner', owner)
+        object.__setattr__(self, '_label', label)
+
+    def __getattr__(self, name):
+        start = _clock()
+        value = getattr(self._proxy, name)
+        end = _clock()
+        if not callable(value):
+            _record_tango(self._owner, '%s.%s' % (self._label, name), start, end)
+            return value
+        owner = self._owner
+        op = '%s.%s' % (self._label, name)
+
+        def call(*args, **kwargs):
+            start = _clock()
+            try:
+                return value(*args, **kwargs)
+            finally:
+                _record_tango(owner, op, start, _clock(), args)
+        return call
+
+    def __setattr__(self, name, value):
+        start = _clock()
+        try:
+            setattr(self._proxy, name, value)
+        finally:
+            _record_tango(self._owner, '%s.%s=' % (self._label, name), start, _clock(), (value,))
+
+
+def wrap_proxy(proxy, owner, label):
+    """Return proxy, timed/traced on behalf of the owner controller and
+    recorded if enabled."""
+    if not ENABLED:
+        return proxy
+    if RECORDER is not None:
+        proxy = RecordingProxy(proxy, label, RECORDER)
+    if not TIMING_ENABLED:
+        return proxy
+    return TimedProxy(proxy, owner, label)
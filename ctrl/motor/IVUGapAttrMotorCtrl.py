@@ -4,7 +4,14 @@ from PyTango import DevFailed
 
 from sardana import State, DataAccess
 from sardana.pool.controller import MotorController
-from sardana.pool.controller import Type, Access, Description
+from sardana.pool.controller import Type, Access, Description, DefaultValue
+
+from ctrl.axisregistry import AxisRegistry
+from ctrl.bulk import AXES, GROUPED, POSITIONS, attr_time, dispatch
+from ctrl.connect import connect
+from ctrl.deadband import within_deadband
+from ctrl.health import attribute_axes_health
+from ctrl.instrumentation import instrumented, wrap_proxy
 
 import math
 import time
@@ -13,17 +20,21 @@ import time
 TANGO_ATTR = 'TangoAttribute'
 TANGO_UPPER_LIMIT = 'UpperLimit'
 TANGO_LOWER_LIMIT = 'LowerLimit'
+DEADBAND = 'Deadband'
 
 # based on the tango attr motor controller, removed stuff and adapt to ivu needs
 
+@instrumented
 class IVUGapAttrMotorController(MotorController):
     """Each channel has a _MUST_HAVE_ extra attribute:
     +) TangoAttribute - Tango attribute to retrieve the value of the piezo position
     +) UpperLimit and LowerLimit - optional values for the position limits
+    +) Deadband - optional, moves closer than this to the current gap are skipped
     As examples you could have:
     ch1.TangoAttribute = 'my/tango/device/Gap'
     ch1.UpperLimit = 38  # this is default value
     ch1.LowerLimit = 4  # this is default value
+    ch1.Deadband = 0.001  # default 0, disabled
 
     """
 
@@ -37,24 +48,33 @@ class IVUGapAttrMotorController(MotorController):
                         {Type: str
                          , Description: 'The piezo position Tango Attribute to read (e.g. my/tango/dev/Gap)'
                          ,Access: DataAccess.ReadWrite},
+                      DEADBAND:
+                        {Type: float
+                         , Description: 'Moves closer than this to the current gap are skipped (0 disables)'
+                         , DefaultValue: 0
+                         ,Access: DataAccess.ReadWrite},
                      }
 
     def __init__(self, inst, props, *args, **kwargs):
         MotorController.__init__(self, inst, props, *args, **kwargs)
-        self.axisAttributes = {}
+        self.axes = AxisRegistry(lower_limit=4, upper_limit=38,
+                                 names={TANGO_ATTR: 'proxy',
+                                        TANGO_UPPER_LIMIT: 'upper_limit',
+                                        TANGO_LOWER_LIMIT: 'lower_limit',
+                                        DEADBAND: 'deadband'})
 
     def AddDevice(self, axis):
-        self.axisAttributes[axis] = {}
-        self.axisAttributes[axis][TANGO_ATTR] = None
-        self.axisAttributes[axis][TANGO_UPPER_LIMIT] = 38
-        self.axisAttributes[axis][TANGO_LOWER_LIMIT] = 4
+        self.axes.add(axis)
 
     def DeleteDevice(self, axis):
-        del self.axisAttributes[axis]
+        self.axes.remove(axis)
 
     def StateOne(self, axis):
         try:
-            tau_attr = self.axisAttributes[axis][TANGO_ATTR]
+            record = self.axes[axis]
+            if not self.axes.connected(record, self._log, wait=False):
+                return (State.Init, "connecting", 0)
+            tau_attr = record.proxy
             quality = tau_attr.read().quality
             if quality == AttrQuality.ATTR_CHANGING:
                 state = State.Moving
@@ -73,6 +93,7 @@ class IVUGapAttrMotorController(MotorController):
                 status = 'Unknown'
 
             switch_state = 0
+            record.history.add_state(state)
 
             return (state, status, switch_state)
         except Exception, e:
@@ -90,10 +111,15 @@ class IVUGapAttrMotorController(MotorController):
 
     def ReadOne(self, axis):
         try:
-            pos_attr = self.axisAttributes[axis][TANGO_ATTR]
+            record = self.axes[axis]
+            self.axes.connected(record, self._log)
+            pos_attr = record.proxy
             if pos_attr is None:
                 raise Exception("attribute proxy is None")
-            return pos_attr.read().value
+            position = pos_attr.read().value
+            record.position = position
+            record.history.add_position(position)
+            return position
         except Exception, e:
             self._log.error("(%d) error reading: %s" % (axis, str(e)))
             raise e
@@ -102,13 +128,28 @@ class IVUGapAttrMotorController(MotorController):
         pass
 
     def PreStartOne(self, axis, pos):
-        return not self.axisAttributes[axis][TANGO_ATTR] is None
+        record = self.axes[axis]
+        self.axes.connected(record, self._log)
+        return not record.proxy is None
+
+    def _write_position(self, record, pos):
+        """Write pos unless it is within the deadband; True if written."""
+        pos_attr = record.proxy
+        deadband = record.deadband
+        if deadband > 0:
+            reading = pos_attr.read()
+            if reading.quality == AttrQuality.ATTR_VALID and \
+                    within_deadband(pos, reading.value, deadband):
+                self._log.debug("(%d) %f within deadband, not moving" % (record.axis, pos))
+                return False
+        pos_attr.write(pos)
+        return True
 
     def StartOne(self, axis, pos):
-        if pos > self.axisAttributes[axis][TANGO_LOWER_LIMIT] and pos <= self.axisAttributes[axis][TANGO_UPPER_LIMIT]:
+        record = self.axes[axis]
+        if record.in_limits(pos):
             try:
-                pos_attr = self.axisAttributes[axis][TANGO_ATTR]
-                pos_attr.write(pos)
+                self._write_position(record, pos)
             except Exception, e:
                 self._log.error("(%d) error writing: %s" % (axis, str(e)))
         else:
@@ -124,26 +165,26 @@ class IVUGapAttrMotorController(MotorController):
         pass
 
     def SetPar(self, axis, name, value):
-        self.axisAttributes[axis][name] = value
+        self.axes.set_par(axis, name, value)
 
     def GetPar(self, axis, name):
-        return self.axisAttributes[axis][name]
+        return self.axes.get_par(axis, name)
 
     def GetAxisExtraPar(self, axis, name):
-        return self.axisAttributes[axis][name]
+        return self.axes.get_par(axis, name)
 
     def SetAxisExtraPar(self, axis, name, value):
         try:
             self._log.debug("SetExtraAttributePar [%d] %s = %s" % (axis, name, value))
-            if name == 'Limit':
-                self.axisAttributes[axis][name] = value
+            if name in ('Limit', DEADBAND):
+                self.axes.set_par(axis, name, value)
             else:
                 if name in [TANGO_ATTR]:
-                    try:
-                        self.axisAttributes[axis][name] = AttributeProxy(value)
-                    except Exception, e:
-                        self.axisAttributes[axis][name] = None
-                        raise e
+                    # created in the background, the axis is Init until then
+                    self.axes.set_par(axis, name, None)
+                    self.axes[axis].pars[name] = value
+                    self.axes[axis].pending[name] = connect(
+                        value, lambda: wrap_proxy(AttributeProxy(value), self, value))
         except DevFailed, df:
             de = df[0]
             self._log.error("SetExtraAttribute DevFailed: (%s) %s" % (de.reason, de.desc))
@@ -151,5 +192,42 @@ class IVUGapAttrMotorController(MotorController):
         except Exception, e:
             self._log.error("SetExtraAttribute Exception: %s" % str(e))
 
+    def _bulk_read(self, axis):
+        record = self.axes[axis]
+        self.axes.connected(record, self._log)
+        if record.proxy is None:
+            raise Exception("attribute proxy is None")
+        reading = record.proxy.read()
+        record.position = reading.value
+        record.history.add_position(reading.value)
+        return {'position': reading.value, 'quality': str(reading.quality),
+                'time': attr_time(reading)}
+
+    def _bulk_move(self, axis, pos):
+        record = self.axes[axis]
+        self.axes.connected(record, self._log)
+        if record.proxy is None:
+            raise Exception("attribute proxy is None")
+        if not record.in_limits(pos):
+            raise Exception("Requested position out of limits")
+        return self._write_position(record, pos)
+
+    def _bulk_history(self, axis, since=None):
+        return self.axes[axis].history.query(since)
+
+    def _bulk_health(self, axes):
+        return attribute_axes_health(dict((axis, [self.axes[axis].pars.get(TANGO_ATTR)])
+                                          for axis in axes))
+
     def SendToCtrl(self, in_data):
-        return ""
+        """Bulk commands, see ctrl.bulk:
+        {"cmd": "read"} -> gap position, quality and time
+        {"cmd": "move", "positions": {"1": 9.5}} -> true if written
+        {"cmd": "history", "since": t} -> recent gaps and states (ctrl.history)
+        {"cmd": "health"} -> state and status of the ID device, gap and quality (ctrl.health)
+        """
+        return dispatch(in_data, {'read': (AXES, self._bulk_read),
+                                  'move': (POSITIONS, self._bulk_move),
+                                  'history': (AXES, self._bulk_history),
+                                  'health': (GROUPED, self._bulk_health)},
+                        self.axes, self._log)
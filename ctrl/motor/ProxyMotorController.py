@@ -7,14 +7,23 @@ from sardana import State, DataAccess
 from sardana.pool.controller import MotorController
 from sardana.pool.controller import Type, Description, DefaultValue, Access, FGet, FSet
 
+from ctrl.axisregistry import AxisRegistry
+from ctrl.bulk import AXES, GROUPED, POSITIONS, dispatch
+from ctrl.connect import connect, collect
+from ctrl.deadband import within_deadband
+from ctrl.health import axis_health, read_devices
+from ctrl.instrumentation import instrumented, wrap_proxy
+
 import math
 import time
 
 TANGO_UPPER_LIMIT = 'UpperLimit'
 TANGO_LOWER_LIMIT = 'LowerLimit'
+DEADBAND = 'Deadband'
 
 # based on the tango attr motor controller, removed stuff and adapt to ivu needs
 
+@instrumented
 class ProxyMotorController(MotorController):
     """The controller has a _MUST_HAVE_ property:
     +) MotorName - Tango device name for the motor that we want to be a proxy
@@ -23,9 +32,11 @@ class ProxyMotorController(MotorController):
    
     The channel has some _MUST_HAVE_ extra attributes:
     +) UpperLimit and LowerLimit - optional values for the position limits
+    +) Deadband - optional, moves closer than this to the current position are skipped
     As examples you could have:
     ch1.UpperLimit = 38  # this is default value
     ch1.LowerLimit = 4  # this is default value
+    ch1.Deadband = 0.001  # default 0, disabled
 
     """
 
@@ -65,33 +76,48 @@ class ProxyMotorController(MotorController):
                          Access: DataAccess.ReadWrite,
                          FGet: 'get_lowerlimit',
                          FSet: 'set_lowerlimit'
+                         },
+                         DEADBAND:
+                         {Type: float,
+                         Description: 'Moves closer than this to the current position are skipped (0 disables)',
+                         DefaultValue: 0,
+                         Access: DataAccess.ReadWrite,
+                         FGet: 'get_deadband',
+                         FSet: 'set_deadband'
                          }
                        }
 
     def __init__(self, inst, props, *args, **kwargs):
         MotorController.__init__(self, inst, props, *args, **kwargs)
-        self.axisAttributes = {}
+        self.axes = AxisRegistry(lower_limit=4, upper_limit=38,
+                                 names={TANGO_UPPER_LIMIT: 'upper_limit',
+                                        TANGO_LOWER_LIMIT: 'lower_limit',
+                                        DEADBAND: 'deadband'})
+        self.motorProxy = None
         self.interlockProxy = None
-        try:
-            print self.MotorName, self.InterlockDevice
-            self.motorProxy = DeviceProxy(self.MotorName)
-            if self.InterlockDevice!="":
-                self.interlockProxy = DeviceProxy(self.InterlockDevice)
-        except DevFailed, df:
-            de = df[0]
-            self._log.error("__init__ DevFailed: (%s) %s" % (de.reason, de.desc))
-            self._log.error("__init__ DevFailed: %s" % str(df))
-        except Exception, e:
-            self._log.error("__init__ Exception: %s" % str(e))
+        # the proxies are created in the background, the axis is Init until then
+        self.pending = {}
+        print self.MotorName, self.InterlockDevice
+        self.pending['motorProxy'] = connect(
+            self.MotorName, lambda: wrap_proxy(DeviceProxy(self.MotorName), self, self.MotorName))
+        if self.InterlockDevice!="":
+            self.pending['interlockProxy'] = connect(
+                self.InterlockDevice,
+                lambda: wrap_proxy(DeviceProxy(self.InterlockDevice), self, self.InterlockDevice))
+
+    def connected(self, wait=True):
+        """Install the proxies that finished connecting; False while some
+        are still connecting (only without wait)."""
+        if not self.pending:
+            return True
+        return collect(self.pending, lambda name, proxy: setattr(self, name, proxy), self._log, wait)
 
 
     def AddDevice(self, axis):
-        self.axisAttributes[axis] = {}
-        self.axisAttributes[axis][TANGO_UPPER_LIMIT] = 38
-        self.axisAttributes[axis][TANGO_LOWER_LIMIT] = 4
+        self.axes.add(axis)
 
     def DeleteDevice(self, axis):
-        del self.axisAttributes[axis]
+        self.axes.remove(axis)
 
    # def SetPar(self, axis, name, value):
    #     self.axisAttributes[axis][name] = value
@@ -100,28 +126,38 @@ class ProxyMotorController(MotorController):
     #    return self.axisAttributes[axis][name]
 
     def get_upperlimit(self, axis):
-        return self.axisAttributes[axis][TANGO_UPPER_LIMIT]
+        return self.axes[axis].upper_limit
     
     def get_lowerlimit(self, axis):
-        return self.axisAttributes[axis][TANGO_LOWER_LIMIT]
+        return self.axes[axis].lower_limit
 
     def set_upperlimit(self, axis, value):
-        self.axisAttributes[axis][TANGO_UPPER_LIMIT] = value
+        self.axes[axis].upper_limit = value
     
     def set_lowerlimit(self, axis, value):
-        self.axisAttributes[axis][TANGO_LOWER_LIMIT] = value
+        self.axes[axis].lower_limit = value
+
+    def get_deadband(self, axis):
+        return self.axes[axis].deadband
+
+    def set_deadband(self, axis, value):
+        self.axes[axis].deadband = value
 
     def StateOne(self, axis):
         try:
+            if not self.connected(wait=False):
+                return (State.Init, "Connecting to %s" % self.MotorName, 0)
             if self.interlockProxy is not None:
                 ilockstate = self.interlockProxy.State()
                 if ilockstate in [DevState.ALARM, DevState.FAULT, DevState.UNKNOWN, DevState.INIT]:
                     state = State.Disable
                     status = 'The device is interlocked.' 
+                    self.axes[axis].history.add_state(state)
                     return (state, status, 0)
 			
             state = self.motorProxy.State()
             status = self.motorProxy.Status()
+            self.axes[axis].history.add_state(state)
             return (state, status, 0)
         except Exception, e:
             self._log.error(" (%d) error getting state: %s" % (axis, str(e)))
@@ -138,10 +174,15 @@ class ProxyMotorController(MotorController):
 
     def ReadOne(self, axis):
         try:
+            self.connected()
             motor = self.motorProxy
             if motor is None:
                 raise Exception("device proxy is None")
-            return motor.Position
+            position = motor.Position
+            record = self.axes[axis]
+            record.position = position
+            record.history.add_position(position)
+            return position
         except Exception, e:
             self._log.error("(%d) error reading: %s" % (axis, str(e)))
             raise e
@@ -150,13 +191,24 @@ class ProxyMotorController(MotorController):
         pass
 
     def PreStartOne(self, axis, pos):
+        self.connected()
         return not self.motorProxy is None
 
+    def _write_position(self, record, pos):
+        """Write pos unless it is within the deadband; True if written."""
+        motor = self.motorProxy
+        deadband = record.deadband
+        if deadband > 0 and within_deadband(pos, motor.Position, deadband):
+            self._log.debug("(%d) %f within deadband, not moving" % (record.axis, pos))
+            return False
+        motor.Position = pos
+        return True
+
     def StartOne(self, axis, pos):
-        if pos > self.axisAttributes[axis][TANGO_LOWER_LIMIT] and pos <= self.axisAttributes[axis][TANGO_UPPER_LIMIT]:
+        record = self.axes[axis]
+        if record.in_limits(pos):
             try:
-                motor = self.motorProxy
-                motor.Position = pos
+                self._write_position(record, pos)
             except Exception, e:
                 self._log.error("(%d) error writing: %s" % (axis, str(e)))
         else:
@@ -167,21 +219,70 @@ class ProxyMotorController(MotorController):
 
     def AbortOne(self, axis):
         try:
+            self.connected()
             self.motorProxy.Abort()
         except Exception, e:
             self._log.error("(%d) error aborting: %s" % (axis, str(e)))
     
     def StopOne(self, axis):
         try:
+            self.connected()
             self.motorProxy.Stop()
         except Exception, e:
             self._log.error("(%d) error stopping: %s" % (axis, str(e)))
 
     def SetPar(self, axis, name, value):
-        self.axisAttributes[axis][name] = value
+        self.axes.set_par(axis, name, value)
 
     def GetPar(self, axis, name):
-        return self.axisAttributes[axis][name]
+        return self.axes.get_par(axis, name)
+
+    def _bulk_read(self, axis):
+        self.connected()
+        motor = self.motorProxy
+        if motor is None:
+            raise Exception("device proxy is None")
+        position = motor.Position
+        record = self.axes[axis]
+        record.position = position
+        record.history.add_position(position)
+        return {'position': position, 'state': str(motor.State())}
+
+    def _bulk_move(self, axis, pos):
+        self.connected()
+        record = self.axes[axis]
+        if self.motorProxy is None:
+            raise Exception("device proxy is None")
+        if not record.in_limits(pos):
+            raise Exception("Requested position out of limits")
+        return self._write_position(record, pos)
+
+    def _bulk_history(self, axis, since=None):
+        return self.axes[axis].history.query(since)
+
+    def _bulk_health(self, axes):
+        groups = {self.MotorName: ['State', 'Status', 'Position', 'PowerOn']}
+        if self.InterlockDevice != "":
+            groups[self.InterlockDevice] = ['State']
+        devices = read_devices(groups)
+        result = {}
+        for axis in axes:
+            try:
+                result[axis] = axis_health(devices, self.MotorName, 'Position',
+                                           self.InterlockDevice or None)
+            except Exception, e:
+                result[axis] = e
+        return result
 
     def SendToCtrl(self, in_data):
-        return ""
+        """Bulk commands, see ctrl.bulk:
+        {"cmd": "read"} -> position and state
+        {"cmd": "move", "positions": {"1": 12.0}} -> true if written
+        {"cmd": "history", "since": t} -> recent positions and states (ctrl.history)
+        {"cmd": "health"} -> state, status, position, power and interlock (ctrl.health)
+        """
+        return dispatch(in_data, {'read': (AXES, self._bulk_read),
+                                  'move': (POSITIONS, self._bulk_move),
+                                  'history': (AXES, self._bulk_history),
+                                  'health': (GROUPED, self._bulk_health)},
+                        self.axes, self._log)
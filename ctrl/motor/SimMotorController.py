@@ -0,0 +1,263 @@
+from sardana import State, DataAccess
+from sardana.pool.controller import MotorController
+from sardana.pool.controller import Type, Access, Description, DefaultValue
+
+from ctrl.deadband import within_deadband
+from ctrl.instrumentation import instrumented
+
+import math
+import time
+
+
+VELOCITY = 'velocity'
+ACCELERATION = 'acceleration'
+DECELERATION = 'deceleration'
+BACKLASH = 'backlash'
+SETTLE_TIME = 'SettleTime'
+DEADBAND = 'Deadband'
+TANGO_UPPER_LIMIT = 'UpperLimit'
+TANGO_LOWER_LIMIT = 'LowerLimit'
+
+
+def profile(distance, velocity, acceleration, deceleration):
+    """(peak velocity, acceleration ramp [s], deceleration ramp [s],
+    duration [s]) of a trapezoidal (triangular if short) move over
+    distance. acceleration and deceleration are the times to reach
+    velocity from standstill and back, as in Sardana."""
+    ramps = (acceleration + deceleration) / 2.0
+    if distance >= velocity * ramps:
+        peak = velocity
+    else:
+        peak = math.sqrt(distance * velocity / ramps)
+    up = acceleration * peak / velocity
+    down = deceleration * peak / velocity
+    return peak, up, down, distance / peak + (up + down) / 2.0
+
+
+def move_time(distance, velocity, acceleration, deceleration):
+    """Duration of a trapezoidal (triangular if short) move over distance."""
+    distance = abs(distance)
+    if distance == 0:
+        return 0.0
+    return profile(distance, velocity, acceleration, deceleration)[3]
+
+
+def leg_position(start, end, velocity, acceleration, deceleration, t):
+    """Position t seconds into a trapezoidal move from start to end."""
+    distance = abs(end - start)
+    if distance == 0:
+        return end
+    peak, up, down, duration = profile(distance, velocity, acceleration, deceleration)
+    if t >= duration:
+        return end
+    sign = 1 if end >= start else -1
+    if t < up:
+        done = 0.5 * peak / up * t * t
+    elif t < duration - down:
+        done = peak * (t - up / 2.0)
+    else:
+        left = duration - t
+        done = distance - 0.5 * peak / down * left * left
+    return start + sign * done
+
+
+class SimAxis(object):
+    """Kinematic parameters and current motion of one simulated axis."""
+
+    def __init__(self, position=0.0):
+        self.position = position
+        self.velocity = 1.0
+        # ramp times [s]
+        self.acceleration = 0.1
+        self.deceleration = 0.1
+        self.backlash = 0.0
+        self.settle_time = 0.0
+        self.deadband = 0.0
+        self.upper_limit = float('inf')
+        self.lower_limit = float('-inf')
+        # (start time, start position, end position) of each motion leg
+        self.legs = []
+        self.motion_end = 0.0
+        self.settle_end = 0.0
+        self.moves = 0
+        self.travel = 0.0
+
+    def position_at(self, now):
+        position = self.position
+        for t0, start, end in self.legs:
+            if now < t0:
+                break
+            position = leg_position(start, end, self.velocity, self.acceleration,
+                                    self.deceleration, now - t0)
+        return position
+
+
+# in-memory motors with velocity, acceleration, backlash and settle time,
+# for running the pseudo motor chains without hardware
+
+@instrumented
+class SimMotorController(MotorController):
+    """Simulates as many motors as the user wants, in memory.
+
+    Each axis moves with a trapezoidal velocity profile given by the
+    standard velocity, acceleration and deceleration parameters, the
+    latter two being the ramp times in seconds. A non zero backlash
+    makes moves against its sign overshoot by backlash and approach the
+    target from the backlash side (positive backlash: final approach in
+    the positive direction). The axis reports Moving until SettleTime
+    seconds after the motion ended.
+
+    The controller has an optional property:
+    +) TimeScale - simulated seconds per wall clock second (default 1,
+       e.g. 10 to run the motions ten times faster than real time)
+
+    Each channel has optional extra attributes:
+    +) SettleTime - seconds the axis stays Moving after reaching the target
+    +) Deadband - moves closer than this to the current position are skipped
+    +) UpperLimit and LowerLimit - position limits (default none)
+    As examples you could have:
+    ch1.SettleTime = 0.2
+    ch1.Deadband = 0.001
+    """
+
+    gender = "Simulation"
+    model = "Kinematic"
+    organization = "MaxIV"
+
+    MaxDevice = 1024
+
+    ctrl_properties = {'TimeScale':
+                       {Type: float,
+                        Description: 'Simulated seconds per wall clock second',
+                        DefaultValue: 1.0}
+                       }
+
+    axis_attributes = {SETTLE_TIME:
+                        {Type: float
+                         , Description: 'Seconds the axis stays Moving after the motion ended'
+                         , DefaultValue: 0
+                         ,Access: DataAccess.ReadWrite},
+                       DEADBAND:
+                        {Type: float
+                         , Description: 'Moves closer than this to the current position are skipped (0 disables)'
+                         , DefaultValue: 0
+                         ,Access: DataAccess.ReadWrite},
+                       TANGO_UPPER_LIMIT:
+                        {Type: float
+                         , Description: 'Upper position limit'
+                         , DefaultValue: float('inf')
+                         ,Access: DataAccess.ReadWrite},
+                       TANGO_LOWER_LIMIT:
+                        {Type: float
+                         , Description: 'Lower position limit'
+                         , DefaultValue: float('-inf')
+                         ,Access: DataAccess.ReadWrite},
+                       }
+
+    _extra_par_names = {SETTLE_TIME: 'settle_time', DEADBAND: 'deadband',
+                        TANGO_UPPER_LIMIT: 'upper_limit',
+                        TANGO_LOWER_LIMIT: 'lower_limit'}
+
+    def __init__(self, inst, props, *args, **kwargs):
+        MotorController.__init__(self, inst, props, *args, **kwargs)
+        self.axes = {}
+        self.time_scale = float(self.TimeScale or 1.0)
+        self._wall_start = time.time()
+
+    def now(self):
+        """The simulated time in seconds since the controller was created."""
+        return (time.time() - self._wall_start) * self.time_scale
+
+    def AddDevice(self, axis):
+        self.axes[axis] = SimAxis()
+
+    def DeleteDevice(self, axis):
+        del self.axes[axis]
+
+    def StateOne(self, axis):
+        sim_axis = self.axes[axis]
+        now = self.now()
+        if now < sim_axis.motion_end:
+            return (State.Moving, 'Moving', 0)
+        if now < sim_axis.settle_end:
+            return (State.Moving, 'Settling', 0)
+        return (State.On, 'On', 0)
+
+    def PreReadAll(self):
+        pass
+
+    def PreReadOne(self, axis):
+        pass
+
+    def ReadAll(self):
+        pass
+
+    def ReadOne(self, axis):
+        return self.axes[axis].position_at(self.now())
+
+    def PreStartAll(self):
+        pass
+
+    def PreStartOne(self, axis, pos):
+        return True
+
+    def StartOne(self, axis, pos):
+        sim_axis = self.axes[axis]
+        if not sim_axis.lower_limit <= pos <= sim_axis.upper_limit:
+            raise Exception("Requested position out of limits")
+        now = self.now()
+        current = sim_axis.position_at(now)
+        if within_deadband(pos, current, sim_axis.deadband):
+            self._log.debug("(%d) %f within deadband, not moving" % (axis, pos))
+            return
+        targets = [pos]
+        if sim_axis.backlash and (pos - current) * sim_axis.backlash < 0:
+            targets.insert(0, pos - sim_axis.backlash)
+        legs = []
+        start, t0 = current, now
+        for target in targets:
+            legs.append((t0, start, target))
+            t0 += move_time(target - start, sim_axis.velocity, sim_axis.acceleration,
+                            sim_axis.deceleration)
+            sim_axis.travel += abs(target - start)
+            start = target
+        sim_axis.position = current
+        sim_axis.legs = legs
+        sim_axis.motion_end = t0
+        sim_axis.settle_end = t0 + sim_axis.settle_time
+        sim_axis.moves += 1
+
+    def StartAll(self):
+        pass
+
+    def AbortOne(self, axis):
+        sim_axis = self.axes[axis]
+        now = self.now()
+        sim_axis.position = sim_axis.position_at(now)
+        sim_axis.legs = []
+        sim_axis.motion_end = sim_axis.settle_end = now
+
+    def StopOne(self, axis):
+        self.AbortOne(axis)
+
+    def SetPar(self, axis, name, value):
+        name = name.lower()
+        if name in (VELOCITY, ACCELERATION, DECELERATION, BACKLASH):
+            setattr(self.axes[axis], name, float(value))
+
+    def GetPar(self, axis, name):
+        name = name.lower()
+        if name in (VELOCITY, ACCELERATION, DECELERATION, BACKLASH):
+            return getattr(self.axes[axis], name)
+        if name == 'step_per_unit':
+            return 1.0
+        return 0.0
+
+    def GetAxisExtraPar(self, axis, name):
+        return getattr(self.axes[axis], self._extra_par_names[name])
+
+    def SetAxisExtraPar(self, axis, name, value):
+        setattr(self.axes[axis], self._extra_par_names[name], float(value))
+
+    def SendToCtrl(self, in_data):
+        return ""
@@ -4,7 +4,15 @@ from PyTango import DevFailed
 
 from sardana import State, DataAccess
 from sardana.pool.controller import MotorController
-from sardana.pool.controller import Type, Access, Description
+from sardana.pool.controller import Type, Access, Description, DefaultValue
+
+from ctrl.axisregistry import AxisRegistry
+from ctrl.bulk import AXES, GROUPED, POSITIONS, attr_time, dispatch
+from ctrl.connect import connect
+from ctrl.deadband import within_deadband
+from ctrl.health import attribute_axes_health
+from ctrl.instrumentation import instrumented, wrap_proxy
+from ctrl.sharedstate import FIELDS as SHARED_FIELDS, publish
 
 import math
 import time
@@ -13,19 +21,26 @@ import time
 TANGO_ATTR = 'TangoAttribute'
 TANGO_ON_TARGET = 'TangoOnTarget'
 TANGO_LIMIT = 'Limit'
+DEADBAND = 'Deadband'
+SHARED_NAME = 'SharedName'
 
 # based on the tango attr motor controller, removed stuff and adapt to the piezo on_target and limits
 
+@instrumented
 class PI625(MotorController):
     """This controller offers as many motors as the user wants.
     Each channel has two _MUST_HAVE_ extra attributes:
     +) TangoAttribute - Tango attribute to retrieve the value of the piezo position
     +) TangoOnTarget - Tango attribute to retrieve the value of the on target piezo parameter
     +) Limit - optional value for the high position limit
+    +) Deadband - optional, moves closer than this to the current position are skipped
+    +) SharedName - optional, the ctrl.sharedstate field the position read is published to
     As examples you could have:
     ch1.TangoAttribute = 'my/tango/device/Position'
     ch1.TangoOnTarget =  'my/tango/device/on_target
     ch2.Limit = 42
+    ch2.Deadband = 0.01  # default 0, disabled
+    ch1.SharedName = 'piezo_hfm_fpit'  # default '', not published
     """
 
     MaxDevice = 1024
@@ -38,25 +53,38 @@ class PI625(MotorController):
                         {Type: str
                          , Description: 'The piezo on_target Tango Attribute to read (e.g. my/tango/dev/on_target)'
                          ,Access: DataAccess.ReadWrite},
+                      DEADBAND:
+                        {Type: float
+                         , Description: 'Moves closer than this to the current position are skipped (0 disables)'
+                         , DefaultValue: 0
+                         ,Access: DataAccess.ReadWrite},
+                      SHARED_NAME:
+                        {Type: str
+                         , Description: 'The ctrl.sharedstate field the position is published to (e.g. piezo_hfm_fpit)'
+                         , DefaultValue: ''
+                         ,Access: DataAccess.ReadWrite},
                      }
 
     def __init__(self, inst, props, *args, **kwargs):
         MotorController.__init__(self, inst, props, *args, **kwargs)
-        self.axisAttributes = {}
+        self.axes = AxisRegistry(lower_limit=0, upper_limit=45,
+                                 names={TANGO_ATTR: 'proxy',
+                                        TANGO_ON_TARGET: 'on_target',
+                                        TANGO_LIMIT: 'upper_limit',
+                                        DEADBAND: 'deadband'})
 
     def AddDevice(self, axis):
-        self.axisAttributes[axis] = {}
-        self.axisAttributes[axis][TANGO_ATTR] = None
-        self.axisAttributes[axis][TANGO_ON_TARGET] = None
-        self.axisAttributes[axis][TANGO_LIMIT] = 45
-
+        self.axes.add(axis).pars[SHARED_NAME] = ''
 
     def DeleteDevice(self, axis):
-        del self.axisAttributes[axis]
+        self.axes.remove(axis)
 
     def StateOne(self, axis):
         try:
-            on_target_att = self.axisAttributes[axis][TANGO_ON_TARGET]
+            record = self.axes[axis]
+            if not self.axes.connected(record, self._log, wait=False):
+                return (State.Init, "connecting", 0)
+            on_target_att = record.on_target
             state = State.On
             status = 'ok'
             switch_state = 0
@@ -67,6 +95,7 @@ class PI625(MotorController):
                 state = State.Moving
             else:
                 state = State.On
+            record.history.add_state(state)
             return (state, status, switch_state)
         except Exception, e:
             self._log.error(" (%d) error getting state: %s" % (axis, str(e)))
@@ -83,25 +112,48 @@ class PI625(MotorController):
 
     def ReadOne(self, axis):
         try:
-            pos_attr = self.axisAttributes[axis][TANGO_ATTR]
+            record = self.axes[axis]
+            self.axes.connected(record, self._log)
+            pos_attr = record.proxy
             if pos_attr is None:
                 raise Exception("attribute proxy is None")
-            return pos_attr.read().value
+            position = pos_attr.read().value
+            record.position = position
+            record.history.add_position(position)
+            self._publish(record, position)
+            return position
         except Exception, e:
             self._log.error("(%d) error reading: %s" % (axis, str(e)))
             raise e
 
+    def _publish(self, record, position):
+        shared = record.pars[SHARED_NAME]
+        if shared:
+            publish(**{shared: position})
+
     def PreStartAll(self):
         pass
 
     def PreStartOne(self, axis, pos):
-        return not self.axisAttributes[axis][TANGO_ATTR] is None
+        record = self.axes[axis]
+        self.axes.connected(record, self._log)
+        return not record.proxy is None
+
+    def _write_position(self, record, pos):
+        """Write pos unless it is within the deadband; True if written."""
+        pos_attr = record.proxy
+        deadband = record.deadband
+        if deadband > 0 and within_deadband(pos, pos_attr.read().value, deadband):
+            self._log.debug("(%d) %f within deadband, not moving" % (record.axis, pos))
+            return False
+        pos_attr.write(pos)
+        return True
 
     def StartOne(self, axis, pos):
-        if pos > 0 and pos <= self.axisAttributes[axis][TANGO_LIMIT]:
+        record = self.axes[axis]
+        if record.in_limits(pos):
             try:
-                pos_attr = self.axisAttributes[axis][TANGO_ATTR]
-                pos_attr.write(pos)
+                self._write_position(record, pos)
             except Exception, e:
                 self._log.error("(%d) error writing: %s" % (axis, str(e)))
         else:
@@ -117,26 +169,30 @@ class PI625(MotorController):
         pass
 
     def SetPar(self, axis, name, value):
-        self.axisAttributes[axis][name] = value
+        self.axes.set_par(axis, name, value)
 
     def GetPar(self, axis, name):
-        return self.axisAttributes[axis][name]
+        return self.axes.get_par(axis, name)
 
     def GetAxisExtraPar(self, axis, name):
-        return self.axisAttributes[axis][name]
+        return self.axes.get_par(axis, name)
 
     def SetAxisExtraPar(self, axis, name, value):
         try:
             self._log.debug("SetExtraAttributePar [%d] %s = %s" % (axis, name, value))
-            if name == 'Limit':
-                self.axisAttributes[axis][name] = value
+            if name in (TANGO_LIMIT, DEADBAND):
+                self.axes.set_par(axis, name, value)
+            elif name == SHARED_NAME:
+                if value and value not in SHARED_FIELDS:
+                    raise Exception("%s is not a shared state field" % value)
+                self.axes.set_par(axis, name, value)
             else:
                 if name in [TANGO_ATTR, TANGO_ON_TARGET]:
-                    try:
-                        self.axisAttributes[axis][name] = AttributeProxy(value)
-                    except Exception, e:
-                        self.axisAttributes[axis][name] = None
-                        raise e
+                    # created in the background, the axis is Init until then
+                    self.axes.set_par(axis, name, None)
+                    self.axes[axis].pars[name] = value
+                    self.axes[axis].pending[name] = connect(
+                        value, lambda: wrap_proxy(AttributeProxy(value), self, value))
         except DevFailed, df:
             de = df[0]
             self._log.error("SetExtraAttribute DevFailed: (%s) %s" % (de.reason, de.desc))
@@ -144,5 +200,44 @@ class PI625(MotorController):
         except Exception, e:
             self._log.error("SetExtraAttribute Exception: %s" % str(e))
 
+    def _bulk_read(self, axis):
+        record = self.axes[axis]
+        self.axes.connected(record, self._log)
+        if record.proxy is None or record.on_target is None:
+            raise Exception("attribute proxy is None")
+        reading = record.proxy.read()
+        record.position = reading.value
+        record.history.add_position(reading.value)
+        self._publish(record, reading.value)
+        return {'position': reading.value, 'quality': str(reading.quality),
+                'time': attr_time(reading), 'on_target': bool(record.on_target.read().value)}
+
+    def _bulk_move(self, axis, pos):
+        record = self.axes[axis]
+        self.axes.connected(record, self._log)
+        if record.proxy is None:
+            raise Exception("attribute proxy is None")
+        if not record.in_limits(pos):
+            raise Exception("Requested position out of limits")
+        return self._write_position(record, pos)
+
+    def _bulk_history(self, axis, since=None):
+        return self.axes[axis].history.query(since)
+
+    def _bulk_health(self, axes):
+        return attribute_axes_health(dict(
+            (axis, [self.axes[axis].pars.get(TANGO_ATTR), self.axes[axis].pars.get(TANGO_ON_TARGET)])
+            for axis in axes))
+
     def SendToCtrl(self, in_data):
-        return ""
+        """Bulk commands, see ctrl.bulk:
+        {"cmd": "read", "axes": [1, 2]} -> position, quality, time, on_target
+        {"cmd": "move", "positions": {"1": 20.0}} -> true if written
+        {"cmd": "history", "since": t} -> recent positions and states (ctrl.history)
+        {"cmd": "health"} -> state and status of the device, position, on target (ctrl.health)
+        """
+        return dispatch(in_data, {'read': (AXES, self._bulk_read),
+                                  'move': (POSITIONS, self._bulk_move),
+                                  'history': (AXES, self._bulk_history),
+                                  'health': (GROUPED, self._bulk_health)},
+                        self.axes, self._log)
@@ -20,7 +20,10 @@ import math
 
 from sardana.pool.controller import PseudoMotorController
 
+from ctrl.instrumentation import instrumented
 
+
+@instrumented
 class AlignmentTableVertical(PseudoMotorController):
     """
     A pseudo motor controller for handling vertical motors of
@@ -60,6 +63,7 @@ class AlignmentTableVertical(PseudoMotorController):
         return (pos_y, pitch)
 
 
+@instrumented
 class AlignmentTableHorizontal(PseudoMotorController):
     """
     A pseudo motor controller for handling horizontal motors of
@@ -24,6 +24,43 @@ import time
 from sardana.pool.poolpseudomotor import PoolPseudoMotor
 from sardana.pool.poolmotor import PoolMotor
 
+from ctrl.bulk import GROUPED, dispatch
+from ctrl.energyhint import announce
+from ctrl.health import axis_health, read_devices
+from ctrl.instrumentation import instrumented, timed, wrap_proxy
+from ctrl.sharedstate import publish_read
+from ctrl.warmup import WarmUp
+
+
+def isclose(a, b):
+    return abs(a-b)<0.1
+
+
+def mirror_strip(physicals, strip_positions):
+    '''
+    returns the strip ("Si", "Rh" or "unknown") the hfm_y, vfm_x1 and vfm_x2
+    physicals are at; strip_positions maps each strip to its positions
+    '''
+    for strip in ("Si", "Rh"):
+        positions = strip_positions[strip]
+        if isclose(physicals[0], positions[0]) and isclose(physicals[1], positions[1]) and isclose(physicals[2], positions[2]):
+            return strip
+    return "unknown"
+
+
+def strip_for_energy(energy):
+    if energy > 8000:
+        return "Rh"
+    else:
+        return "Si"
+
+
+# the energy [eV] MirrorStripChooser reports on a strip the Pool has no
+# energy of: the switch energy for Si, the Se edge for Rh
+STRIP_ENERGIES = {"Si": 8000.0, "Rh": 12658.0}
+
+
+@instrumented
 class BeamlineEnergy(PseudoMotorController):
     """
     Pseudo motor controller for setting  the energy of the beamline.
@@ -39,8 +76,6 @@ class BeamlineEnergy(PseudoMotorController):
 
     def __init__(self, inst, props, *args, **kwargs):
         PseudoMotorController.__init__(self, inst, props, *args, **kwargs)
-        
-        self.current_user_energy = 0.0
 
     def CalcPhysical(self, index, pseudos, physicals):
         return self.CalcAllPhysical(pseudos, physicals)[index - 1]
@@ -49,10 +84,12 @@ class BeamlineEnergy(PseudoMotorController):
         return self.CalcAllPseudo(physicals, pseudos)[index - 1]
 
     def CalcAllPhysical(self, pseudos, physicals):
-        self.current_user_energy = pseudos[0]
-        mono_energy_pseudo = self.current_user_energy
-        ivu_energy_pseudo = self.current_user_energy
-        mirrorstrip_chooser_pseudo = self.current_user_energy
+        user_energy = pseudos[0]
+        # the attenuator and the IVU prepare for it while the mono moves
+        announce(user_energy)
+        mono_energy_pseudo = user_energy
+        ivu_energy_pseudo = user_energy
+        mirrorstrip_chooser_pseudo = user_energy
         return (mono_energy_pseudo, ivu_energy_pseudo, mirrorstrip_chooser_pseudo)
 
     def CalcAllPseudo(self, physicals, pseudos):
@@ -62,10 +99,22 @@ class BeamlineEnergy(PseudoMotorController):
 
 
 
+@instrumented
 class MirrorStripChooser(PseudoMotorController):
     """
     Pseudo motor controller for handling switching of mirror strip for
     energies under and above 8000eV. 
+
+    The calculations keep no state: the strip is worked out from the
+    physicals on every call (see mirror_strip()). The mirrors cannot tell
+    the energy, only the strip, so the energy reported is the one the Pool
+    has for the chooser while it is on the strip of the mirrors, else the
+    STRIP_ENERGIES of that strip; reading it costs no Tango call.
+
+    A calculation moving the mirrors to the other strip powers them on
+    (power_on()) before returning their targets, as pseudo motor
+    controllers have no start hook. It is the only calculation writing to
+    the hardware: the lookahead of pipelined_ascan stops at a strip change.
     """
 
     gender = "Energy"
@@ -114,17 +163,24 @@ class MirrorStripChooser(PseudoMotorController):
     #piezo_vfm_move = {"Si":-10.0, "Rh":10.0}
 
     def isclose(self, a, b):
-        return abs(a-b)<0.1
+        return isclose(a, b)
 
     def __init__(self, inst, props, *args, **kwargs):
         PseudoMotorController.__init__(self, inst, props, *args, **kwargs)
-        self.strip = ""
-        self.current_user_energy = 0.0
         self.hfm_positions = {"Si":self.hfm_pos_Si, "Rh":self.hfm_pos_Rh}
         self.vfm_1_positions = {"Si":self.vfm_1_pos_Si, "Rh":self.vfm_1_pos_Rh}
         self.vfm_2_positions = {"Si":self.vfm_2_pos_Si, "Rh":self.vfm_2_pos_Rh}
         self.piezo_hfm = {"Si":self.piezo_hfm_Si, "Rh":self.piezo_hfm_Rh}
         self.piezo_vfm = {"Si":self.piezo_vfm_Si, "Rh":self.piezo_vfm_Rh}
+        # (hfm_y, vfm_x1, vfm_x2, piezo_hfm_fpit, piezo_vfm_fpit) of each strip
+        self.strip_positions = dict(
+            (strip, (self.hfm_positions[strip], self.vfm_1_positions[strip],
+                     self.vfm_2_positions[strip], self.piezo_hfm[strip],
+                     self.piezo_vfm[strip]))
+            for strip in ("Si", "Rh"))
+        self._power_attrs = None
+        # resolves the mirror motors and their PowerOn attributes before the first move
+        self.warm_up = WarmUp(self._log, self.power_attributes)
 
 
     def CalcPhysical(self, index, pseudos, physicals):
@@ -133,24 +189,10 @@ class MirrorStripChooser(PseudoMotorController):
     def CalcPseudo(self, index, physicals, pseudos):
         return self.CalcAllPseudo(physicals, pseudos)[index - 1]
 
-    def _check_strip(self, physicals):
-        hfm = physicals[0]
-        vfm_1 = physicals[1]
-        vfm_2 = physicals[2]
-        if self.isclose(hfm, self.hfm_positions['Si']) and self.isclose(vfm_1, self.vfm_1_positions['Si']) and self.isclose(vfm_2, self.vfm_2_positions['Si']):
-            self.strip = "Si"
-        elif self.isclose(hfm, self.hfm_positions['Rh']) and self.isclose(vfm_1, self.vfm_1_positions['Rh']) and self.isclose(vfm_2, self.vfm_2_positions['Rh']):
-            self.strip = "Rh"
-        else:
-            self.strip = "unknown"
-
     def CalcAllPhysical(self, pseudos, physicals):
-        self._check_strip(physicals)
+        current_strip = mirror_strip(physicals, self.strip_positions)
         new_energy = pseudos[0]
-        if new_energy > 8000:
-            strip = "Rh"
-        else:
-            strip = "Si"
+        strip = strip_for_energy(new_energy)
 
         curr_hfm_y = physicals[0]
         curr_vfm_x1 = physicals[1]
@@ -158,13 +200,12 @@ class MirrorStripChooser(PseudoMotorController):
         curr_piezo_hfm_fpit = physicals[3]
         curr_piezo_vfm_fpit = physicals[4]
 
-        if strip != self.strip: # and self.strip in ['Si', 'Rh']:
+        if strip != current_strip: # and current_strip in ['Si', 'Rh']:
             self._log.debug("Moving strip to {}.".format(strip))
-            hfm_y_pseudo = self.hfm_positions[strip]
-            vfm_x1_pseudo = self.vfm_1_positions[strip]
-            vfm_x2_pseudo = self.vfm_2_positions[strip]
-            piezo_hfm_pseudo = self.piezo_hfm[strip]
-            piezo_vfm_pseudo = self.piezo_vfm[strip]
+            # the mirrors move next
+            self.power_on()
+            hfm_y_pseudo, vfm_x1_pseudo, vfm_x2_pseudo, piezo_hfm_pseudo, piezo_vfm_pseudo = \
+                self.strip_positions[strip]
         #elif self.strip not in ['Si', 'Rh']:
         #    self._log.warning("The strip mirror is not in one of the predefined start positions. Where are we?")
         #    hfm_y_pseudo = curr_hfm_y
@@ -179,15 +220,16 @@ class MirrorStripChooser(PseudoMotorController):
             vfm_x2_pseudo = curr_vfm_x2
             piezo_hfm_pseudo = curr_piezo_hfm_fpit
             piezo_vfm_pseudo = curr_piezo_vfm_fpit
-        
-        self.power_on()
-        self.strip = strip
-        self.current_user_energy = new_energy
+
         return (hfm_y_pseudo, vfm_x1_pseudo, vfm_x2_pseudo, piezo_hfm_pseudo, piezo_vfm_pseudo)
 
     def CalcAllPseudo(self, physicals, pseudos):
-        self._check_strip(physicals)
-        return (self.current_user_energy,)
+        strip = mirror_strip(physicals, self.strip_positions)
+        publish_read(self, physicals, strip=strip)
+        energy = pseudos[0]
+        if energy is not None and (strip == "unknown" or strip_for_energy(energy) == strip):
+            return (energy,)
+        return (STRIP_ENERGIES.get(strip, float('nan')),)
     
     def get_pool_motors(self,name):
         motor = self.GetMotor(name)
@@ -200,22 +242,68 @@ class MirrorStripChooser(PseudoMotorController):
             self._log.warning("Motor {} is of unknown type".format(name))
         return motors
 
-    def power_on(self):
+    def power_attributes(self):
+        '''
+        returns [(motor name, PowerOn attribute proxy)] of the mirror motors,
+        cached once every motor role could be resolved
+        '''
+        if self._power_attrs is not None:
+            return self._power_attrs
         motors = []
-        motors = motors+self.get_pool_motors('hfm_y')
-        motors = motors+self.get_pool_motors('vfm_x1')
-        motors = motors+self.get_pool_motors('vfm_x2')
+        complete = True
+        for role in ('hfm_y', 'vfm_x1', 'vfm_x2'):
+            role_motors = self.get_pool_motors(role)
+            complete = complete and len(role_motors) > 0
+            motors = motors+role_motors
         attrs = []
-        all_on = True
         for mot in motors:
             try:
-                power_attr = AttributeProxy(mot.name + '/PowerOn')
+                attrs.append((mot.name, wrap_proxy(AttributeProxy(mot.name + '/PowerOn'), self,
+                                                   mot.name + '/PowerOn')))
+            except PyTango.DevFailed as e:
+                self._log.warning("Motor {} doesn't have a PowerOn attribute".format(mot.name))
+        if complete:
+            self._power_attrs = attrs
+        return attrs
+
+    def _bulk_health(self, axes):
+        # every motor behind the roles, the piezos too; "power" is None
+        # for the ones without a PowerOn attribute
+        names = []
+        for role in self.motor_roles:
+            for mot in self.get_pool_motors(role):
+                if mot.name not in names:
+                    names.append(mot.name)
+        devices = read_devices(dict((name, ['State', 'Status', 'Position', 'PowerOn'])
+                                    for name in names))
+        motors = {}
+        for name in names:
+            try:
+                motors[name] = axis_health(devices, name, 'Position')
+            except Exception as e:
+                motors[name] = {'device': name, 'error': str(e)}
+        return dict((axis, {'motors': motors}) for axis in axes)
+
+    def SendToCtrl(self, in_data):
+        '''
+        bulk commands, see ctrl.bulk:
+        {"cmd": "health"} -> {"motors": {name: health}} of the mirror motors (ctrl.health)
+        '''
+        return dispatch(in_data, {'health': (GROUPED, self._bulk_health)}, [1], self._log)
+
+    @timed
+    def power_on(self):
+        self.warm_up.wait()
+        attrs = []
+        all_on = True
+        for name, power_attr in self.power_attributes():
+            try:
                 attrs.append(power_attr)
                 if power_attr.read().value==False:
                     power_attr.write(True)
                     all_on=False
             except PyTango.DevFailed as e:
-                self._log.warning("Motor {} doesn't have a PowerOn attribute".format(mot.name))
+                self._log.warning("Motor {} doesn't have a PowerOn attribute".format(name))
         starttime = time.time()
         while all_on == False:
             if time.time()-starttime > 2:
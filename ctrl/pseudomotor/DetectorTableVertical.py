@@ -19,8 +19,10 @@
 import math
 
 from sardana.pool.controller import PseudoMotorController
+from ctrl.instrumentation import instrumented
 
 
+@instrumented
 class DetectorTableVertical(PseudoMotorController):
     """
     A pseudo motor controller for handling distance and angle.
@@ -26,13 +26,21 @@ from sardana.pool.controller import DataAccess
 from sardana.pool.controller import Access
 from PyTango import *
 
+from ctrl.deadband import pass_through
+from ctrl.energyhint import announce
+from ctrl.instrumentation import instrumented
+from ctrl.sharedstate import publish_read
+
 import math
 
 
+@instrumented
 class Energy(PseudoMotorController):
     """
     Energy pseudo motor controller for handling energy calculation given the positions
     of all the motors involved (and viceversa).
+    bragg_deadband/x2per_deadband keep the current physical position when the
+    computed change is below them, so re-issued energies do not move anything.
     TODO: at this stage x2per is not updated
     """
     gender = "Energy"
@@ -74,6 +82,14 @@ class Energy(PseudoMotorController):
                           'Description': 'horizontal beam offset, h = 2a*cos(bragg), [mm]',
                           'DefaultValue': 10
                           },
+                  'bragg_deadband': {'Type': 'PyTango.DevDouble',
+                                     'Description': 'bragg changes below this are not moved, 0 disables, [deg]',
+                                     'DefaultValue': 0
+                                     },
+                  'x2per_deadband': {'Type': 'PyTango.DevDouble',
+                                     'Description': 'x2per changes below this are not moved, 0 disables, [mm]',
+                                     'DefaultValue': 0
+                                     },
                   }
 
     def __init__(self, inst, props, *args, **kwargs):
@@ -96,6 +112,8 @@ class Energy(PseudoMotorController):
 
     def CalcAllPhysical(self, pseudos, curr_physical_pos):
         mono_energy = pseudos[0]
+        # the attenuator and the IVU prepare for it while the mono moves
+        announce(mono_energy)
         self._log.info('energy: %f', mono_energy)
         self._log.info('phys1: %f', curr_physical_pos[0])
         self._log.info('phys2: %f', curr_physical_pos[1])
@@ -109,7 +127,8 @@ class Energy(PseudoMotorController):
         x2per = self.off/(2*(math.cos((bragg)*(math.pi/180))))
 
         #x2per = curr_physical_pos[1]
-        return (bragg, x2per)
+        return pass_through((bragg, x2per), curr_physical_pos,
+                            (self.bragg_deadband, self.x2per_deadband))
 
     def CalcAllPseudo(self, physicals, curr_pseudo_pos):
         mono_bragg, mono_x = physicals
@@ -119,9 +138,11 @@ class Energy(PseudoMotorController):
         else:
             energy = math.fabs(self.hc / (self.dist * math.cos(math.radians(90 - mono_bragg)))) #/1000 to rad
 
+        publish_read(self, physicals, mono_energy=energy)
         return (energy,)
 
 
+@instrumented
 class Wavelength(PseudoMotorController):
     """
     Wavelength pseudo motor controller for handling energy/wavelength conversion
@@ -161,6 +182,14 @@ class Wavelength(PseudoMotorController):
                   'off':{'Type':'PyTango.DevDouble',
                  'Description':'horizontal beam offset, h = 2a*cos(bragg), [mm]',
                  'DefaultValue':10
+                },
+                  'bragg_deadband':{'Type':'PyTango.DevDouble',
+                 'Description':'bragg changes below this are not moved, 0 disables, [deg]',
+                 'DefaultValue':0
+                },
+                  'x2per_deadband':{'Type':'PyTango.DevDouble',
+                 'Description':'x2per changes below this are not moved, 0 disables, [mm]',
+                 'DefaultValue':0
                 },
                 }
     axis_extra_attributes = {"DiffrOrder":
@@ -190,7 +219,8 @@ class Wavelength(PseudoMotorController):
 
         x2per = self.off / 2 * math.cos(bragg)
 
-        return (bragg, x2per)
+        return pass_through((bragg, x2per), curr_physical_pos,
+                            (self.bragg_deadband, self.x2per_deadband))
 
     def CalcAllPseudo(self, physicals, curr_pseudo_pos):
         mono_bragg, mono_x = physicals
@@ -22,7 +22,10 @@ from sardana.pool.controller import MotorController, PseudoMotorController
 from sardana.pool.controller import Type
 from sardana.pool.controller import Description
 
+from ctrl.instrumentation import instrumented
 
+
+@instrumented
 class HFMPosition(PseudoMotorController):
     """A pseudo motor controller for handling x and yaw pseudo
        motors of the Horizontal Focusing Mirror. The system uses to real motors mirxx and mirxx."""
@@ -22,15 +22,39 @@ from sardana.pool.controller import PseudoMotorController
 from sardana.pool.controller import Type
 from sardana.pool.controller import Description
 
-from numpy import interp
+from numpy import interp, array, diff
 import PyTango
 import json
 
+from ctrl.deadband import pass_through
+from ctrl.energyhint import subscribe
+from ctrl.instrumentation import instrumented
+from ctrl.sharedstate import publish_read
+from ctrl.warmup import WarmUp
+
+def check_table(energies, positions):
+    """(energies, positions) of a gap table, if the energies increase and
+    the gaps increase or decrease with them: one gap per energy and one
+    energy per gap. Raises otherwise."""
+    if len(energies) != len(positions) or len(energies) < 2:
+        raise Exception("the energy and position arrays need the same length, at least 2")
+    if not (diff(energies) > 0).all():
+        raise Exception("the energies of the gap table do not increase")
+    steps = diff(positions)
+    if not ((steps > 0).all() or (steps < 0).all()):
+        raise Exception("the gaps of the gap table are not monotonic in energy")
+    return energies, positions
+
+
+@instrumented
 class IVUEnergy(PseudoMotorController):
     """
     Pseudo motor controller for handling gap [mm] vs energy [eV] calculation, based on
     supplied table.
     
+    The energy reported is the one of the gap, from the table read the
+    other way round; a table with a gap for two energies is refused.
+
     for getting the arrays form the beamline excell file:
     import csv
     f = open('fit_table_EnergyGap.csv', 'rU')
@@ -54,7 +78,10 @@ class IVUEnergy(PseudoMotorController):
                                         },
                        "position_array" : {"Type" : str,
                                                     "Description" : "Gap position values array",
-                                                    "DefaultValue": "[4.9976, 6.9786]"}
+                                                    "DefaultValue": "[4.9976, 6.9786]"},
+                       "gap_deadband" : {"Type" : float,
+                                         "Description" : "Gap changes below this are not moved, 0 disables [mm]",
+                                         "DefaultValue": 0}
                        }
 
     pseudo_motor_roles = ("ivu_gap_energy",)
@@ -67,15 +94,34 @@ class IVUEnergy(PseudoMotorController):
         if self.energy_array is None:
             raise Exception("Energy vs Position table property needs to be set")
 
+        # (energies, positions) as arrays, parsed before the first call
+        self.table = None
+        self.warm_up = WarmUp(self._log, self.load_table)
+        # the gap for the target of an energy move, computed during the move
+        self.prepared = (None, None)
+        subscribe(self, 'prepare_energy')
+
+    def load_table(self):
         # it is an string! no matter the Type...
-        self.energy_array = json.loads(self.energy_array)
-        self.position_array = json.loads(self.position_array)
+        energies, positions = check_table(array(json.loads(self.energy_array), dtype=float),
+                                          array(json.loads(self.position_array), dtype=float))
+
+        self.min_energy = energies[0]
+        self.max_energy = energies[-1]
+        self.min_position = positions.min()
+        self.max_position = positions.max()
+        # (positions, energies) by increasing position, for the energy of a gap
+        if positions[0] < positions[-1]:
+            self.inverse = (positions, energies)
+        else:
+            self.inverse = (positions[::-1], energies[::-1])
+        self.table = (energies, positions)
 
-        self.min_energy = self.energy_array[0]
-        self.max_energy = self.energy_array[-1]
-        self.current_energy = 0.0
-        self.min_position = min(self.position_array)
-        self.max_position = max(self.position_array)
+    def _get_table(self):
+        self.warm_up.wait()
+        if self.table is None:
+            self.load_table()
+        return self.table
 
     def CalcPseudo(self, index, physicals, curr_pseudo_pos):
         return self.CalcAllPseudo(physicals, curr_pseudo_pos)[index - 1]
@@ -83,15 +129,26 @@ class IVUEnergy(PseudoMotorController):
     def CalcPhysical(self, index, pseudos, curr_physical_pos):
         return self.CalcAllPhysical(pseudos, curr_physical_pos)[index - 1]
 
+    def prepare_energy(self, energy):
+        energies, positions = self._get_table()
+        self.prepared = (energy, interp(energy, energies, positions))
+
     def CalcAllPhysical(self, pseudos, curr_physical_pos):
         ivu_gap_energy = pseudos[0]
-        self.current_energy = ivu_gap_energy
-        ivu_gap_position = interp(ivu_gap_energy, self.energy_array, self.position_array)
+        prepared_energy, ivu_gap_position = self.prepared
+        if prepared_energy != ivu_gap_energy:
+            energies, positions = self._get_table()
+            ivu_gap_position = interp(ivu_gap_energy, energies, positions)
 
         if self.min_position <= ivu_gap_position <= self.max_position:
-            return (ivu_gap_position,)
+            return pass_through((ivu_gap_position,), curr_physical_pos, (self.gap_deadband,))
         else:
             raise Exception("Requested position out of limits")
 
     def CalcAllPseudo(self, physicals, curr_pseudo_pos):
-        return (self.current_energy,)
+        # the energy of the gap the IVU is at, not of the last request, so
+        # calculations leave the reported energy alone
+        self._get_table()
+        positions, energies = self.inverse
+        publish_read(self, physicals, ivu_gap=physicals[0])
+        return (float(interp(physicals[0], positions, energies)),)
@@ -23,7 +23,10 @@ from sardana.pool.controller import MotorController, PseudoMotorController
 from sardana.pool.controller import Type
 from sardana.pool.controller import Description
 
+from ctrl.instrumentation import instrumented
 
+
+@instrumented
 class SlitController(PseudoMotorController):
     """A Slit pseudo motor controller for handling gap and offset pseudo 
        motors. The system uses to real motors sl2t (top slit) and sl2b (bottom
@@ -24,11 +24,20 @@ from sardana.pool.controller import Description
 from sardana.pool.controller import DefaultValue
 from sardana.pool.controller import DataAccess
 from sardana.pool.controller import Access
+from sardana.pool.controller import FGet
+from sardana.pool.controller import MaxDimSize
 from PyTango import *
 
 import math
 import numpy as np
 
+from ctrl.attenuator import (ENERGY_RANGE, thickness_index, angle_to_position,
+                             positions_to_angles)
+from ctrl.energyhint import subscribe
+from ctrl.instrumentation import instrumented, timed, wrap_proxy
+from ctrl.sharedstate import MAX_AGE, publish_read, reader
+from ctrl.warmup import WarmUp
+
 
 # coefficients of the Al/Ti polynomial model obtained by least squares
 # minimization between experimentally determined and fitted attenuation
@@ -50,69 +59,32 @@ bcu_att1_lengths = [float(l) for l in range(0, 600, 60)]
 bcu_att2_lengths = [float(l) for l in range(0, 750, 75)]
 bcu_att3_lengths = [float(l) for l in range(0, 60, 6)]
 
+# (lengths, model coefficients) of the 3 wheels, for ctrl.attenuator
+bcu_wheels = ((tuple(bcu_att1_lengths), tuple(Al_coeff)),
+              (tuple(bcu_att2_lengths), tuple(Ti_coeff)),
+              (tuple(bcu_att3_lengths), tuple(Al_coeff)))
+# the distinct (Al, Ti) total thicknesses of all the wheel combinations
+bcu_index = thickness_index(bcu_wheels)
+
 
-# define the bcu_wheel class
-class bcu_wheel(object):
+def to_kev(energy):
     '''
-    contains all the information about a bcu_wheel such as:
-    position - an integer from 0 to 9
-    angles - a list of floats: all available wheel angles (positions)
-    lengths - an array of lengths (thicknesses) at each wheel position
-    transmission - an array of floats (0,1]: transmission values for the given energy
-    energy - a float: the energy of the X-rays (in keV)
-    model - the model coeff for the wheel material (for calculating att. length)
-    att_l - a float: the att. length of the material for the given energy
+    energy in eV to keV, rounded to the eV as the controller uses it
     '''
-    def __init__(self, lengths, model, energy):
-        '''
-        initializes the bcu_wheel object: sets the position to 0,
-        calculates the att_l and the transmission values for the given energy
-        lengths - a list of floats (available lengths in um)
-        model - a np.array of model coefficients
-        energy - a float (in keV)
-        '''
-        self.energy = energy
-        self.lengths = np.array(lengths)
-        self.model = model
-        self.position = 0
-        self.angles = [float(a) for a in range(0, 360, 36)]
-        self.att_l = np.polyval(self.model, self.energy)
-        self.transmission = np.exp(-self.lengths/self.att_l)
-
-    def set_position(self, new_position):
-        '''
-        new_position - an integer between 0 and 9
-        '''
-        assert type(new_position) == int, 'wrong input type. position must be an int'
-        assert new_position <= 9 and new_position >= 0, 'new position out of range'
-        self.position = new_position
-
-    def set_energy(self, new_energy):
-        '''
-        updates the value of the energy, recalculates the att. length and the
-        transmission values
-        '''
-        assert new_energy <= 30.0 and new_energy >= 5.0, 'new energy value out of range'
-        self.energy = new_energy
-        self.att_l = np.polyval(self.model, self.energy)
-        self.transmission = np.exp(-self.lengths/self.att_l)
-
-    def get_position(self):
-        return self.position
-
-    def get_angle(self):
-        return self.angles[self.position]
-
-    def get_transmission(self):
-        return self.transmission[self.position]
-
+    return float("{0:.3f}".format(energy / 1000.0))
 
 
+@instrumented
 class Transmission(PseudoMotorController):
     """
     Energy pseudo motor controller for handling energy calculation given the positions
     of all the motors involved (and viceversa).
     TODO: at this stage x2per is not updated
+
+    The calculations only read the shared thickness index of
+    ctrl.attenuator and the energy, so concurrent calls need no locking.
+    An energy change computes the transmission of every wheel combination
+    with one dot product.
     """
     gender = "Transmission"
     model = "BCU Transmission"
@@ -122,47 +94,90 @@ class Transmission(PseudoMotorController):
     # Bragg angle or Goniometer actuator, 2nd Crystal Motorised Perpendicular Translation (Tx)
     motor_roles = ("bcu_att1", "bcu_att2", "bcu_att3")
 
+    # all the transmissions the wheels can give at the current energy, so
+    # clients can pick one instead of trying values
+    axis_attributes = {'TransmissionSpectrum':
+                        {Type: (float,),
+                         Description: 'Achievable transmissions at the current energy, sorted [%]',
+                         Access: DataAccess.ReadOnly,
+                         FGet: 'get_spectrum',
+                         MaxDimSize: (1000,)},
+                       'TransmissionSpectrumAngles':
+                        {Type: ((float,),),
+                         Description: 'bcu_att1/2/3 angles of each TransmissionSpectrum value [deg]',
+                         Access: DataAccess.ReadOnly,
+                         FGet: 'get_spectrum_angles',
+                         MaxDimSize: (3, 1000)},
+                       }
+
     def __init__(self, inst, props, *args, **kwargs):
         PseudoMotorController.__init__(self, inst, props, *args, **kwargs)
         self.energy_attr = None
-        self.bcu_att1_wheel = None
-        self.bcu_att2_wheel = None
-        self.bcu_att3_wheel = None
+        # reads the energy and computes its transmissions before the first call
+        self.warm_up = WarmUp(self._log, self.initialize_proxy)
+        # the transmissions at the target of an energy move, computed during the move
+        subscribe(self, 'prepare_energy')
 
+    @timed
     def initialize_proxy(self):
         '''Energy motor migth not be ready during __init__'''
-        self.energy_attr = AttributeProxy('b311a-o/opt/mono-ener/Position')
-        E = self.energy_attr.read().value / 1000  # to keV
-        E = float("{0:.3f}".format(E))
-        # construct the 3 bcu_att wheels
-        # bcu_att1: Al
-        self.bcu_att1_wheel = bcu_wheel(bcu_att1_lengths, Al_model, E)
-        # bcu_att2: Ti
-        self.bcu_att2_wheel = bcu_wheel(bcu_att2_lengths, Ti_model, E)
-        # bcu_att3: Al
-        self.bcu_att3_wheel = bcu_wheel(bcu_att3_lengths, Al_model, E)
-
-    def set_all_positions(self, p1, p2, p3):
+        energy_attr = wrap_proxy(AttributeProxy('b311a-o/opt/mono-ener/Position'), self,
+                                 'b311a-o/opt/mono-ener/Position')
+        bcu_index.transmissions(self.read_energy(energy_attr))
+        # set last, the controller is initialized once it is not None
+        self.energy_attr = energy_attr
+
+    def _ready(self):
         '''
-        sets all the three wheels to positions p1, p2, and p3
+        waits for the warm-up and initializes here if it failed
         '''
-        self.bcu_att1_wheel.set_position(p1)
-        self.bcu_att2_wheel.set_position(p2)
-        self.bcu_att3_wheel.set_position(p3)
-        
-    def get_tot_transmission(self):
+        self.warm_up.wait()
+        if self.energy_attr is None:
+            self.initialize_proxy()
+
+    def read_energy(self, energy_attr=None):
+        '''
+        returns the mono energy in keV, rounded to the eV; the one Energy
+        published in the shared state when recent (see ctrl.sharedstate)
+        '''
+        shared = reader() if energy_attr is None else None
+        if shared is not None:
+            energy = shared.value('mono_energy', MAX_AGE)
+            if energy is not None:
+                return to_kev(energy)
+        return to_kev((energy_attr or self.energy_attr).read().value)
+
+    def prepare_energy(self, energy):
+        '''
+        computes the transmissions at energy (in eV, the target of a move)
+        and the eV next to it, where the mono may end up
+        '''
+        E = to_kev(energy)
+        for kev in (E, to_kev(energy - 1), to_kev(energy + 1)):
+            if ENERGY_RANGE[0] <= kev <= ENERGY_RANGE[1]:
+                bcu_index.transmissions(kev)
+        if ENERGY_RANGE[0] <= E <= ENERGY_RANGE[1]:
+            bcu_index.spectrum(E)
+
+    def get_spectrum(self, axis):
+        '''
+        the sorted achievable transmissions (in %) at the current energy,
+        the shared read-only array of ctrl.attenuator
+        '''
+        self._ready()
+        return bcu_index.spectrum(self.read_energy())[0]
+
+    def get_spectrum_angles(self, axis):
         '''
-        gets the total combined transmission for the given wheel configuration
-        and energy value
+        the (bcu_att1, bcu_att2, bcu_att3) angles of each get_spectrum() value
         '''
-        tot_trans = self.bcu_att1_wheel.get_transmission() * \
-                    self.bcu_att2_wheel.get_transmission() * \
-                    self.bcu_att3_wheel.get_transmission() * 100.0
-        return tot_trans
-        
+        self._ready()
+        return bcu_index.spectrum(self.read_energy())[1]
+
+    @timed
     def set_transmission(self, transmission, E):
         '''
-        sets the transmission for the specified E
+        finds the wheel combination for the transmission at the specified E
         transmission - a float (transmission in %)
         E - a float (photon energy in keV)
 
@@ -170,29 +185,10 @@ class Transmission(PseudoMotorController):
         and the true value of the transmission (in %):
         ((bcu_att1, bcu_att2, bcu_att3), act_trans)
         '''
-        # a brute force algorithm for finding the wheel combination that best matches
-        # the desired transmission for the given X-ray energy
-        # the starting positions of all 3 wheels are  0
-        pos = [0, 0, 0]
-        best_trans = 100.0
-        # test all wheel position combinations and pick the best one
-        for p1 in range(10):
-            for p2 in range(10):
-                for p3 in range(10):
-                    # set the wheels to the desired positions and
-                    # calculate the total transmission
-                    self.set_all_positions(p1, p2, p3)
-                    tot_trans = self.get_tot_transmission()
-                    if abs(transmission - tot_trans) < abs(transmission - best_trans):
-                        best_trans = tot_trans
-                        pos = [p1, p2, p3]
-
-        # set the wheels to the optimal positions and get the value of the
-        # actual total transmission and the angles of the 3 wheels
-        self.set_all_positions(pos[0], pos[1], pos[2])
-        actual_trans = self.get_tot_transmission()
-        angles = (self.bcu_att1_wheel.get_angle(), self.bcu_att2_wheel.get_angle(), self.bcu_att3_wheel.get_angle())
-        return (angles, actual_trans)
+        # the combination that best matches the desired transmission for the
+        # given X-ray energy, out of all of them
+        positions, actual_trans = bcu_index.best_positions(transmission, E)
+        return (positions_to_angles(positions), actual_trans)
 
     def CalcPseudo(self, index, physicals, curr_pseudo_pos):
         return self.CalcAllPseudo(physicals, curr_pseudo_pos)[index - 1]
@@ -202,56 +198,22 @@ class Transmission(PseudoMotorController):
 
     def CalcAllPhysical(self, pseudos, curr_physical_pos):
         transmission = pseudos[0]  # [%]
+        self._ready()
 
-        current_energy = self.energy_attr.read().value / 1000  # to keV
-        current_energy = float("{0:.3f}".format(current_energy))
-
-        # update the wheel transmission based on current energy
-        if self.bcu_att1_wheel.energy != current_energy:
-            self.bcu_att1_wheel.set_energy(current_energy)
-            self.bcu_att2_wheel.set_energy(current_energy)
-            self.bcu_att3_wheel.set_energy(current_energy)
-
+        current_energy = self.read_energy()
         angles, actual_trans = self.set_transmission(transmission, current_energy)
 
         return angles  #deg
 
 
     def CalcAllPseudo(self, physicals, curr_pseudo_pos):
-        if self.energy_attr is None:
-            self.initialize_proxy()
+        self._ready()
         bcu_att1, bcu_att2, bcu_att3 = physicals
-        current_energy = self.energy_attr.read().value / 1000
-        current_energy = float("{0:.3f}".format(current_energy))
-        print bcu_att1, bcu_att2, bcu_att3, current_energy
-        # make sure the energy setting of the wheels is correct and if not
-        # update this parameter
-        if self.bcu_att1_wheel.energy != current_energy:
-            self.bcu_att1_wheel.set_energy(current_energy)
-            self.bcu_att2_wheel.set_energy(current_energy)
-            self.bcu_att3_wheel.set_energy(current_energy)
-        
+        current_energy = self.read_energy()
+
         # get the wheel positions from the motor angle values (round to the closest 36 degree increment)
-        # then set the bcu wheels to those positions and return the total transmission for the whole
-        # configuration and energy value
-        def calc_pos(motor_angle):
-            '''
-            get the closest position for the given motor angle value
-            '''
-            if motor_angle > 342:
-                position = 0
-            elif motor_angle % 36 > 18:
-                position = math.ceil(motor_angle / 36)
-            else:
-                position = math.floor(motor_angle / 36)
-            return position
-
-        # get all the wheel positions and set the wheels
-        pos1, pos2, pos3 = calc_pos(bcu_att1), calc_pos(bcu_att2), calc_pos(bcu_att3)
-        try:
-            self.set_all_positions(int(pos1), int(pos2), int(pos3))
-            transmission = self.get_tot_transmission()
-        except Exception as ex:
-            print ex
+        # and return the total transmission for the whole configuration and energy value
+        pos1, pos2, pos3 = angle_to_position(bcu_att1), angle_to_position(bcu_att2), angle_to_position(bcu_att3)
+        transmission = bcu_index.transmission((pos1, pos2, pos3), current_energy)
+        publish_read(self, physicals, transmission=transmission)
         return (transmission,)
-
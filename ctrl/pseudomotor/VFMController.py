@@ -23,10 +23,13 @@ from sardana.pool.controller import PseudoMotorController
 from sardana.pool.controller import Type
 from sardana.pool.controller import Description
 
+from ctrl.instrumentation import instrumented
+
 VFM_XDISTANCE = 0.472
 VFM_YDISTANCE = 0.4975
 VFM_Y2Y3DISTANCE =  0.260
 
+@instrumented
 class VFMXYaw(PseudoMotorController):
     """A pseudo motor controller for handling x and yaw pseudo 
        motors of the Vertical Focusing Mirror. The system uses to real motors mir1x1 (vfm_x1) and mir1x2(vfm_x2)."""
@@ -66,6 +69,7 @@ class VFMXYaw(PseudoMotorController):
         return (vfm_x, vfm_yaw)
 
 
+@instrumented
 class VFMYPitchRoll(PseudoMotorController):
     """A pseudo motor controller for handling y, pitch and roll pseudo 
        motors of the Vertical Focusing Mirror. The system uses to real motors mir1y1, mir1y2 and mir1y3 
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+
+"""Sampling of Tango attributes at a fixed rate during an acquisition.
+
+A Sampler owns one daemon thread and a preallocated SampleBuffer per
+attribute. start() clears the buffers and samples the given attributes
+every 1/rate seconds for the integration time; the statistics of the
+samples are then available without another Tango call:
+
+    sampler = Sampler(rate=100, size=10000, log=self._log)
+    sampler.start({'r3-311l/id/idivu-01_gap/Gap': proxy}, 1.0)
+    while sampler.acquiring:
+        ...
+    sampler.statistic('r3-311l/id/idivu-01_gap/Gap', 'std')
+
+The attributes are read one after the other in the sampling thread; when
+the reads take longer than the period the rate drops and the count shows
+it. A buffer keeps the last size samples of an acquisition. close()
+ends the thread of a Sampler that is not needed anymore.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import threading
+import time
+
+import numpy
+
+STATISTICS = ('mean', 'std', 'count', 'min', 'max')
+
+NAN = float('nan')
+
+
+class SampleBuffer(object):
+    """The (timestamp, value) samples of one attribute in one acquisition."""
+
+    __slots__ = ('times', 'values', 'count', 'error')
+
+    def __init__(self, size):
+        self.times = numpy.zeros(size)
+        self.values = numpy.zeros(size)
+        self.count = 0
+        # the message of the last failed read, None after a good one
+        self.error = None
+
+    def clear(self):
+        self.count = 0
+        self.error = None
+
+    def add(self, timestamp, value):
+        index = self.count % len(self.values)
+        self.times[index] = timestamp
+        self.values[index] = value
+        self.count += 1
+
+    def samples(self):
+        """(times, values) in the buffer, oldest first."""
+        count = self.count
+        size = len(self.values)
+        if count <= size:
+            return self.times[:count].copy(), self.values[:count].copy()
+        order = numpy.arange(count - size, count) % size
+        return self.times[order], self.values[order]
+
+    def statistic(self, name):
+        if name == 'count':
+            return self.count
+        values = self.samples()[1]
+        if not len(values):
+            return NAN
+        if name == 'mean':
+            return float(values.mean())
+        if name == 'std':
+            return float(values.std())
+        if name == 'min':
+            return float(values.min())
+        if name == 'max':
+            return float(values.max())
+        raise Exception("unknown statistic %s, expected one of %s" % (name, ", ".join(STATISTICS)))
+
+
+class Sampler(object):
+    """Samples attributes at rate [Hz] into buffers of size samples."""
+
+    def __init__(self, rate, size, log):
+        self.period = 1.0 / rate
+        self.size = size
+        self.log = log
+        self.buffers = {}
+        self.acquiring = False
+        self._proxies = {}
+        self._end = 0.0
+        self._lock = threading.Lock()
+        self._go = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    def buffer(self, name):
+        buf = self.buffers.get(name)
+        if buf is None:
+            buf = self.buffers[name] = SampleBuffer(self.size)
+        return buf
+
+    def start(self, proxies, integration_time):
+        """Sample proxies ({attribute name: proxy}) for integration_time [s]."""
+        with self._lock:
+            for name in proxies:
+                self.buffer(name).clear()
+            self._proxies = dict(proxies)
+            self._end = time.time() + integration_time
+            self.acquiring = True
+            self._go.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ctrl-sampler')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._end = 0.0
+
+    def close(self):
+        """Stop sampling and end the sampling thread."""
+        with self._lock:
+            self._end = 0.0
+            self._closed = True
+            self._go.set()
+
+    def statistic(self, name, statistic):
+        buf = self.buffers.get(name)
+        if buf is None:
+            return 0 if statistic == 'count' else NAN
+        return buf.statistic(statistic)
+
+    def _finished(self):
+        with self._lock:
+            if time.time() < self._end:
+                return False
+            self.acquiring = False
+            if not self._closed:
+                self._go.clear()
+            return True
+
+    def _run(self):
+        while True:
+            self._go.wait()
+            if self._closed:
+                return
+            next_sample = time.time()
+            while not self._finished():
+                for name, proxy in self._proxies.items():
+                    buf = self.buffers[name]
+                    try:
+                        value = float(proxy.read().value)
+                    except Exception as e:
+                        if buf.error is None:
+                            self.log.error("error sampling %s: %s" % (name, str(e)))
+                        buf.error = str(e)
+                        continue
+                    buf.add(time.time(), value)
+                    buf.error = None
+                next_sample += self.period
+                delay = next_sample - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # too slow for the rate, do not try to catch up
+                    next_sample = time.time()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+
+"""Beamline values published by the controllers in a memory-mapped file.
+
+Set BIOMAX_CTRL_SHARED to a file name in the Pool environment (e.g.
+/dev/shm/biomax-ctrl-state) to enable it. The controllers then publish
+the values they read anyway, with the time they were published:
+
+    mono_energy      [eV], Energy
+    strip            Si, Rh or unknown, MirrorStripChooser
+    piezo_hfm_fpit   the PI625 axis with SharedName piezo_hfm_fpit
+    piezo_vfm_fpit   the PI625 axis with SharedName piezo_vfm_fpit
+    transmission     [%], Transmission
+    ivu_gap          [mm], IVUEnergy
+
+The pseudo motor controllers publish from CalcAllPseudo through
+publish_read(), which checks that the physicals are the positions the
+Pool has of their motors. Clients can also call CalcAllPseudo for any
+other positions, and those calculations are not published.
+
+Other processes on the Pool host read them without a Tango call:
+
+    state = SharedState('/dev/shm/biomax-ctrl-state')
+    state.snapshot()
+    # {'seq': 1234, 'mono_energy': (12658.0, 1500000000.1), 'strip': ('Rh', ...), ...}
+
+    $ python -m ctrl.sharedstate /dev/shm/biomax-ctrl-state
+
+The file is a header (magic, version, number of fields, sequence) and a
+(value, timestamp) pair of doubles per field. It is guarded by a seqlock:
+the writer makes the sequence odd, writes, and makes it even again, and
+a reader retries until it reads the same even sequence before and after
+copying the fields. Readers take no lock and never block the Pool. A
+value never published has a timestamp of 0.
+
+Transmission takes the mono energy from there instead of reading it over
+Tango when Energy published it in the last BIOMAX_CTRL_SHARED_MAX_AGE
+seconds (default 1).
+
+Importing this module opens nothing: the controller modules are imported
+by the MacroServer too, which must not take over the file. A process
+opens it for writing on its first publish, which only the controllers
+running in the Pool do, and otherwise read-only through reader().
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+FIELDS = ('mono_energy', 'strip', 'piezo_hfm_fpit', 'piezo_vfm_fpit', 'transmission', 'ivu_gap')
+STRIPS = ('unknown', 'Si', 'Rh')
+
+MAGIC = b'BIOMAXST'
+VERSION = 1
+HEADER = struct.Struct('<8sII')
+SEQ = struct.Struct('<Q')
+SEQ_OFFSET = HEADER.size
+VALUES_OFFSET = SEQ_OFFSET + SEQ.size
+VALUE = struct.Struct('<dd')
+VALUES = struct.Struct('<' + 'dd' * len(FIELDS))
+SIZE = VALUES_OFFSET + VALUES.size
+
+RETRIES = 1000
+FILENAME = os.environ.get('BIOMAX_CTRL_SHARED', '')
+MAX_AGE = float(os.environ.get('BIOMAX_CTRL_SHARED_MAX_AGE', 1.0))
+
+_log = logging.getLogger(__name__)
+
+
+class SharedState(object):
+    """The shared values in filename; only one process may be the writer."""
+
+    def __init__(self, filename, writer=False):
+        self.filename = filename
+        self.writer = writer
+        self._lock = threading.Lock()
+        if writer:
+            fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                # the same file is reused, so readers keep their mapping across restarts
+                if os.fstat(fd).st_size < SIZE:
+                    os.ftruncate(fd, SIZE)
+                self._map = mmap.mmap(fd, SIZE, access=mmap.ACCESS_WRITE)
+            finally:
+                os.close(fd)
+            magic, version, fields = HEADER.unpack_from(self._map, 0)
+            seq = SEQ.unpack_from(self._map, SEQ_OFFSET)[0]
+            if (magic, version, fields) != (MAGIC, VERSION, len(FIELDS)):
+                seq = 0
+                HEADER.pack_into(self._map, 0, MAGIC, VERSION, len(FIELDS))
+                VALUES.pack_into(self._map, VALUES_OFFSET, *([0.0] * (2 * len(FIELDS))))
+            # even again if the last writer died in the middle of a write
+            SEQ.pack_into(self._map, SEQ_OFFSET, seq + (seq & 1))
+        else:
+            fd = os.open(filename, os.O_RDONLY)
+            try:
+                self._map = mmap.mmap(fd, SIZE, access=mmap.ACCESS_READ)
+            finally:
+                os.close(fd)
+            magic, version, fields = HEADER.unpack_from(self._map, 0)
+            if (magic, version, fields) != (MAGIC, VERSION, len(FIELDS)):
+                raise Exception("%s is not a shared state file of this version" % filename)
+
+    def publish(self, **values):
+        """Set the named fields to values, at once and with the time now."""
+        now = time.time()
+        if 'strip' in values:
+            strip = values['strip']
+            values['strip'] = STRIPS.index(strip) if strip in STRIPS else 0
+        # packed before the write, which readers retry while it lasts
+        fields = [(VALUES_OFFSET + VALUE.size * FIELDS.index(name), VALUE.pack(value, now))
+                  for name, value in values.items()]
+        with self._lock:
+            seq = SEQ.unpack_from(self._map, SEQ_OFFSET)[0]
+            SEQ.pack_into(self._map, SEQ_OFFSET, seq + 1)
+            for offset, data in fields:
+                self._map[offset:offset + VALUE.size] = data
+            SEQ.pack_into(self._map, SEQ_OFFSET, seq + 2)
+
+    def snapshot(self, retries=RETRIES):
+        """{'seq': sequence, field: (value, timestamp)}, all from the same moment."""
+        for attempt in range(retries):
+            if attempt:
+                # let the writer finish, waiting longer the more it takes
+                time.sleep(min(attempt, 100) * 1e-6)
+            seq = SEQ.unpack_from(self._map, SEQ_OFFSET)[0]
+            if seq & 1:
+                continue
+            values = VALUES.unpack_from(self._map, VALUES_OFFSET)
+            if SEQ.unpack_from(self._map, SEQ_OFFSET)[0] != seq:
+                continue
+            result = {'seq': seq}
+            for i, name in enumerate(FIELDS):
+                result[name] = (values[2 * i], values[2 * i + 1])
+            code = int(result['strip'][0])
+            result['strip'] = (STRIPS[code] if 0 <= code < len(STRIPS) else STRIPS[0],
+                               result['strip'][1])
+            return result
+        raise Exception("%s is being written too often to read it" % self.filename)
+
+    def value(self, name, max_age):
+        """The value of name if published in the last max_age seconds, else None."""
+        value, timestamp = self.snapshot()[name]
+        if time.time() - timestamp > max_age:
+            return None
+        return value
+
+
+# the SharedState of FILENAME this process opened, a writer once it published
+_state = None
+_failed = False
+_state_lock = threading.Lock()
+
+
+def _open(writer):
+    global _state, _failed
+    with _state_lock:
+        if _failed or (_state is not None and (_state.writer or not writer)):
+            return _state
+        try:
+            _state = SharedState(FILENAME, writer)
+        except Exception as e:
+            if writer:
+                # the Pool goes on without it rather than fail every read
+                _log.error("cannot publish to %s: %s", FILENAME, e)
+                _failed = True
+            # a reader tries again: the Pool may not have published yet
+            return None
+        return _state
+
+
+def writer():
+    """The shared state to publish to, opened for writing on the first
+    call; None when it is disabled (see the module)."""
+    state = _state
+    if state is not None and state.writer:
+        return state
+    if not FILENAME:
+        return None
+    return _open(True)
+
+
+def reader():
+    """The shared state to read: the writer when this process publishes,
+    else the file opened read-only; None when it is disabled or nothing
+    was published yet."""
+    state = _state
+    if state is not None or not FILENAME:
+        return state
+    return _open(False)
+
+
+def publish(**values):
+    """Publish values if the shared state is enabled (see the module)."""
+    state = writer()
+    if state is not None:
+        state.publish(**values)
+
+
+def pool_positions(controller):
+    """The positions the Pool has of the motors of a pseudo motor controller."""
+    return tuple(controller.GetMotor(role).get_position().value
+                 for role in controller.motor_roles)
+
+
+def publish_read(controller, physicals, **values):
+    """Publish values a pseudo motor controller calculated from physicals,
+    only if those are the positions the Pool has of its motors."""
+    if not FILENAME:
+        return
+    try:
+        current = pool_positions(controller)
+    except Exception:
+        return
+    if tuple(physicals) == current:
+        publish(**values)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        sys.stderr.write("usage: python -m ctrl.sharedstate FILE\n")
+        return 2
+    snapshot = SharedState(argv[0]).snapshot()
+    now = time.time()
+    sys.stdout.write("seq %d\n" % snapshot['seq'])
+    for name in FIELDS:
+        value, timestamp = snapshot[name]
+        age = "never" if not timestamp else "%.3f s ago" % (now - timestamp)
+        sys.stdout.write("%-16s %-14s %s\n" % (name, value, age))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+
+
+"""Optional recorder of the Tango traffic and calls of the controllers.
+
+Set BIOMAX_CTRL_RECORD to a file name in the Pool environment to enable
+it. Every proxy returned by ctrl.instrumentation.wrap_proxy() then records
+each attribute read, write and command with its arguments, value, quality,
+latency and error, and every controller decorated with instrumented()
+records its construction (class, instance name and properties) and the
+Pool calls it serves (see RECORDED_METHODS) with their results.
+
+benchmarks/replay.py rebuilds the controllers from such a file and
+replays the calls against the recorded Tango responses and latencies, so
+a change can be checked against a real beamline session off-line.
+The file is appended to, so the sessions of a Pool before a restart are
+kept, and recording stops when it grows over BIOMAX_CTRL_RECORD_MAX_MB
+(default 1024).
+
+Each session is a header followed by records of a fixed struct header
+(kind, owner, name, start, seconds, payload size) and a payload, marshal
+or pickle encoded. Labels, operation and method names are written once as
+STRING records and referred to by number afterwards. As in ctrl.tracing,
+recording only appends to a deque and a daemon thread does the file I/O.
+The deque holds at most BIOMAX_CTRL_RECORD_BUFFER records (default
+100000): when the writer falls behind, new records are dropped and a
+DROPPED record gives their count.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import atexit
+import logging
+import marshal
+import os
+import pickle
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+MAGIC = b'BMXREC\x01\n'
+
+# record kinds
+STRING, TANGO, CALL, CTRL, DROPPED = range(5)
+
+# kind, owner id, name id, start (epoch s), duration (s), payload size
+HEADER = struct.Struct('<BIIdfI')
+
+RECORDED_METHODS = ('AddDevice', 'DeleteDevice', 'StateOne', 'ReadOne',
+                    'PreStartOne', 'StartOne', 'AbortOne', 'StopOne',
+                    'SetPar', 'SetAxisPar', 'SetAxisExtraPar', 'SendToCtrl',
+                    'CalcAllPhysical', 'CalcAllPseudo')
+
+_clock = getattr(time, 'perf_counter', time.time)
+_log = logging.getLogger(__name__)
+
+
+try:
+    _SCALARS = (type(None), bool, int, long, float, str, unicode)
+except NameError:
+    _SCALARS = (type(None), bool, int, float, str, bytes)
+
+
+def _plain(obj):
+    """True for values marshal writes as themselves (it would write e.g. a
+    numpy scalar as its raw bytes)."""
+    if type(obj) in _SCALARS:
+        return True
+    if type(obj) in (tuple, list):
+        return all(_plain(item) for item in obj)
+    if type(obj) is dict:
+        return all(_plain(key) and _plain(value) for key, value in obj.items())
+    return False
+
+
+def encode(obj):
+    """Tagged marshal (plain Python values) or pickle (anything else)."""
+    if _plain(obj):
+        return b'M' + marshal.dumps(obj)
+    try:
+        return b'P' + pickle.dumps(obj, 2)
+    except Exception:
+        return b'R' + repr(obj).encode('utf-8', 'replace')
+
+
+def decode(data):
+    tag, body = data[:1], data[1:]
+    if tag == b'M':
+        return marshal.loads(body)
+    if tag == b'P':
+        return pickle.loads(body)
+    return body.decode('utf-8', 'replace')
+
+
+def outcome(result):
+    """The recordable form of what a call returned.
+
+    ('A', value, quality, w_value) for a DeviceAttribute, ('S', name) for a
+    DevState and ('V', result) for anything else.
+    """
+    if hasattr(result, 'quality') and hasattr(result, 'value'):
+        return ('A', result.value, str(result.quality), getattr(result, 'w_value', None))
+    if type(result).__name__ == 'DevState':
+        return ('S', str(result))
+    return ('V', result)
+
+
+def error_outcome(exc):
+    """('E', [(reason, desc, origin)]) for a DevFailed, else ('X', type, message)."""
+    errors = getattr(exc, 'args', ())
+    if errors and all(hasattr(e, 'reason') and hasattr(e, 'desc') for e in errors):
+        return ('E', [(str(e.reason), str(e.desc), str(getattr(e, 'origin', '')))
+                      for e in errors])
+    return ('X', type(exc).__name__, str(exc))
+
+
+class Recorder(object):
+    """Encodes records in the calling thread and writes them from a daemon one."""
+
+    def __init__(self, filename, max_bytes=1 << 30, flush_period=0.5, max_records=100000):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.flush_period = flush_period
+        self.epoch_offset = time.time() - _clock()
+        self._strings = {}
+        self._ctrl_ids = 0
+        self._id_lock = threading.Lock()
+        self._local = threading.local()
+        self._buffer = deque()
+        self.max_records = max_records
+        # records refused by the full buffer, and how many the file reports
+        self.dropped = 0
+        self._reported = 0
+        self._file = None
+        self._full = False
+        self._write_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='ctrl-recorder')
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _string(self, text):
+        string_id = self._strings.get(text)
+        if string_id is None:
+            with self._id_lock:
+                string_id = self._strings.get(text)
+                if string_id is None:
+                    string_id = len(self._strings) + 1
+                    data = text.encode('utf-8')
+                    # queued before the id can be used by any other record
+                    self._buffer.append(HEADER.pack(STRING, string_id, 0, 0.0, 0.0, len(data)) + data)
+                    self._strings[text] = string_id
+        return string_id
+
+    def _accepting(self):
+        """False once the file is full, or while the writer is behind (the
+        record is then counted as dropped), so nothing is encoded for it."""
+        if self._full:
+            return False
+        if len(self._buffer) >= self.max_records:
+            # not locked: the count may miss a few under contention
+            self.dropped += 1
+            return False
+        return True
+
+    def _append(self, kind, owner, name, start, seconds, payload):
+        # unlike the tracer's, the oldest records are never pushed out: a
+        # STRING or CTRL record lost would make the later ones unreadable
+        self._buffer.append(HEADER.pack(kind, owner, name, start + self.epoch_offset,
+                                        seconds, len(payload)) + payload)
+
+    def register(self, ctrl, inst, props):
+        """Record the construction of a controller and number it."""
+        if '_record_id' in ctrl.__dict__ or self._full:
+            return
+        with self._id_lock:
+            self._ctrl_ids += 1
+            ctrl_id = self._ctrl_ids
+        ctrl.__dict__['_record_id'] = ctrl_id
+        cls = type(ctrl)
+        module = cls.__module__
+        path = getattr(sys.modules.get(module), '__file__', '')
+        payload = encode((module, os.path.basename(path or ''), inst, dict(props or {})))
+        self._append(CTRL, ctrl_id, self._string(cls.__name__), _clock(), 0.0, payload)
+
+    def tango(self, label, op, start, end, args, result=None, exc=None):
+        """Record one Tango round-trip; start/end come from the perf clock."""
+        if not self._accepting():
+            return
+        done = error_outcome(exc) if exc is not None else outcome(result)
+        self._append(TANGO, self._string(label), self._string(op), start, end - start,
+                     encode((tuple(args), done)))
+
+    def call(self, ctrl, method, start, end, args, result=None, exc=None):
+        """Record a Pool call of a registered controller."""
+        ctrl_id = ctrl.__dict__.get('_record_id')
+        if ctrl_id is None or not self._accepting():
+            return
+        done = error_outcome(exc) if exc is not None else outcome(result)
+        self._append(CALL, ctrl_id, self._string(method), start, end - start,
+                     encode((tuple(args), done)))
+
+    def enter(self, ctrl):
+        """Return True unless ctrl is already serving a call in this thread.
+
+        Calls a controller makes to itself (or to its base class) replay by
+        themselves and are not recorded.
+        """
+        active = getattr(self._local, 'active', None)
+        if active is None:
+            active = self._local.active = set()
+        if id(ctrl) in active:
+            return False
+        active.add(id(ctrl))
+        return True
+
+    def leave(self, ctrl):
+        self._local.active.discard(id(ctrl))
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_period)
+            self.flush()
+
+    def flush(self):
+        with self._write_lock:
+            self._write()
+
+    def _write(self):
+        buffer = self._buffer
+        dropped = self.dropped
+        if not buffer and dropped == self._reported:
+            return
+        chunks = []
+        while True:
+            try:
+                chunks.append(buffer.popleft())
+            except IndexError:
+                break
+        if self._full:
+            return
+        if dropped != self._reported:
+            chunks.append(HEADER.pack(DROPPED, dropped - self._reported, 0, time.time(), 0.0, 0))
+            self._reported = dropped
+        if self._file is None:
+            self._file = open(self.filename, 'ab')
+            # every session starts with the header, the ids are its own
+            self._file.write(MAGIC)
+        self._file.write(b''.join(chunks))
+        self._file.flush()
+        if self._file.tell() > self.max_bytes:
+            _log.warning("%s is over %d bytes, recording stopped", self.filename, self.max_bytes)
+            self._full = True
+            self._file.close()
+
+
+class RecordingProxy(object):
+    """Wraps a DeviceProxy/AttributeProxy recording every Tango round-trip.
+
+    Operations are named after the attribute for reads (Position), the
+    attribute followed by = for writes (Position=) and the method followed
+    by () for calls (read(), State()).
+    """
+
+    def __init__(self, proxy, label, recorder):
+        object.__setattr__(self, '_proxy', proxy)
+        object.__setattr__(self, '_label', label)
+        object.__setattr__(self, '_recorder', recorder)
+
+    def __getattr__(self, name):
+        start = _clock()
+        try:
+            value = getattr(self._proxy, name)
+        except Exception as e:
+            self._recorder.tango(self._label, name, start, _clock(), (), exc=e)
+            raise
+        if not callable(value):
+            self._recorder.tango(self._label, name, start, _clock(), (), value)
+            return value
+        recorder, label, op = self._recorder, self._label, name + '()'
+
+        def call(*args, **kwargs):
+            start = _clock()
+            try:
+                result = value(*args, **kwargs)
+            except Exception as e:
+                recorder.tango(label, op, start, _clock(), args, exc=e)
+                raise
+            recorder.tango(label, op, start, _clock(), args, result)
+            return result
+        return call
+
+    def __setattr__(self, name, value):
+        start = _clock()
+        try:
+            setattr(self._proxy, name, value)
+        except Exception as e:
+            self._recorder.tango(self._label, name + '=', start, _clock(), (value,), exc=e)
+            raise
+        self._recorder.tango(self._label, name + '=', start, _clock(), (value,))
+
+
+def iter_records(filename):
+    """Yield (kind, owner, name, start, seconds, payload) from a recording.
+
+    STRING records are consumed; for TANGO records owner is the label, for
+    CALL and CTRL records the controller number, numbered on across the
+    sessions of the file. name is the operation, method or class name and
+    payload is decoded. For DROPPED records owner is the number of records
+    dropped, name and payload are None.
+    """
+    strings = {}
+    # the controller numbers of the sessions before the current one
+    offset = last_ctrl = 0
+    with open(filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a controller recording" % filename)
+        while True:
+            header = f.read(HEADER.size)
+            if header.startswith(MAGIC):
+                # the next session (no record kind starts with its bytes)
+                strings = {}
+                offset = last_ctrl
+                header = header[len(MAGIC):] + f.read(len(MAGIC))
+            if len(header) < HEADER.size:
+                return
+            kind, owner, name, start, seconds, size = HEADER.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                return
+            if kind == STRING:
+                strings[owner] = data.decode('utf-8')
+                continue
+            if kind == DROPPED:
+                yield kind, owner, None, start, seconds, None
+                continue
+            if kind == TANGO:
+                owner = strings[owner]
+            else:
+                owner += offset
+                last_ctrl = max(last_ctrl, owner)
+            yield kind, owner, strings[name], start, seconds, decode(data)
+
+
+def _recorder_from_environment():
+    filename = os.environ.get('BIOMAX_CTRL_RECORD', '')
+    if not filename:
+        return None
+    max_mb = float(os.environ.get('BIOMAX_CTRL_RECORD_MAX_MB', 1024))
+    max_records = int(os.environ.get('BIOMAX_CTRL_RECORD_BUFFER', 100000))
+    return Recorder(filename, int(max_mb * (1 << 20)), max_records=max_records)
+
+
+RECORDER = _recorder_from_environment()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+
+"""Optional event tracer for controller calls and Tango round-trips.
+
+Set BIOMAX_CTRL_TRACE to a file name in the Pool environment to enable it.
+Every call timed by ctrl.instrumentation (the controller hot methods, the
+steps decorated with timed() and the Tango calls of wrapped proxies) then
+becomes one event with its start/end time, thread, axis and arguments.
+Nested calls made by the same thread nest in the trace viewer.
+
+A name ending in .json is written in the Chrome trace event format (open
+it in chrome://tracing or Perfetto), anything else as JSON lines. The file
+is appended to, so the trace of a Pool before a restart is kept, and
+rotated when it grows over BIOMAX_CTRL_TRACE_MAX_MB (default 64), keeping
+BIOMAX_CTRL_TRACE_BACKUPS old files (default 3).
+
+Recording an event only appends a tuple to a deque, which is thread safe
+without locking; serialization and file I/O happen in a background thread.
+The deque holds at most BIOMAX_CTRL_TRACE_BUFFER events (default 100000):
+when the writer falls behind the oldest events are dropped, and a
+"dropped" event in the trace gives their count.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class Tracer(object):
+    """Buffers span events and writes them from a daemon thread."""
+
+    def __init__(self, filename, max_bytes=64 << 20, backups=3, flush_period=0.2,
+                 max_events=100000):
+        self.filename = filename
+        self.chrome = filename.endswith('.json')
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_period = flush_period
+        self.pid = os.getpid()
+        # spans are timed with clock(); this maps them back to epoch time
+        self.clock = getattr(time, 'perf_counter', time.time)
+        self.epoch_offset = time.time() - self.clock()
+        self._buffer = deque(maxlen=max_events)
+        # events pushed out of the full buffer, and how many the trace reports
+        self.dropped = 0
+        self._reported = 0
+        self._file = None
+        # only taken by the writers (this thread and atexit), never by span()
+        self._write_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='ctrl-tracer')
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def span(self, name, category, start, end, args):
+        """Record one finished call; start/end come from self.clock()."""
+        thread = threading.current_thread()
+        buffer = self._buffer
+        if len(buffer) == buffer.maxlen:
+            # not locked: the count may miss a few under contention
+            self.dropped += 1
+        buffer.append((name, category, start, end, thread.ident, thread.name, args))
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_period)
+            self.flush()
+
+    def flush(self):
+        with self._write_lock:
+            self._write()
+
+    def _write(self):
+        buffer = self._buffer
+        dropped = self.dropped
+        if not buffer and dropped == self._reported:
+            return
+        lines = []
+        if dropped != self._reported:
+            lines.append(self._format_dropped(dropped - self._reported))
+            self._reported = dropped
+        while True:
+            try:
+                event = buffer.popleft()
+            except IndexError:
+                break
+            lines.append(self._format(event))
+        if self._file is None:
+            self._open()
+        self._file.write(''.join(lines))
+        self._file.flush()
+        if self._file.tell() > self.max_bytes:
+            self._rotate()
+
+    def _format(self, event):
+        name, category, start, end, tid, thread_name, args = event
+        start += self.epoch_offset
+        end += self.epoch_offset
+        if self.chrome:
+            record = {'name': name, 'cat': category, 'ph': 'X',
+                      'ts': start * 1e6, 'dur': (end - start) * 1e6,
+                      'pid': self.pid, 'tid': tid, 'args': args}
+            return json.dumps(record, default=repr) + ',\n'
+        record = {'name': name, 'cat': category, 'start': start, 'end': end,
+                  'thread': thread_name, 'tid': tid, 'args': args}
+        return json.dumps(record, default=repr) + '\n'
+
+    def _format_dropped(self, count):
+        now = time.time()
+        if self.chrome:
+            record = {'name': 'dropped', 'cat': 'tracer', 'ph': 'i', 's': 'g',
+                      'ts': now * 1e6, 'pid': self.pid, 'tid': 0, 'args': {'count': count}}
+            return json.dumps(record) + ',\n'
+        return json.dumps({'name': 'dropped', 'cat': 'tracer', 'start': now, 'end': now,
+                           'args': {'count': count}}) + '\n'
+
+    def _open(self):
+        self._file = open(self.filename, 'a')
+        if self.chrome and not self._file.tell():
+            # the viewers accept a trace array without the closing bracket
+            self._file.write('[\n')
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for n in range(self.backups - 1, 0, -1):
+            older = '%s.%d' % (self.filename, n)
+            if os.path.exists(older):
+                os.rename(older, '%s.%d' % (self.filename, n + 1))
+        if self.backups > 0:
+            os.rename(self.filename, self.filename + '.1')
+
+
+def _tracer_from_environment():
+    filename = os.environ.get('BIOMAX_CTRL_TRACE', '')
+    if not filename:
+        return None
+    max_mb = float(os.environ.get('BIOMAX_CTRL_TRACE_MAX_MB', 64))
+    backups = int(os.environ.get('BIOMAX_CTRL_TRACE_BACKUPS', 3))
+    max_events = int(os.environ.get('BIOMAX_CTRL_TRACE_BUFFER', 100000))
+    return Tracer(filename, int(max_mb * (1 << 20)), backups, max_events=max_events)
+
+
+TRACER = _tracer_from_environment()
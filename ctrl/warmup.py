@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+
+"""Background warm-up of controller state after a Pool restart.
+
+A controller hands the slow preparations it would otherwise do on its
+first call (Tango reads, parsing tables, resolving motors) to a WarmUp
+at the end of __init__. They run in a daemon thread while the Pool is
+still starting; the first call waits for them to finish and then finds
+the state ready:
+
+    def __init__(self, inst, props, *args, **kwargs):
+        ...
+        self.warm_up = WarmUp(self._log, self.initialize_proxy)
+
+    def CalcAllPseudo(self, physicals, curr_pseudo_pos):
+        self.warm_up.wait()
+        if self.energy_attr is None:
+            self.initialize_proxy()  # the warm-up failed, try again
+        ...
+
+A failing step is logged and the remaining ones still run, so the lazy
+path of the controller has to stay in place. BIOMAX_CTRL_WARMUP=0
+disables the thread (wait() returns at once), leaving only the lazy path.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import os
+import threading
+import time
+
+ENABLED = os.environ.get('BIOMAX_CTRL_WARMUP', '1') not in ('', '0')
+
+
+class WarmUp(object):
+    """Runs steps one after the other in a daemon thread.
+
+    ready is set once they all ran; failed lists the names of the ones
+    that raised.
+    """
+
+    def __init__(self, log, *steps):
+        self.log = log
+        self.steps = steps
+        self.ready = threading.Event()
+        self.failed = []
+        self.seconds = 0.0
+        self.enabled = ENABLED
+        if not self.enabled:
+            self.ready.set()
+            return
+        thread = threading.Thread(target=self._run, name='ctrl-warm-up')
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        start = time.time()
+        for step in self.steps:
+            try:
+                step()
+            except Exception as e:
+                name = getattr(step, '__name__', repr(step))
+                self.failed.append(name)
+                self.log.warning("warm-up %s failed: %s" % (name, str(e)))
+        self.seconds = time.time() - start
+        self.log.debug("warm-up done in %.3f s" % self.seconds)
+        self.ready.set()
+
+    def is_ready(self):
+        return self.ready.is_set()
+
+    def wait(self, timeout=None):
+        """Wait for the warm-up; True if every step ran and succeeded."""
+        self.ready.wait(timeout)
+        return self.enabled and self.ready.is_set() and not self.failed
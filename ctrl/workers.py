@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+
+"""Pools of daemon threads running blocking Tango work for the controllers.
+
+    pool = WorkerPool(16, 'ctrl-bulk')
+    tasks = run_all(pool, [(axis, lambda axis=axis: read(axis)) for axis in axes])
+    for task in tasks:
+        task.name, task.result, task.error
+
+The threads of a pool are started on demand, up to its size, and live as
+long as the process (Python 2 has no concurrent.futures).
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class Task(object):
+    """func() to run in a pool, with its result or the exception it raised."""
+
+    __slots__ = ('name', 'func', 'result', 'error', '_done')
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def run(self):
+        try:
+            self.result = self.func()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.func = None
+            self._done.set()
+
+    def ready(self):
+        return self._done.is_set()
+
+    def get(self, timeout=None):
+        """The result, waiting for it; raises what func raised."""
+        if not self._done.wait(timeout):
+            raise Exception("%s still running" % self.name)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class WorkerPool(object):
+    """Runs Tasks in up to workers daemon threads."""
+
+    def __init__(self, workers, name):
+        self.workers = workers
+        self.name = name
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, task):
+        self._queue.put(task)
+        with self._lock:
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run,
+                                          name='%s-%d' % (self.name, len(self._threads)))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        return task
+
+    def _run(self):
+        while True:
+            self._queue.get().run()
+
+
+def _timed_out(name, timeout):
+    task = Task(name, None)
+    task.error = Exception("timed out after %g s" % timeout)
+    task._done.set()
+    return task
+
+
+def run_all(pool, calls, timeout=None):
+    """Run [(name, func)] concurrently in pool; return their finished Tasks.
+
+    The calls not finished within timeout [s] (for all of them) come back
+    as Tasks with a "timed out" error; they go on running in the pool.
+    """
+    tasks = [pool.submit(Task(name, func)) for name, func in calls]
+    if timeout is None:
+        for task in tasks:
+            task._done.wait()
+        return tasks
+    deadline = time.time() + timeout
+    return [task if task._done.wait(max(deadline - time.time(), 0)) else
+            _timed_out(task.name, timeout) for task in tasks]
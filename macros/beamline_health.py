@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+
+"""Health check of all the motors behind the beamline controllers at once.
+
+Sends the health bulk command (ctrl.health) to every controller in the
+HealthControllers environment variable, all of them concurrently. Each
+controller reads the devices behind its motors concurrently too, one
+read_attributes per device. The results are then shown as one table,
+problems marked with a !:
+
+    Door> senv HealthControllers "['ivu_ctrl', 'piezo_ctrl', 'proxy_hfm', 'mirrorstrip_ctrl']"
+    Door> beamline_health
+
+A motor has a problem when its device is in none of the OK_STATES, its
+position has an ALARM or INVALID quality, its power is off, its
+interlock device is in a bad state, or it could not be read at all. A
+controller not answering within the HealthTimeout environment variable
+(seconds, default TIMEOUT) gives a "timed out" error row.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import json
+import time
+
+from sardana.macroserver.macro import Macro
+
+from ctrl.workers import WorkerPool, run_all
+
+POOL = WorkerPool(16, 'health')
+
+# above the time the controllers give their own devices (ctrl.health)
+TIMEOUT = 20.0
+
+OK_STATES = ('ON', 'MOVING', 'STANDBY', 'OPEN', 'CLOSE', 'RUNNING', 'EXTRACT', 'INSERT')
+BAD_QUALITIES = ('ATTR_ALARM', 'ATTR_INVALID')
+BAD_INTERLOCK = ('ALARM', 'FAULT', 'UNKNOWN', 'INIT')
+
+
+def rows(controller, answer):
+    """[(controller, motor, health)] of the reply of a controller, health
+    being {'error': message} for what could not be read."""
+    if 'error' in answer:
+        return [(controller, '', {'error': answer['error']})]
+    result = []
+    for axis, health in sorted(answer['results'].items(), key=lambda item: int(item[0])):
+        if 'motors' in health:
+            result += [(controller, name, motor) for name, motor in sorted(health['motors'].items())]
+        else:
+            result.append((controller, axis, health))
+    for axis, message in sorted(answer['errors'].items()):
+        result.append((controller, axis, {'error': message}))
+    return result
+
+
+def problems(health):
+    """What is wrong with a motor, [] if nothing."""
+    if 'error' in health:
+        return [health['error']]
+    found = []
+    if health.get('state') not in OK_STATES:
+        found.append("state %s" % health.get('state'))
+    if health.get('quality') in BAD_QUALITIES:
+        found.append("quality %s" % health['quality'])
+    if health.get('power') is False:
+        found.append("power off")
+    if health.get('interlock') is not None and health['interlock'] in BAD_INTERLOCK:
+        found.append("interlock %s" % health['interlock'])
+    elif health.get('interlock') is not None and health['interlock'].startswith('Exception'):
+        found.append("interlock unreadable")
+    return found
+
+
+def _format(value, width):
+    if value is None:
+        return '-'.rjust(width)
+    if isinstance(value, float):
+        return ('%.4f' % value).rjust(width)
+    return str(value).rjust(width)
+
+
+class beamline_health(Macro):
+    """State, status, position, power and interlock of every motor behind
+    the HealthControllers, read concurrently, as one table."""
+
+    param_def = []
+
+    def _send(self, pool, controller):
+        answer = pool.command_inout('SendToController', [controller, json.dumps({'cmd': 'health'})])
+        if not answer:
+            raise Exception("no health command")
+        return json.loads(answer)
+
+    def run(self):
+        try:
+            controllers = self.getEnv('HealthControllers')
+        except Exception:
+            raise Exception("set HealthControllers to the controllers to check")
+        try:
+            timeout = float(self.getEnv('HealthTimeout'))
+        except Exception:
+            timeout = TIMEOUT
+        pool = self.getPools()[0]
+        start = time.time()
+        tasks = run_all(POOL, [(name, lambda name=name: self._send(pool, name))
+                               for name in controllers], timeout)
+        elapsed = time.time() - start
+        table = []
+        for task in tasks:
+            if task.error is not None:
+                table.append((task.name, '', {'error': str(task.error)}))
+            else:
+                table += rows(task.name, task.result)
+
+        self.output("  %-20s %-14s %-28s %-8s %12s %-6s %-9s %s"
+                    % ('controller', 'motor', 'device', 'state', 'position', 'power',
+                       'interlock', 'status / problems'))
+        bad = 0
+        for controller, motor, health in table:
+            found = problems(health)
+            bad += bool(found)
+            status = (health.get('status') or '').strip().splitlines()
+            self.output("%s %-20s %-14s %-28s %-8s %s %-6s %-9s %s"
+                        % ('!' if found else ' ', controller, motor, health.get('device', ''),
+                           health.get('state') or '-', _format(health.get('position'), 12),
+                           _format(health.get('power'), 6).strip(),
+                           health.get('interlock') or '-',
+                           '; '.join(found) if found else (status[0] if status else '')))
+        self.output("%d motors, %d with problems, read in %.2f s" % (len(table), bad, elapsed))
+        return [[controller, str(motor), health] for controller, motor, health in table]
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+
+"""Dose series through the BCU attenuator with the least wheel travel.
+
+The requested transmissions are looked up at once in the spectrum of
+achievable transmissions at the current energy (ctrl.attenuator). Every
+one keeps, besides the closest achievable value, the other values within
+DoseSeriesTolerance (relative, default 0.02) as candidates; the points
+are then ordered, and a candidate chosen for each, so that the wheels
+travel the least over the series:
+
+    Door> dose_series_plan 100 50 10 5 1
+    Door> dose_series "ct 1" 100 50 10 5 1
+
+Up to MAX_EXACT points the order is optimal (a Held-Karp dynamic program
+over the points and their candidates); beyond it the points are ordered
+nearest first and the candidates chosen by dynamic programming along
+that order. The three wheels move together, so a step costs the travel
+of the wheel moving the most, plus a little of the total travel.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import numpy as np
+import PyTango
+
+from sardana.macroserver.macro import Macro, Type
+
+from ctrl.pseudomotor.TransmissionController import bcu_index, to_kev
+
+MAX_EXACT = 10
+MAX_CANDIDATES = 6
+TOLERANCE = 0.02
+WHEELS = ['bcu_att1', 'bcu_att2', 'bcu_att3']
+ENERGY_ATTR = 'b311a-o/opt/mono-ener/Position'
+
+INF = float('inf')
+
+
+def travel(a, b):
+    """The cost of moving the wheels from angles a to angles b (rows)."""
+    step = np.abs(np.asarray(b, dtype=float) - np.asarray(a, dtype=float))
+    return step.max(axis=-1) + 1e-3 * step.sum(axis=-1)
+
+
+def candidates(transmissions, values, tolerance=TOLERANCE, limit=MAX_CANDIDATES):
+    """[spectrum indices] of the candidates of each transmission [%], closest first.
+
+    values is the sorted spectrum; the closest achievable value is always
+    a candidate, the others within tolerance of the request too.
+    """
+    requested = np.asarray(transmissions, dtype=float)
+    right = np.clip(np.searchsorted(values, requested), 1, len(values) - 1)
+    left = right - 1
+    closest = np.where(requested - values[left] <= values[right] - requested, left, right)
+    low = np.searchsorted(values, requested * (1 - tolerance))
+    high = np.searchsorted(values, requested * (1 + tolerance), side='right')
+    result = []
+    for t, best, lo, hi in zip(requested, closest, low, high):
+        near = np.arange(lo, hi)
+        near = near[near != best]
+        near = near[np.argsort(np.abs(values[near] - t), kind='mergesort')][:limit - 1]
+        result.append([int(best)] + near.tolist())
+    return result
+
+
+def _exact_order(start_cost, cost, node_point, n_points):
+    """The node sequence visiting every point once with the least cost."""
+    n_nodes = len(node_point)
+    bits = 1 << node_point
+    full = (1 << n_points) - 1
+    total = np.full((full + 1, n_nodes), INF)
+    parent = np.full((full + 1, n_nodes), -1, dtype=int)
+    total[bits, np.arange(n_nodes)] = start_cost
+    for mask in range(1, full):
+        row = total[mask]
+        if not np.isfinite(row).any():
+            continue
+        step = row[:, None] + cost
+        best = step.argmin(axis=0)
+        value = step[best, np.arange(n_nodes)]
+        free = np.nonzero((bits & mask) == 0)[0]
+        masks = mask | bits[free]
+        better = value[free] < total[masks, free]
+        total[masks[better], free[better]] = value[free[better]]
+        parent[masks[better], free[better]] = best[free[better]]
+    node = int(total[full].argmin())
+    mask = full
+    sequence = []
+    while node >= 0:
+        sequence.append(node)
+        node, mask = int(parent[mask, node]), mask ^ bits[node]
+    return sequence[::-1]
+
+
+def _best_choice(start_cost, cost, groups):
+    """The node of each group (in order) with the least total cost."""
+    value = start_cost[groups[0]]
+    back = []
+    for previous, current in zip(groups, groups[1:]):
+        step = value[:, None] + cost[np.ix_(previous, current)]
+        back.append(step.argmin(axis=0))
+        value = step.min(axis=0)
+    choice = [int(value.argmin())]
+    for links in reversed(back):
+        choice.append(int(links[choice[-1]]))
+    choice.reverse()
+    return [group[i] for group, i in zip(groups, choice)]
+
+
+def _nearest_order(start_cost, cost, node_point, n_points):
+    """The points, nearest node first from the start."""
+    left = np.ones(len(node_point), dtype=bool)
+    order = []
+    step = start_cost
+    for _ in range(n_points):
+        node = int(np.where(left, step, INF).argmin())
+        order.append(int(node_point[node]))
+        left &= node_point != node_point[node]
+        step = cost[node]
+    return order
+
+
+def plan(transmissions, values, angles, start, tolerance=TOLERANCE, keep_order=False):
+    """The series with the least wheel travel from the start angles.
+
+    values and angles are the spectrum of the current energy. Returns
+    [(index of the request, requested, achievable, angles)] in move order
+    and the total travel cost.
+    """
+    if not len(transmissions):
+        return [], 0.0
+    groups = candidates(transmissions, values, tolerance)
+    node_point = np.concatenate([[p] * len(group) for p, group in enumerate(groups)]).astype(int)
+    node_index = np.concatenate(groups).astype(int)
+    node_angles = angles[node_index]
+    start_cost = travel(start, node_angles)
+    cost = travel(node_angles[:, None, :], node_angles[None, :, :])
+    n_points = len(groups)
+    offsets = np.cumsum([0] + [len(group) for group in groups])
+    nodes = [list(range(offsets[p], offsets[p + 1])) for p in range(n_points)]
+    if keep_order:
+        sequence = _best_choice(start_cost, cost, nodes)
+    elif n_points <= MAX_EXACT:
+        sequence = _exact_order(start_cost, cost, node_point, n_points)
+    else:
+        order = _nearest_order(start_cost, cost, node_point, n_points)
+        sequence = _best_choice(start_cost, cost, [nodes[p] for p in order])
+    total = start_cost[sequence[0]] + sum(cost[a, b] for a, b in zip(sequence, sequence[1:]))
+    series = [(int(node_point[node]), float(transmissions[node_point[node]]),
+               float(values[node_index[node]]), tuple(float(a) for a in node_angles[node]))
+              for node in sequence]
+    return series, float(total)
+
+
+class _DoseSeries(object):
+    """What dose_series and dose_series_plan share."""
+
+    def _env(self, name, default):
+        try:
+            return self.getEnv(name)
+        except Exception:
+            return default
+
+    def prepare(self, transmissions):
+        energy = to_kev(PyTango.AttributeProxy(ENERGY_ATTR).read().value)
+        values, angles = bcu_index.spectrum(energy)
+        self.wheels = self._env('DoseSeriesWheels', WHEELS)
+        start = [self.getMotor(name).getPosition() for name in self.wheels]
+        tolerance = float(self._env('DoseSeriesTolerance', TOLERANCE))
+        series, total = plan(transmissions, values, angles, start, tolerance)
+        given, given_total = plan(transmissions, values, angles, start, 0.0, keep_order=True)
+        self.output("Energy %.3f keV, wheel travel %.0f deg (given order, closest values: %.0f deg)"
+                    % (energy, total, given_total))
+        self.output("%5s %12s %12s %8s %8s %8s" % ('#', 'requested %', 'actual %',
+                                                   self.wheels[0], self.wheels[1],
+                                                   self.wheels[2]))
+        for index, requested, actual, point in series:
+            self.output("%5d %12.6g %12.6g %8.0f %8.0f %8.0f" % ((index, requested, actual) + point))
+        return series
+
+
+class dose_series_plan(Macro, _DoseSeries):
+    """Show the order and the wheel angles dose_series would use."""
+
+    param_def = [['transmissions', [['transmission', Type.Float, None, 'Transmission [%]']],
+                  None, 'Requested transmissions']]
+
+    def run(self, transmissions):
+        self.prepare(transmissions)
+
+
+class dose_series(Macro, _DoseSeries):
+    """Move the attenuator through the transmissions with the least wheel
+    travel and run point_macro (e.g. "ct 1") at every one."""
+
+    param_def = [['point_macro', Type.String, None, 'Macro to run at every point'],
+                 ['transmissions', [['transmission', Type.Float, None, 'Transmission [%]']],
+                  None, 'Requested transmissions']]
+
+    def run(self, point_macro, transmissions):
+        series = self.prepare(transmissions)
+        motion = self.getMotion(self.wheels)
+        for index, requested, actual, point in series:
+            self.checkPoint()
+            motion.move(list(point))
+            self.info("transmission %.6g %% (requested %.6g %%)" % (actual, requested))
+            self.execMacro(point_macro)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+
+"""Continuous energy scan moving the mono and the IVU gap together.
+
+A step scan of the beamline energy goes through BeamlineEnergy, Energy,
+IVUEnergy and MirrorStripChooser at every point and stops the motors
+there. energy_flyscan works out the whole bragg, x2per and gap
+trajectories at once with the models of Energy and IVUEnergy, with the
+properties of the EnergyController and IVUEnergyController controllers
+in the Pool (see ctrl.energymodel). It then
+moves the three physical motors through the points without stopping at
+them, in segments. Through a segment all three move at constant
+velocities, passing its first and its last point together. The segments
+are as long as the gap, moving linearly with bragg, stays within
+FlyScanGapTolerance [mm] of the gap the table gives at every point. A
+scan in one segment is one continuous move. Between segments the motors
+stop and go back for the run-up of the next one.
+
+Every segment move starts before its first point and ends after its last.
+The run-up lets each motor reach its velocity in its Acceleration time,
+and the motors stop in their Deceleration time after the last point.
+
+Meanwhile a ctrl.sampler Sampler of the macro reads the bragg position
+and the FlyScanChannels attributes (diodes, fluorescence counts) at
+FlyScanRate [Hz]. Only the samples taken while the motors pass the points
+of a segment at constant velocity are kept. The energy of every sample
+comes from the bragg read just before it. The samples are averaged per
+point, the points being the centres of the bins:
+
+    Door> senv FlyScanChannels "['b311a-o/dia/bpm-01/Intensity']"
+    Door> energy_flyscan 12600 12800 200 0.1
+
+The beamline energy first moves to the start the usual way, which sets
+the mirror strip; a scan cannot cross the strip change. The physical
+motors are FlyScanMotors (bragg, x2per, gap) and get back their
+velocities at the end.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import time
+
+import numpy as np
+import PyTango
+
+from sardana.macroserver.macro import Macro, Type
+
+from ctrl.energymodel import ENERGY_CTRL, IVU_CTRL, from_pool
+from ctrl.pseudomotor.BeamlineEnergy import strip_for_energy
+from ctrl.sampler import Sampler
+
+ENERGY_MOTOR = 'energy'
+MOTORS = ['mono_bragg', 'mono_x2per', 'ivu_gap']
+GAP_TOLERANCE = 0.005
+RATE = 100.0
+
+def trajectory(model, energies):
+    """(bragg [deg], x2per [mm], gap [mm]) arrays for energies [eV], as
+    Energy and IVUEnergy calculate them (model is a ctrl.energymodel
+    EnergyModel)."""
+    bragg, x2per = model.mono(energies)
+    return bragg, x2per, model.gap(energies)
+
+
+def segments(bragg, gap, tolerance=GAP_TOLERANCE):
+    """[(first, last)] point indices of the segments, the gap moving
+    linearly with bragg within tolerance [mm] of gap at every point."""
+    bounds = []
+    first = 0
+    n = len(bragg)
+    while first < n - 1:
+        last = first + 1
+        while last + 1 < n:
+            span = slice(first, last + 2)
+            # how far along bragg each point is, where the gap would then be
+            fraction = (bragg[span] - bragg[first]) / (bragg[last + 1] - bragg[first])
+            linear = gap[first] + fraction * (gap[last + 1] - gap[first])
+            if np.abs(linear - gap[span]).max() > tolerance:
+                break
+            last += 1
+        bounds.append((first, last))
+        first = last
+    return bounds
+
+
+def run_up(start, end, seconds, accelerations, decelerations):
+    """(velocities, before, after, lead) of motors moving from start to end
+    in seconds: the velocities, the positions to start from so that all
+    pass start at those velocities lead [s] after starting, and the
+    positions they stop at after end. accelerations and decelerations are
+    the times [s] the motors take to reach and leave their velocity."""
+    start = np.asarray(start, dtype=float)
+    end = np.asarray(end, dtype=float)
+    accelerations = np.asarray(accelerations, dtype=float)
+    velocities = np.abs(end - start) / seconds
+    direction = np.sign(end - start)
+    lead = accelerations.max()
+    # half the velocity on average while accelerating, then at full speed
+    before = start - direction * velocities * (lead - accelerations / 2)
+    after = end + direction * velocities * np.asarray(decelerations, dtype=float) / 2
+    return velocities, before, after, lead
+
+
+def within(times, windows):
+    """The mask of times inside one of windows [(start, end)]."""
+    times = np.asarray(times)
+    mask = np.zeros(len(times), dtype=bool)
+    for begin, end in windows:
+        mask |= (times >= begin) & (times <= end)
+    return mask
+
+
+def bin_samples(positions, energies, values):
+    """(count, mean) of values per point of positions, by the energy of
+    each sample; the bins reach halfway to the neighbouring points, the
+    bin of a single point takes every sample."""
+    positions = np.asarray(positions, dtype=float)
+    energies = np.asarray(energies, dtype=float)
+    order = np.argsort(positions)
+    edges = (positions[order][1:] + positions[order][:-1]) / 2
+    bins = order[np.searchsorted(edges, energies)]
+    if len(positions) > 1:
+        inside = np.abs(energies - positions[bins]) <= np.abs(np.diff(positions)).max() / 2
+    else:
+        inside = np.ones(len(energies), dtype=bool)
+    count = np.bincount(bins[inside], minlength=len(positions))
+    total = np.bincount(bins[inside], weights=np.asarray(values)[inside], minlength=len(positions))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return count, total / count
+
+
+def sample_energies(model, bragg_times, bragg_values, times):
+    """The energy at times, from the bragg read last before each."""
+    index = np.clip(np.searchsorted(bragg_times, times, side='right') - 1, 0, len(bragg_times) - 1)
+    return model.energy(bragg_values[index])
+
+
+class energy_flyscan(Macro):
+    """Continuous scan of the beamline energy, with the FlyScanChannels
+    attributes averaged around every point; integ_time is the time spent
+    per interval."""
+
+    param_def = [['start_pos', Type.Float, None, 'Start energy [eV]'],
+                 ['final_pos', Type.Float, None, 'Final energy [eV]'],
+                 ['nr_interv', Type.Integer, None, 'Number of intervals'],
+                 ['integ_time', Type.Float, None, 'Time per interval [s]']]
+
+    def _env(self, name, default):
+        try:
+            return self.getEnv(name)
+        except Exception:
+            return default
+
+    def set_velocities(self, motors, velocities):
+        for motor, velocity in zip(motors, velocities):
+            if velocity > 0:
+                motor.write_attribute('Velocity', velocity)
+
+    def run(self, start_pos, final_pos, nr_interv, integ_time):
+        if nr_interv < 1:
+            raise Exception("a flyscan needs at least one interval")
+        positions = np.linspace(start_pos, final_pos, nr_interv + 1)
+        if strip_for_energy(start_pos) != strip_for_energy(final_pos):
+            raise Exception("%s to %s eV changes the mirror strip, split the scan"
+                            % (start_pos, final_pos))
+        model = from_pool(lambda name: self.getObj(name, type_class=Type.Controller),
+                          self._env('EnergyController', ENERGY_CTRL),
+                          self._env('IVUEnergyController', IVU_CTRL))
+        if not model.covers(positions):
+            raise Exception("%s to %s eV is out of the gap table of the IVU"
+                            % (start_pos, final_pos))
+        bragg, x2per, gap = trajectory(model, positions)
+        bounds = segments(bragg, gap, float(self._env('FlyScanGapTolerance', GAP_TOLERANCE)))
+        channels = self._env('FlyScanChannels', [])
+        names = self._env('FlyScanMotors', MOTORS)
+        motors = [self.getMoveable(name) for name in names]
+        targets = np.column_stack((bragg, x2per, gap))
+
+        self.info("%d points in %d segments" % (len(positions), len(bounds)))
+        self.getMoveable(self._env('EnergyScanMotor', ENERGY_MOTOR)).move(start_pos)
+        motion = self.getMotion(names)
+
+        rate = float(self._env('FlyScanRate', RATE))
+        duration = nr_interv * integ_time
+        bragg_attr = names[0] + '/Position'
+        proxies = dict((name, PyTango.AttributeProxy(name)) for name in [bragg_attr] + channels)
+        velocities = [motor.read_attribute('Velocity').value for motor in motors]
+        accelerations = [motor.read_attribute('Acceleration').value for motor in motors]
+        decelerations = [motor.read_attribute('Deceleration').value for motor in motors]
+        # the time of the moves, the run-ups and the moves back between segments
+        overhead = len(bounds) * 2 * (max(accelerations) + max(decelerations) + 10)
+        readings = Sampler(rate, int(rate * (duration + overhead)) + 100, self)
+        # (start, end) of the times the motors pass the points of a segment
+        windows = []
+        start = time.time()
+        readings.start(proxies, duration + overhead + 3600)
+        try:
+            for first, last in bounds:
+                self.checkPoint()
+                seconds = (last - first) * integ_time
+                speeds, before, after, lead = run_up(targets[first], targets[last], seconds,
+                                                     accelerations, decelerations)
+                self.set_velocities(motors, velocities)
+                motion.move(list(before))
+                self.set_velocities(motors, speeds)
+                started = time.time()
+                motion.move(list(after))
+                windows.append((started + lead, started + lead + seconds))
+        finally:
+            readings.close()
+            self.set_velocities(motors, velocities)
+        elapsed = time.time() - start
+
+        bragg_times, bragg_values = readings.buffers[bragg_attr].samples()
+        kept = within(bragg_times, windows)
+        counts = bin_samples(positions, model.energy(bragg_values[kept]),
+                             bragg_values[kept])[0]
+        columns = []
+        for name in channels:
+            times, values = readings.buffers[name].samples()
+            kept = within(times, windows)
+            columns.append(bin_samples(positions,
+                                       sample_energies(model, bragg_times, bragg_values, times[kept]),
+                                       values[kept])[1])
+        self.output("%12s %8s %s" % ('energy eV', 'samples', ' '.join('%14s' % name.split('/')[-1]
+                                                                    for name in channels)))
+        for i, energy in enumerate(positions):
+            self.output("%12.2f %8d %s" % (energy, counts[i],
+                                           ' '.join('%14.6g' % column[i] for column in columns)))
+        self.info("%.1f s for %d points, %d bragg readings" % (elapsed, len(positions),
+                                                              len(bragg_values)))
+        return [positions.tolist()] + [column.tolist() for column in columns]
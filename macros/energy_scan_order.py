@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+
+"""Ordering of the energies of a multi-energy collection.
+
+Every energy is worked out with the kinematics of the controllers: the
+mono bragg angle of Energy, the IVU gap of IVUEnergy and the mirror strip
+of MirrorStripChooser. The points are then reordered for the fewest
+strip switches (five motor moves each), then the fewest changes of
+direction of the IVU gap, then the least gap travel:
+
+    Door> energy_scan_order 0 12658 12664 12700 7500
+    Door> energy_scan_order 1 12664 12658 12700 7500    # peak first, the rest free
+
+The first fixed energies keep their order at the start; the others are
+grouped by strip and each group is swept in one gap direction, which for
+a given start takes the fewest strip switches and gap reversals. The
+order is stored in the EnergyScanPoints environment variable. The
+properties of Energy and IVUEnergy are the ones of the EnergyController
+and IVUEnergyController controllers in the Pool (see ctrl.energymodel).
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import itertools
+
+from sardana.macroserver.macro import Macro, Type
+
+from ctrl.energymodel import ENERGY_CTRL, IVU_CTRL, from_pool
+from ctrl.pseudomotor.BeamlineEnergy import strip_for_energy
+
+ENERGY_MOTOR = 'energy'
+
+
+def predict(model, energies):
+    """[(energy, bragg, gap, strip)] for energies [eV] (model is a
+    ctrl.energymodel EnergyModel)."""
+    braggs = model.mono(energies)[0]
+    gaps = model.gap(energies)
+    return [(float(e), float(bragg), float(gap), strip_for_energy(e))
+            for e, bragg, gap in zip(energies, braggs, gaps)]
+
+
+def count_moves(points, start=None):
+    """(strip switches, gap reversals, gap travel [mm]) going through the
+    predicted points, from the start point if given."""
+    sequence = ([start] if start is not None else []) + list(points)
+    switches = sum(1 for a, b in zip(sequence, sequence[1:]) if a[3] != b[3])
+    reversals = 0
+    travel = 0.0
+    direction = 0
+    for a, b in zip(sequence, sequence[1:]):
+        step = b[2] - a[2]
+        travel += abs(step)
+        if step:
+            if direction and (step > 0) != (direction > 0):
+                reversals += 1
+            direction = step
+    return switches, reversals, travel
+
+
+def order_points(points, fixed=0, start=None):
+    """points (from predict()) in the order with the fewest strip switches,
+    then gap reversals, then gap travel; the first fixed stay first."""
+    head, rest = list(points[:fixed]), list(points[fixed:])
+    groups = {}
+    for point in rest:
+        groups.setdefault(point[3], []).append(point)
+    best = None
+    for strips in itertools.permutations(sorted(groups)):
+        for directions in itertools.product((False, True), repeat=len(strips)):
+            candidate = []
+            for strip, descending in zip(strips, directions):
+                candidate += sorted(groups[strip], key=lambda p: p[2], reverse=descending)
+            # with the fixed ones, whose last gap direction counts too
+            cost = count_moves(head + candidate, start)
+            if best is None or cost < best[0]:
+                best = (cost, candidate)
+    return head + (best[1] if best else [])
+
+
+class energy_scan_order(Macro):
+    """Order the energies of a collection for the fewest mirror strip
+    switches and IVU gap reversals; the first fixed keep their order."""
+
+    param_def = [['fixed', Type.Integer, None, 'Energies kept first, in the given order'],
+                 ['energies', [['energy', Type.Float, None, 'Energy [eV]']],
+                  None, 'Energies of the collection']]
+
+    def _env(self, name, default):
+        try:
+            return self.getEnv(name)
+        except Exception:
+            return default
+
+    def run(self, fixed, energies):
+        model = from_pool(lambda name: self.getObj(name, type_class=Type.Controller),
+                          self._env('EnergyController', ENERGY_CTRL),
+                          self._env('IVUEnergyController', IVU_CTRL))
+        points = predict(model, energies)
+        start = None
+        try:
+            current = self.getMoveable(self._env('EnergyScanMotor', ENERGY_MOTOR)).getPosition()
+            start = predict(model, [current])[0]
+        except Exception as e:
+            self.warning("current energy unknown, ordering from the first point: %s" % str(e))
+        ordered = order_points(points, fixed, start)
+        self.output("%12s %10s %10s %6s" % ('energy eV', 'bragg deg', 'gap mm', 'strip'))
+        for point in ordered:
+            self.output("%12.2f %10.4f %10.4f %6s" % point)
+        for name, sequence in (('given', points), ('ordered', ordered)):
+            self.output("%-8s %d strip switches, %d gap reversals, %.3f mm of gap travel"
+                        % ((name,) + count_moves(sequence, start)))
+        self.setEnv('EnergyScanPoints', [point[0] for point in ordered])
+        return [point[0] for point in ordered]
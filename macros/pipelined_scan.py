@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+
+"""Step scan of a pseudo motor computing the next point during the acquisition.
+
+A plain ascan of BeamlineEnergy or Transmission is serial: the Pool
+computes the physical positions of a point (attenuator search, strip
+choice, IVU interpolation) when the move is issued, then moves, then
+the point is acquired. pipelined_ascan asks the pseudo motor for the
+physical positions of point i+1 (its CalcAllPhysical command) in a
+worker thread while point i is acquiring. That checks the point before
+any motor moves, and the calculation leaves the controllers prepared
+(cached tables, energy hints) for the real move.
+
+The calculations keep no state, so the positions recorded for point i
+do not change; benchmarks/check_lookahead.py checks it on the energy
+chain. Only a calculation switching the mirror strip writes to the
+hardware (it powers the mirrors on), so for the PipelinedScanStripMotors
+(default ['energy']) the lookahead stops at a strip change: that point is
+calculated by its own move, as in a plain ascan.
+
+Physical motors listed in the PipelinedScanPrestart environment variable
+(e.g. ['ivu_energy']) are also started towards point i+1 during the
+acquisition of point i. Only list the ones whose motion does not disturb
+the measurement. The move to point i+1 waits for them and then finds
+them in place (inside their deadband).
+
+    Door> senv PipelinedScanPrestart "['ivu_energy']"
+    Door> pipelined_ascan energy 12600 12800 40 1
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import time
+
+from sardana.macroserver.macro import Macro, Hookable, Type
+from sardana.macroserver.scan import SScan
+
+from ctrl.pseudomotor.BeamlineEnergy import strip_for_energy
+from ctrl.workers import Task, WorkerPool
+
+POOL = WorkerPool(1, 'scan-lookahead')
+
+STRIP_MOTORS = ['energy']
+
+
+def calc_physicals(moveable, position):
+    """The physical positions of a pseudo motor at position, from the Pool."""
+    return list(moveable.command_inout('CalcAllPhysical', [position]))
+
+
+def physical_names(moveable):
+    return list(moveable.read_attribute('Elements').value)
+
+
+def strip_change(position, target):
+    """Whether the energy target is on the other mirror strip."""
+    return strip_for_energy(position) != strip_for_energy(target)
+
+
+def no_barrier(position, target):
+    return False
+
+
+class Pipeline(object):
+    """The lookahead of a scan over positions of a pseudo motor.
+
+    The scan sets point before moving to each position; during_acquisition()
+    and before_move() are its pre-acq and pre-move hooks. barrier(position,
+    target) tells the points not to calculate ahead from position.
+    """
+
+    def __init__(self, macro, moveable, positions, prestart=(), barrier=no_barrier):
+        self.macro = macro
+        self.moveable = moveable
+        self.positions = positions
+        self.barrier = barrier
+        self.prestart = []
+        self.point = 0
+        self.next = None
+        self.started = []
+        self.ready = 0
+        self.waited = 0.0
+        self.enabled = True
+        try:
+            # where the motor is: this calculation cannot switch the strip
+            calc_physicals(moveable, moveable.getPosition())
+            names = physical_names(moveable) if prestart else []
+        except Exception as e:
+            macro.warning("no lookahead for %s: %s" % (moveable, str(e)))
+            self.enabled = False
+            return
+        for name in prestart:
+            if name in names:
+                self.prestart.append((names.index(name), macro.getMoveable(name)))
+            else:
+                macro.warning("%s is not a physical motor of %s, not pre-started" % (name, moveable))
+
+    def compute(self, index):
+        physicals = calc_physicals(self.moveable, self.positions[index])
+        for role, moveable in self.prestart:
+            moveable.startMove(physicals[role])
+            self.started.append(moveable)
+        return physicals
+
+    def during_acquisition(self):
+        index = self.point + 1
+        if (self.enabled and index < len(self.positions) and
+                not self.barrier(self.positions[self.point], self.positions[index])):
+            self.next = POOL.submit(Task(index, lambda: self.compute(index)))
+
+    def before_move(self):
+        if self.next is None:
+            return
+        task, self.next = self.next, None
+        self.ready += task.ready()
+        start = time.time()
+        try:
+            # raises what calculating the point raised, before anything moves
+            task.get()
+        finally:
+            for moveable in self.started:
+                moveable.waitMove()
+            self.started = []
+            self.waited += time.time() - start
+
+    def report(self):
+        if not self.enabled or len(self.positions) < 2:
+            return
+        self.macro.info("lookahead ready before %d of %d moves, %.3f s waited for it"
+                        % (self.ready, len(self.positions) - 1, self.waited))
+
+
+class pipelined_ascan(Macro, Hookable):
+    """Absolute step scan of a pseudo motor that computes and checks each
+    point, and pre-starts the PipelinedScanPrestart motors towards it,
+    while the previous point is acquiring."""
+
+    hints = {'scan': 'pipelined_ascan',
+             'allowsHooks': ('pre-scan', 'pre-move', 'post-move', 'pre-acq',
+                             'post-acq', 'post-step', 'post-scan')}
+    env = ('ActiveMntGrp',)
+
+    param_def = [['motor', Type.Moveable, None, 'Pseudo motor to move'],
+                 ['start_pos', Type.Float, None, 'Scan start position'],
+                 ['final_pos', Type.Float, None, 'Scan final position'],
+                 ['nr_interv', Type.Integer, None, 'Number of scan intervals'],
+                 ['integ_time', Type.Float, None, 'Integration time']]
+
+    def prepare(self, motor, start_pos, final_pos, nr_interv, integ_time, **opts):
+        self.integ_time = integ_time
+        self.positions = [start_pos + i * (final_pos - start_pos) / float(nr_interv)
+                          for i in range(nr_interv + 1)]
+        try:
+            prestart = self.getEnv('PipelinedScanPrestart')
+        except Exception:
+            prestart = []
+        try:
+            strip_motors = self.getEnv('PipelinedScanStripMotors')
+        except Exception:
+            strip_motors = STRIP_MOTORS
+        barrier = strip_change if motor.getName() in strip_motors else no_barrier
+        self.pipeline = Pipeline(self, motor, self.positions, prestart, barrier)
+        env = opts.get('env', {})
+        self._gScan = SScan(self, self._generator, [motor], env)
+
+    def _generator(self):
+        step = {}
+        step['integ_time'] = self.integ_time
+        step['pre-move-hooks'] = self.getHooks('pre-move') + [self.pipeline.before_move]
+        step['post-move-hooks'] = self.getHooks('post-move')
+        step['pre-acq-hooks'] = self.getHooks('pre-acq') + [self.pipeline.during_acquisition]
+        step['post-acq-hooks'] = self.getHooks('post-acq') + self.getHooks('_NOHINTS_')
+        step['post-step-hooks'] = self.getHooks('post-step')
+        step['check_func'] = []
+        for point_id, position in enumerate(self.positions):
+            self.pipeline.point = point_id
+            step['positions'] = [position]
+            step['point_id'] = point_id
+            yield step
+
+    def run(self, *args):
+        for step in self._gScan.step_scan():
+            yield step
+        self.pipeline.report()
+
+    @property
+    def data(self):
+        return self._gScan.data
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+
+"""Save the positions of the beamline motors and restore them.
+
+snapshot_save writes the positions of the SnapshotMotors (physical and
+pseudo motors: mirrors, tables, slits, strip, attenuator, IVU, mono) to
+a small JSON file, reading them all concurrently:
+
+    Door> senv SnapshotMotors "['hfm_y', 'vfm_x1', 'vfm_x2', 'piezo_hfm_fpit', ...]"
+    Door> snapshot_save /data/staff/biomax/snapshots/before_shutdown.json
+    Door> snapshot_diff /data/staff/biomax/snapshots/before_shutdown.json
+    Door> snapshot_restore /data/staff/biomax/snapshots/before_shutdown.json
+
+snapshot_restore compares the file with the live positions. It skips
+the motors within their deadband: the Deadband attribute of the motor
+when it has one, else SnapshotDeadbands {name: deadband}, else DEADBAND.
+It also skips the pseudo motors whose physical motors are all in the
+file, which restore them. The rest move in stages, every stage one
+parallel move, each after the previous one: SnapshotStages lists the
+stages, e.g. the mirror strip motors before the piezos. Motors in no
+stage move with the first one, and a pseudo motor moves in a stage after
+its physical motors. snapshot_diff shows what snapshot_restore would do.
+"""
+
+__author__ = "MAX IV KITS SW Group"
+__email__ = "kitscontrols@maxiv.lu.se"
+
+import json
+import time
+
+from sardana.macroserver.macro import Macro, Type
+
+from ctrl.deadband import within_deadband
+from ctrl.workers import WorkerPool, run_all
+
+POOL = WorkerPool(16, 'snapshot')
+
+DEADBAND = 1e-4
+STAGES = [['hfm_y', 'vfm_x1', 'vfm_x2'], ['piezo_hfm_fpit', 'piezo_vfm_fpit']]
+
+
+def changes(saved, live, deadbands=None, default=DEADBAND):
+    """{name: (live, saved)} of the motors out of their deadband."""
+    deadbands = deadbands or {}
+    return dict((name, (live[name], position)) for name, position in saved.items()
+                if name in live and not within_deadband(position, live[name],
+                                                        deadbands.get(name, default)))
+
+
+def drop_pseudos(moves, physicals, saved):
+    """moves without the pseudo motors whose physicals ({pseudo: [names]})
+    are all saved: restoring those restores the pseudo motor."""
+    return dict((name, move) for name, move in moves.items()
+                if not (physicals.get(name) and all(p in saved for p in physicals[name])))
+
+
+def stages(names, order=STAGES, physicals=None):
+    """names split in stages following order; the unlisted go first, and a
+    pseudo motor (physicals {pseudo: [names]}) after its physical motors."""
+    listed = set(name for stage in order for name in stage)
+    result = [[name for name in sorted(names) if name not in listed]]
+    for i, stage in enumerate(order):
+        members = [name for name in stage if name in names]
+        if i == 0:
+            result[0] += members
+        elif members:
+            result.append(members)
+    result = [stage for stage in result if stage]
+    stage_of = dict((name, i) for i, stage in enumerate(result) for name in stage)
+    physicals = physicals or {}
+    moved = True
+    while moved:
+        moved = False
+        for name in stage_of:
+            after = [stage_of[p] + 1 for p in physicals.get(name, ()) if p in stage_of]
+            if after and max(after) > stage_of[name]:
+                stage_of[name] = max(after)
+                moved = True
+    ordered = [name for stage in result for name in stage]
+    result = [[name for name in ordered if stage_of[name] == i]
+              for i in range(max(stage_of.values()) + 1 if stage_of else 0)]
+    return [stage for stage in result if stage]
+
+
+class _Snapshot(object):
+    """What the snapshot macros share."""
+
+    def _env(self, name, default):
+        try:
+            return self.getEnv(name)
+        except Exception:
+            return default
+
+    def read_positions(self, names):
+        """{name: position} of names, read concurrently."""
+        tasks = run_all(POOL, [(name, lambda name=name: self.getMoveable(name).getPosition())
+                               for name in names])
+        for task in tasks:
+            if task.error is not None:
+                raise Exception("cannot read %s: %s" % (task.name, str(task.error)))
+        return dict((task.name, float(task.result)) for task in tasks)
+
+    def deadbands(self, names):
+        """{name: deadband} of names: the Deadband attribute of the motor,
+        else SnapshotDeadbands, else DEADBAND."""
+        configured = self._env('SnapshotDeadbands', {})
+
+        def deadband(name):
+            try:
+                value = float(self.getMoveable(name).read_attribute('Deadband').value)
+            except Exception:
+                value = 0.0
+            # 0 disables the deadband of the controllers
+            return value if value > 0 else float(configured.get(name, DEADBAND))
+        tasks = run_all(POOL, [(name, lambda name=name: deadband(name)) for name in names])
+        return dict((task.name, task.result) for task in tasks)
+
+    def physicals(self, names):
+        """{pseudo motor: [physical motors]} of names, [] for the motors."""
+        result = {}
+        for name in names:
+            try:
+                result[name] = list(self.getMoveable(name).read_attribute('Elements').value)
+            except Exception:
+                result[name] = []
+        return result
+
+    def plan(self, filename):
+        """The stages of {name: (live, saved)} restoring filename."""
+        with open(filename) as f:
+            saved = json.load(f)['positions']
+        live = self.read_positions(sorted(saved))
+        moves = changes(saved, live, self.deadbands(sorted(live)), DEADBAND)
+        physicals = self.physicals(sorted(moves))
+        moves = drop_pseudos(moves, physicals, saved)
+        plan = [dict((name, moves[name]) for name in stage)
+                for stage in stages(moves, self._env('SnapshotStages', STAGES), physicals)]
+        self.output("%d motors saved, %d to move in %d stages"
+                    % (len(saved), len(moves), len(plan)))
+        for i, stage in enumerate(plan):
+            for name in sorted(stage):
+                self.output("%3d %-24s %14.6g -> %14.6g" % ((i + 1, name) + stage[name]))
+        return plan
+
+
+class snapshot_save(Macro, _Snapshot):
+    """Save the positions of the SnapshotMotors to filename."""
+
+    param_def = [['filename', Type.String, None, 'File to write (JSON)']]
+
+    def run(self, filename):
+        names = self._env('SnapshotMotors', [])
+        if not names:
+            raise Exception("set SnapshotMotors to the motors to save")
+        positions = self.read_positions(names)
+        with open(filename, 'w') as f:
+            json.dump({'time': time.time(), 'positions': positions}, f,
+                      sort_keys=True, separators=(',', ':'))
+        self.output("%d positions saved to %s" % (len(positions), filename))
+
+
+class snapshot_diff(Macro, _Snapshot):
+    """Show the moves snapshot_restore would make, stage by stage."""
+
+    param_def = [['filename', Type.String, None, 'Snapshot file']]
+
+    def run(self, filename):
+        self.plan(filename)
+
+
+class snapshot_restore(Macro, _Snapshot):
+    """Move the motors out of their deadband back to the positions saved
+    in filename, in parallel stages."""
+
+    param_def = [['filename', Type.String, None, 'Snapshot file']]
+
+    def run(self, filename):
+        for i, stage in enumerate(self.plan(filename)):
+            self.checkPoint()
+            names = sorted(stage)
+            start = time.time()
+            self.getMotion(names).move([stage[name][1] for name in names])
+            self.info("stage %d: %d motors in %.1f s" % (i + 1, len(names), time.time() - start))
@@ -20,7 +20,7 @@ def main():
 
     url = "http://www.maxiv.lu.se"
 
-    packages = find_packages()
+    packages = find_packages(exclude=['benchmarks', 'benchmarks.*'])
 
     # Add your dependencies in the following line.
     